@@ -0,0 +1,420 @@
+"""Timing benchmarks for the computational hot paths of drafting and simulation
+
+Benchmarks run on synthetic leagues from make_synthetic_league(), so no NBA data files are needed. The suite times
+check_team_eligibility, HAgent.make_pick, PAgent.make_pick, full drafts, calculate_coefficients and 
+run_multiple_seasons at several league sizes, and records the peak memory of each. Results are saved as json, and
+compare_results() lines up two result files to show regressions
+
+report_estimate_accuracy() compares the analytic season estimates of season_estimates against simulations, on real
+seasons or synthetic leagues
+
+Run as a module from the repository root, e.g. 
+
+    python -m src.benchmarks --output benchmarks.json --baseline previous_benchmarks.json
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from src.helper_functions import combinatorial_calculation, calculate_majority_probability, calculate_coefficients, \
+            check_team_eligibility, check_signature_eligibility, clear_player_statistics_cache
+from src.simulation import DraftBoard, get_snake_order, run_draft, run_multiple_seasons
+from src.drafting_agents import HAgent, PAgent, SimpleAgent
+from src.score_cache import ScoreCache, get_score_matrix
+from src.season_estimates import estimate_multiple_seasons
+
+CATEGORIES = ['pts', 'trb', 'ast', 'stl', 'blk', 'fg3','tov', 'fg_pct','ft_pct']
+
+#league sizes to benchmark at: number of players in the player pool, weeks of data, and teams in the league
+SCALES = {'small' : {'n_players' : 200, 'n_weeks' : 10, 'n_teams' : 8}
+          ,'medium' : {'n_players' : 400, 'n_weeks' : 20, 'n_teams' : 12}
+          ,'large' : {'n_players' : 800, 'n_weeks' : 25, 'n_teams' : 16}}
+
+#position listings of synthetic players, roughly in proportion to real listings
+POSITION_LISTINGS = ['PG','SG','SF','PF','C','PG,SG','SG,SF','SF,PF','PF,C']
+
+def time_function(func
+                  , repeats = 5):
+    """Runs a function several times and returns the fastest wall-clock time in seconds"""
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def benchmark_majority_probability(n_candidates = (500, 5000)
+                                   , n_categories = 9
+                                   , repeats = 5
+                                   , seed = 0):
+    """Compares the recursive combinatorial_calculation against the dynamic-programming calculate_majority_probability
+
+    Args:
+        n_candidates: numbers of candidate players to time the calculations for
+        n_categories: number of categories per candidate
+        repeats: number of times to run each calculation. The fastest run is reported
+        seed: seed for the random win probabilities
+
+    Returns:
+        Dataframe with one row per candidate count, with timings in seconds, the speedup, and the maximum
+        absolute difference between the two methods' results
+    """
+    rng = np.random.default_rng(seed)
+    categories = ['cat_' + str(i) for i in range(n_categories)]
+    results = []
+
+    for n in n_candidates:
+        c = pd.DataFrame(rng.random((n, n_categories)), columns = categories)
+
+        recursive_res = combinatorial_calculation(c, 1 - c, categories)
+        closed_form_res = calculate_majority_probability(c.values)
+
+        recursive_time = time_function(lambda: combinatorial_calculation(c, 1 - c, categories), repeats)
+        closed_form_time = time_function(lambda: calculate_majority_probability(c.values), repeats)
+
+        results.append({'n_candidates' : n
+                        ,'recursive_seconds' : recursive_time
+                        ,'closed_form_seconds' : closed_form_time
+                        ,'speedup' : recursive_time/closed_form_time
+                        ,'max_abs_difference' : np.max(np.abs(recursive_res.values - closed_form_res))})
+
+    return pd.DataFrame(results).set_index('n_candidates')
+
+def measure_peak_memory(func):
+    """Runs a function once with tracemalloc and returns the peak memory allocated during the run, in bytes
+
+    This is kept separate from the timed runs, because tracing allocations slows code down
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def make_synthetic_league(n_players = 400
+                          , n_weeks = 20
+                          , seed = 0):
+    """Generates weekly box score totals and positions for a synthetic league
+
+    Each player gets a latent skill level, which scales the rates of their counting stats. Shooting stats are 
+    drawn as makes out of attempts, so percentages behave like real ones
+
+    Args:
+        n_players: number of players
+        n_weeks: number of weeks of data per player
+        seed: seed for the random numbers
+
+    Returns:
+        Tuple of (season_df, positions) in the format produced by setup()
+    """
+    rng = np.random.default_rng(seed)
+    players = ['Player ' + str(i) for i in range(n_players)]
+    index = pd.MultiIndex.from_product([players, range(1, n_weeks + 1)], names = ['player','week'])
+
+    skill = np.repeat(rng.gamma(2, 1, size = n_players), n_weeks)
+    fga = rng.poisson(skill * 15)
+    fg = rng.binomial(fga, 0.47)
+    fta = rng.poisson(skill * 5)
+    ft = rng.binomial(fta, 0.78)
+    fg3 = rng.binomial(fg, 0.3)
+
+    season_df = pd.DataFrame({'pts' : 2 * fg + fg3 + ft
+                              ,'trb' : rng.poisson(skill * 5)
+                              ,'ast' : rng.poisson(skill * 3)
+                              ,'stl' : rng.poisson(skill)
+                              ,'blk' : rng.poisson(skill * 0.7)
+                              ,'fg3' : fg3
+                              ,'tov' : rng.poisson(skill * 1.5)
+                              ,'fg' : fg
+                              ,'fga' : fga
+                              ,'ft' : ft
+                              ,'fta' : fta}
+                             , index = index)
+    positions = pd.Series(rng.choice(POSITION_LISTINGS, size = n_players), index = pd.Index(players, name = 'player')
+                          , name = 'pos')
+    return season_df, positions
+
+def time_picks(agents
+               , n_rounds = 13):
+    """Runs a snake draft, timing every make_pick() call
+
+    Returns:
+        Array of the seconds taken by each pick
+    """
+    draft_board = DraftBoard(pd.Index(agents[0].candidates))
+    timings = []
+    for j in get_snake_order(len(agents), n_rounds):
+        start = time.perf_counter()
+        chosen_player = agents[j].make_pick(draft_board)
+        timings.append(time.perf_counter() - start)
+        draft_board.take(draft_board.get_id(chosen_player), j)
+    return np.array(timings)
+
+def benchmark_eligibility(positions
+                          , n_teams = 1000
+                          , team_size = 13
+                          , repeats = 5
+                          , seed = 0):
+    """Times check_team_eligibility on random teams, with an empty memo to start each run
+
+    Returns:
+        Tuple of (fastest seconds per team, peak memory in bytes)
+    """
+    rng = np.random.default_rng(seed)
+    teams = [list(positions.iloc[rng.choice(len(positions), size = team_size, replace = False)]) 
+             for i in range(n_teams)]
+
+    def check_teams():
+        check_signature_eligibility.cache_clear()
+        for team in teams:
+            check_team_eligibility(team)
+
+    return time_function(check_teams, repeats)/n_teams, measure_peak_memory(check_teams)
+
+def benchmark_agent_picks(make_agent
+                          , n_teams
+                          , n_rounds = 13
+                          , repeats = 5):
+    """Times make_pick() over full drafts between agents of one type
+
+    Args:
+        make_agent: function returning a new agent. Each draft starts from fresh copies of one agent
+        n_teams: number of agents in each draft
+        n_rounds: number of rounds in each draft
+        repeats: number of drafts to run
+
+    Returns:
+        Tuple of (mean seconds per pick in the fastest draft, peak memory of a draft in bytes)
+    """
+    agent = make_agent()
+    mean_pick_time = min(time_picks([agent.fresh() for i in range(n_teams)], n_rounds).mean() for i in range(repeats))
+    return mean_pick_time, measure_peak_memory(lambda: time_picks([agent.fresh() for i in range(n_teams)], n_rounds))
+
+def run_benchmark_suite(scales = SCALES
+                        , n_seasons = 1000
+                        , repeats = 3
+                        , seed = 0
+                        , verbose = False):
+    """Runs every benchmark at every scale
+
+    Args:
+        scales: dictionary of scale name -> dictionary of n_players, n_weeks, and n_teams
+        n_seasons: number of seasons to simulate in the run_multiple_seasons benchmark
+        repeats: number of times to run each benchmark. The fastest run is reported
+        seed: seed for the synthetic leagues and the simulations
+        verbose: If True, print each result as it is measured
+
+    Returns:
+        Dataframe with one row per (benchmark, scale), with the fastest time in seconds, the peak memory in 
+        megabytes, and the parameters of the scale
+    """
+    results = []
+
+    def record(benchmark, scale, seconds, peak_memory):
+        results.append({'benchmark' : benchmark
+                        ,'scale' : scale
+                        ,'seconds' : seconds
+                        ,'peak_memory_mb' : peak_memory/2**20
+                        , **scales[scale]})
+        if verbose:
+            print(benchmark + ' (' + scale + '): ' + '{:.6f}'.format(seconds) + ' s, ' \
+                  + '{:.1f}'.format(peak_memory/2**20) + ' MB')
+
+    for scale, params in scales.items():
+        n_teams = params['n_teams']
+        season_df, positions = make_synthetic_league(params['n_players'], params['n_weeks'], seed)
+        all_players = pd.unique(season_df.index.get_level_values('player'))
+
+        record('check_team_eligibility', scale, *benchmark_eligibility(positions, seed = seed, repeats = repeats))
+
+        #each scale gets its own score cache, so score calculations are included in agent construction only
+        score_cache = ScoreCache()
+        make_h_agent = lambda: HAgent(season_df, positions, n_players = n_teams * 13, score_cache = score_cache)
+        make_p_agent = lambda: PAgent(positions, score_cache.get(season_df, 1, 1, n_teams * 13).get_filled_matrix()
+                                      , n_punts = 2)
+        record('HAgent.make_pick', scale, *benchmark_agent_picks(make_h_agent, n_teams, repeats = repeats))
+        record('PAgent.make_pick', scale, *benchmark_agent_picks(make_p_agent, n_teams, repeats = repeats))
+
+        h_agent = make_h_agent()
+        draft = lambda: run_draft([h_agent.fresh() for i in range(n_teams)], 13)
+        record('run_draft', scale, time_function(draft, repeats), measure_peak_memory(draft))
+
+        #per-player statistics are cached by season_df, so the cache is emptied to time the full calculation
+        def coefficients():
+            clear_player_statistics_cache(season_df)
+            calculate_coefficients(season_df, all_players)
+        record('calculate_coefficients', scale, time_function(coefficients, repeats), measure_peak_memory(coefficients))
+
+        teams = draft()
+        seasons = lambda: run_multiple_seasons(teams, season_df, CATEGORIES, n_seasons = n_seasons
+                                               , n_weeks = params['n_weeks'], seed = seed)
+        record('run_multiple_seasons', scale, time_function(seasons, repeats), measure_peak_memory(seasons))
+
+    return pd.DataFrame(results)
+
+def save_results(results
+                 , path):
+    """Writes benchmark results to a json file, with details of the environment they were measured in
+
+    Args:
+        results: dataframe from run_benchmark_suite()
+        path: file to write to
+    """
+    output = {'timestamp' : datetime.datetime.now().isoformat(timespec = 'seconds')
+              ,'environment' : {'python' : platform.python_version()
+                                ,'platform' : platform.platform()
+                                ,'numpy' : np.__version__
+                                ,'pandas' : pd.__version__}
+              ,'results' : results.to_dict(orient = 'records')}
+    with open(path, 'w') as f:
+        json.dump(output, f, indent = 2)
+
+def load_results(path):
+    """Reads benchmark results written by save_results() back into a dataframe"""
+    with open(path) as f:
+        return pd.DataFrame(json.load(f)['results'])
+
+def compare_results(baseline
+                    , current
+                    , threshold = 1.2):
+    """Lines up two sets of benchmark results to find regressions
+
+    Args:
+        baseline: dataframe of earlier results, e.g. from load_results()
+        current: dataframe of new results
+        threshold: ratio of current to baseline time above which a benchmark counts as a regression
+
+    Returns:
+        Dataframe indexed by (benchmark, scale), with times and memory from both runs, their ratios, and a 
+        regression flag
+    """
+    keys = ['benchmark','scale']
+    comparison = baseline.set_index(keys)[['seconds','peak_memory_mb']].join(current.set_index(keys)[['seconds'
+                                                                                                      ,'peak_memory_mb']]
+                                                                              , lsuffix = '_baseline'
+                                                                              , rsuffix = '_current'
+                                                                              , how = 'inner')
+    comparison['time_ratio'] = comparison['seconds_current']/comparison['seconds_baseline']
+    comparison['memory_ratio'] = comparison['peak_memory_mb_current']/comparison['peak_memory_mb_baseline']
+    comparison['regression'] = comparison['time_ratio'] > threshold
+    return comparison
+
+def report_estimate_accuracy(season_data
+                             , n_drafts = 3
+                             , n_seasons = 10000
+                             , n_weeks = 25
+                             , seed = 0
+                             , verbose = False):
+    """Compares analytic season estimates against simulations, for drafts between a mix of agents
+
+    Each draft seats HAgents and SimpleAgents ranking by Z-score or G-score at random, so that teams differ in
+    strength and build. Both formats are estimated and simulated for each draft
+
+    Args:
+        season_data: dictionary of season -> (season_df, positions), e.g. from setup(), or a StatCube
+        n_drafts: number of drafts per season
+        n_seasons: number of seasons to simulate for each draft
+        n_weeks: number of weeks per season
+        seed: seed for the seating of agents and the simulations
+        verbose: If True, print each result as it is measured
+
+    Returns:
+        Dataframe with one row per (season, draft, format), with the time taken by each method, the mean and maximum
+        absolute differences in winning fractions and category win rates, the largest standard error of the
+        simulated winning fractions, the rank correlation of the two sets of winning fractions, and whether both
+        methods favor the same team
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    seasons = season_data.seasons if hasattr(season_data, 'seasons') else list(season_data)
+    for season in seasons:
+        season_df, positions = season_data[season]
+        templates = [HAgent(season_df, positions, winner_take_all = True, season = season)
+                     , SimpleAgent(positions, get_score_matrix(season_df, alpha_weight = 1, beta_weight = 0
+                                                               , season = season))
+                     , SimpleAgent(positions, get_score_matrix(season_df, alpha_weight = 1, beta_weight = 1
+                                                               , season = season))]
+        for draft in range(n_drafts):
+            teams = run_draft([templates[i].fresh() for i in rng.integers(0, len(templates), size = 12)], 13)
+            for winner_take_all in (True, False):
+                start = time.perf_counter()
+                simulated, simulated_detail = run_multiple_seasons(teams, season_df, CATEGORIES
+                                                                   , n_seasons = n_seasons
+                                                                   , n_weeks = n_weeks
+                                                                   , winner_take_all = winner_take_all
+                                                                   , return_detailed_results = True
+                                                                   , seed = rng.integers(2**32))
+                simulation_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                estimated, estimated_detail = estimate_multiple_seasons(teams, season_df, CATEGORIES
+                                                                        , n_weeks = n_weeks
+                                                                        , winner_take_all = winner_take_all
+                                                                        , return_detailed_results = True)
+                estimate_time = time.perf_counter() - start
+
+                simulated = simulated.reindex(estimated.index).fillna(0)
+                errors = (simulated - estimated).abs()
+                results.append({'season' : season
+                                ,'draft' : draft
+                                ,'format' : 'winner_take_all' if winner_take_all else 'each_category'
+                                ,'simulation_seconds' : simulation_time
+                                ,'estimate_seconds' : estimate_time
+                                ,'speedup' : simulation_time/estimate_time
+                                ,'mean_abs_error' : errors.mean()
+                                ,'max_abs_error' : errors.max()
+                                ,'max_simulation_standard_error' : np.sqrt(simulated * (1 - simulated)/n_seasons).max()
+                                ,'rank_correlation' : simulated.corr(estimated, method = 'spearman')
+                                ,'same_favorite' : simulated.idxmax() == estimated.idxmax()
+                                ,'category_max_abs_error' : (simulated_detail - estimated_detail).abs().max().max()})
+                if verbose:
+                    print(results[-1])
+
+    return pd.DataFrame(results).set_index(['season','draft','format'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark drafting and simulation hot paths on synthetic leagues')
+    parser.add_argument('--output', help = 'json file to write results to')
+    parser.add_argument('--baseline', help = 'json file of earlier results to compare against')
+    parser.add_argument('--scales', nargs = '+', choices = list(SCALES), default = list(SCALES))
+    parser.add_argument('--seasons', type = int, default = 1000, help = 'seasons per simulation benchmark')
+    parser.add_argument('--repeats', type = int, default = 3)
+    parser.add_argument('--accuracy', action = 'store_true'
+                        , help = 'compare analytic season estimates against simulations instead of timing')
+    parser.add_argument('--accuracy-seasons', type = int, nargs = '+'
+                        , help = 'real seasons to compare on, loaded with setup(). Defaults to synthetic leagues')
+    parser.add_argument('--data-path', default = '../data/')
+    args = parser.parse_args()
+
+    if args.accuracy:
+        if args.accuracy_seasons:
+            from src.helper_functions import setup
+            season_data = {season : setup(season, args.data_path) for season in args.accuracy_seasons}
+        else:
+            season_data = {seed : make_synthetic_league(seed = seed) for seed in range(3)}
+        report = report_estimate_accuracy(season_data, n_seasons = args.seasons)
+        print(report.to_string())
+        print(report.groupby('format').mean().to_string())
+        if args.output:
+            report.reset_index().to_json(args.output, orient = 'records', indent = 2)
+        sys.exit(0)
+
+    print(benchmark_majority_probability().to_string())
+    results = run_benchmark_suite({scale : SCALES[scale] for scale in args.scales}
+                                  , n_seasons = args.seasons
+                                  , repeats = args.repeats
+                                  , verbose = True)
+    if args.output:
+        save_results(results, args.output)
+    if args.baseline:
+        comparison = compare_results(load_results(args.baseline), results)
+        print(comparison.to_string())
+        sys.exit(1 if comparison['regression'].any() else 0)
@@ -0,0 +1,446 @@
+"""Concurrent, resumable acquisition of box scores from the NBA stats API
+
+Requests go through a bounded pool of worker threads, with a shared rate limit and exponential backoff on errors.
+Every raw response is saved to an on-disk cache, addressed by a hash of the request, so an interrupted run can be
+resumed without fetching anything twice. Box scores are cached for good, while the list of a season's games expires,
+so that reruns during a season pick up the games played since. Box scores are appended to the season file as each
+game completes, and a game counts as done only once its rows are flushed, so a crash mid-write never leaves a
+partial game behind
+
+Games which still fail after every retry are reported rather than silently dropped. For offline testing,
+StubStatsServer replays canned responses, e.g. the contents of a response cache, on localhost
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import http.server
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+STATS_URL = 'https://stats.nba.com/stats/'
+
+#stats.nba.com rejects requests which do not look like they come from a browser
+DEFAULT_HEADERS = {'Host' : 'stats.nba.com'
+                   ,'User-Agent' : 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:72.0) Gecko/20100101 Firefox/72.0'
+                   ,'Accept' : 'application/json, text/plain, */*'
+                   ,'Accept-Language' : 'en-US,en;q=0.5'
+                   ,'Referer' : 'https://stats.nba.com/'
+                   ,'Connection' : 'keep-alive'}
+
+BOX_SCORE_PARAMETERS = {'StartPeriod' : 0
+                        ,'EndPeriod' : 10
+                        ,'StartRange' : 0
+                        ,'EndRange' : 28800
+                        ,'RangeType' : 0}
+
+#status codes worth retrying. Other errors, like a 404 for a game that does not exist, fail immediately
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+#seconds a cached list of a season's games stays valid. Games keep being added to the list during the season
+GAME_LIST_MAX_AGE = 3600
+
+class FetchError(Exception):
+    """Raised when a request still fails after all retries"""
+
+def get_request_key(endpoint
+                    , params):
+    """Hashes an endpoint and its parameters into a key, which is the same regardless of parameter order"""
+    request = json.dumps([endpoint, sorted((str(k), str(v)) for k, v in params.items())])
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+class ResponseCache():
+    """On-disk cache of raw responses, with one json file per request, addressed by get_request_key()
+
+    Files are written to a temporary name and then renamed, so a crash never leaves a partial entry
+    """
+
+    def __init__(self
+                 , cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def get_path(self
+                 , key):
+        return os.path.join(self.cache_dir, key[0:2], key + '.json')
+
+    def get(self
+            , endpoint
+            , params
+            , max_age = None):
+        """Returns the cached response for a request, or None if it has not been cached
+
+        Args:
+            endpoint: name of the endpoint
+            params: dictionary of query parameters
+            max_age: optional number of seconds after which a cached response is treated as missing
+        """
+        path = self.get_path(get_request_key(endpoint, params))
+        if not os.path.isfile(path):
+            return None
+        if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path) as f:
+            return json.load(f)['response']
+
+    def put(self
+            , endpoint
+            , params
+            , response):
+        """Saves a response, along with the request it answers"""
+        path = self.get_path(get_request_key(endpoint, params))
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        tmp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'endpoint' : endpoint
+                       ,'params' : {str(k) : str(v) for k, v in params.items()}
+                       ,'response' : response}, f)
+        os.replace(tmp_path, path)
+
+    def items(self):
+        """Yields (endpoint, params, response) for every cached request"""
+        for root, dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.json'):
+                    with open(os.path.join(root, file)) as f:
+                        entry = json.load(f)
+                    yield entry['endpoint'], entry['params'], entry['response']
+
+class RateLimiter():
+    """Spaces out calls from any number of threads to at most max_per_second"""
+
+    def __init__(self
+                 , max_per_second):
+        self.interval = 1/max_per_second if max_per_second else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+class StatsClient():
+    """Client for the stats API, with a response cache, a rate limit, and retries with exponential backoff"""
+
+    def __init__(self
+                 , cache_dir
+                 , base_url = STATS_URL
+                 , headers = DEFAULT_HEADERS
+                 , requests_per_second = 2
+                 , max_retries = 5
+                 , backoff_base = 2
+                 , backoff_max = 120
+                 , timeout = 30):
+        """Sets up the client
+
+        Args:
+            cache_dir: directory of the response cache
+            base_url: url that endpoint names are appended to
+            headers: http headers to send with each request
+            requests_per_second: maximum rate of requests across all threads. Cached responses do not count
+            max_retries: number of retries after the first attempt
+            backoff_base: seconds to wait before the first retry. The wait doubles with every retry, with jitter
+            backoff_max: longest wait between retries, in seconds
+            timeout: seconds to wait for each response
+        """
+        self.cache = ResponseCache(cache_dir)
+        self.base_url = base_url
+        self.headers = headers
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+    def get_backoff(self
+                    , attempt):
+        """Seconds to wait before a retry: exponential in the attempt number, with up to 50% jitter"""
+        return min(self.backoff_max, self.backoff_base * 2**attempt) * (1 + random.random()/2)
+
+    def get(self
+            , endpoint
+            , params
+            , max_age = None):
+        """Gets the json response for a request, from the cache if possible
+
+        Args:
+            endpoint: name of the endpoint, e.g. 'boxscoretraditionalv2'
+            params: dictionary of query parameters
+            max_age: optional number of seconds a cached response stays valid. By default cached responses never
+                     expire. If fetching a new response fails, an expired response is used instead
+
+        Returns:
+            Tuple of (response dictionary, True if it came from the cache)
+        """
+        response = self.cache.get(endpoint, params, max_age = max_age)
+        if response is not None:
+            return response, True
+
+        try:
+            response = self.fetch(endpoint, params)
+        except FetchError:
+            expired = self.cache.get(endpoint, params) if max_age is not None else None
+            if expired is None:
+                raise
+            return expired, True
+
+        self.cache.put(endpoint, params, response)
+        return response, False
+
+    def fetch(self
+              , endpoint
+              , params):
+        """Requests a response from the API, retrying with backoff. The response cache is not used
+
+        Returns:
+            Response dictionary
+
+        Raises:
+            FetchError if the request still fails after all retries
+        """
+        url = self.base_url + endpoint + '?' + urllib.parse.urlencode(params)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                request = urllib.request.Request(url, headers = self.headers)
+                with urllib.request.urlopen(request, timeout = self.timeout) as f:
+                    response = json.loads(f.read().decode('utf-8'))
+                break
+            except urllib.error.HTTPError as e:
+                if e.code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise FetchError(url + ' failed with status ' + str(e.code)) from e
+            except (urllib.error.URLError, TimeoutError, ConnectionError, ValueError) as e:
+                if attempt == self.max_retries:
+                    raise FetchError(url + ' failed after ' + str(attempt + 1) + ' attempts: ' + str(e)) from e
+            time.sleep(self.get_backoff(attempt))
+        return response
+
+def extract_game_data(res):
+    """Converts a result set of a stats API response to a dataframe"""
+    return pd.DataFrame(res['rowSet'], columns = res['headers'])
+
+def get_season_games(client
+                     , season
+                     , max_age = GAME_LIST_MAX_AGE):
+    """Lists the regular season games of a season
+
+    Args:
+        client: StatsClient
+        season: season string, e.g. '2022-23'
+        max_age: seconds a cached game list stays valid, after which it is fetched again
+
+    Returns:
+        List of (game id, game date) tuples
+    """
+    response, cached = client.get('leaguegamefinder', {'LeagueID' : '00'
+                                                       ,'PlayerOrTeam' : 'T'
+                                                       ,'Season' : season
+                                                       ,'SeasonType' : 'Regular Season'}
+                                 , max_age = max_age)
+    games = extract_game_data(response['resultSets'][0])
+    return list(games.groupby(['GAME_ID','GAME_DATE']).count().index)
+
+def get_box_score(client
+                  , game_id
+                  , date):
+    """Gets the player box scores of a game, with its date
+
+    Returns:
+        Tuple of (dataframe of player rows, True if the response came from the cache)
+    """
+    response, cached = client.get('boxscoretraditionalv2', dict(GameID = game_id, **BOX_SCORE_PARAMETERS))
+    box_score = extract_game_data(response['resultSets'][0])
+    box_score.loc[:, 'date'] = date
+    return box_score, cached
+
+def get_journal_path(output_path):
+    """Path of the file recording which games of a season file are complete"""
+    return output_path + '.done'
+
+def append_rows(path
+                , rows):
+    """Appends rows to a csv file in one write, writing a header only if the file is new
+
+    Columns follow the existing file. The rows are flushed to disk before returning
+
+    Returns:
+        Size of the file after the append, in bytes
+    """
+    if os.path.isfile(path) and os.path.getsize(path) > 0:
+        columns = pd.read_csv(path, nrows = 0).columns
+        text = rows.reindex(columns = columns).to_csv(header = False, index = False, lineterminator = '\n')
+    else:
+        text = rows.to_csv(index = False, lineterminator = '\n')
+    with open(path, 'ab') as f:
+        f.write(text.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+def record_complete_game(output_path
+                         , game_id
+                         , size):
+    """Records that a game's rows are fully written, and the size of the season file after them"""
+    with open(get_journal_path(output_path), 'a') as f:
+        f.write(str(int(game_id)) + ',' + str(size) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def load_complete_games(output_path):
+    """Reads which games of a season file are complete, and drops any incomplete game from the file
+
+    A game is recorded as complete only after its rows are flushed, so anything in the file past the end of the last
+    complete game was left by an interrupted run. The file is cut back to that point, and those games are fetched
+    again, from the response cache if they were cached. Season files without a record, e.g. from the notebook, are
+    taken as complete
+
+    Returns:
+        Set of integer game ids
+    """
+    journal_path = get_journal_path(output_path)
+    has_output = os.path.isfile(output_path) and os.path.getsize(output_path) > 0
+
+    if not os.path.isfile(journal_path):
+        if not has_output:
+            return set()
+        complete_ids = set(pd.read_csv(output_path, usecols = ['GAME_ID'])['GAME_ID'].astype(int))
+        size = os.path.getsize(output_path)
+        records = [(game_id, size) for game_id in sorted(complete_ids)]
+    else:
+        records = []
+        with open(journal_path) as f:
+            for line in f:
+                #a crash while recording a game can leave a partial last line
+                if not line.endswith('\n'):
+                    break
+                game_id, size = line.split(',')
+                records.append((int(game_id), int(size)))
+        complete_ids = set(game_id for game_id, size in records)
+        end = max((size for game_id, size in records), default = 0)
+        if os.path.isfile(output_path) and os.path.getsize(output_path) > end:
+            with open(output_path, 'r+b') as f:
+                f.truncate(end)
+
+    tmp_path = journal_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.writelines(str(game_id) + ',' + str(size) + '\n' for game_id, size in records)
+    os.replace(tmp_path, journal_path)
+    return complete_ids
+
+def fetch_season(client
+                 , season
+                 , output_path
+                 , max_workers = 4
+                 , verbose = False):
+    """Fetches every regular season box score of a season which is not yet in the output file
+
+    Box scores are fetched concurrently, and each completed game is appended to output_path right away and then
+    recorded as complete, so an interrupted run loses nothing. A rerun drops any partially written game from the
+    file, and fetches only the games which are not complete, from the response cache where possible
+
+    Args:
+        client: StatsClient
+        season: season string, e.g. '2022-23'
+        output_path: csv file to append box score rows to, e.g. '../data/stat_data/2022-23_complete.csv'
+        max_workers: number of concurrent requests
+        verbose: If True, print progress as games complete
+
+    Returns:
+        Dictionary with the number of games 'fetched' from the API, the number 'cached', and a list of
+        (game id, error) tuples for games that 'failed'
+    """
+    games = [(g, date) for g, date in get_season_games(client, season) if g[0:3] == '002'] #regular season
+
+    done_ids = load_complete_games(output_path)
+    missing_games = [(g, date) for g, date in games if int(g) not in done_ids]
+
+    summary = {'fetched' : 0, 'cached' : 0, 'failed' : []}
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = {executor.submit(get_box_score, client, g, date) : g for g, date in missing_games}
+        for future in as_completed(futures):
+            try:
+                box_score, cached = future.result()
+            except FetchError as e:
+                summary['failed'].append((futures[future], str(e)))
+                continue
+
+            #appends happen on this thread only, so rows from different games never interleave
+            record_complete_game(output_path, futures[future], append_rows(output_path, box_score))
+            summary['cached' if cached else 'fetched'] += 1
+            if verbose:
+                print(season + ': ' + str(summary['fetched'] + summary['cached']) + '/' + str(len(missing_games)))
+
+    return summary
+
+class StubStatsServer():
+    """Local http server which replays canned stats API responses, for testing acquisition offline
+
+    Responses are matched by endpoint and query parameters. A number of initial requests can be made to fail, to
+    exercise retries. Use as a context manager:
+
+        with StubStatsServer(ResponseCache('cache').items()) as server:
+            client = StatsClient('other_cache', base_url = server.url)
+    """
+
+    def __init__(self
+                 , responses
+                 , fail_first = 0
+                 , fail_status = 503):
+        """Args:
+            responses: iterable of (endpoint, params, response) tuples, e.g. ResponseCache.items()
+            fail_first: number of requests to answer with fail_status before replaying responses
+            fail_status: http status for the failed requests
+        """
+        self.responses = {get_request_key(endpoint, params) : response for endpoint, params, response in responses}
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+        stub = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                endpoint = parsed.path.rstrip('/').split('/')[-1]
+                params = dict(urllib.parse.parse_qsl(parsed.query))
+                with stub.lock:
+                    stub.request_count += 1
+                    fail = stub.request_count <= stub.fail_first
+                response = stub.responses.get(get_request_key(endpoint, params))
+
+                if fail or response is None:
+                    self.send_response(stub.fail_status if fail else 404)
+                    self.end_headers()
+                else:
+                    body = json.dumps(response).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/stats/'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+        return self
+
+    def __exit__(self
+                 , *args):
+        self.server.shutdown()
+        self.server.server_close()
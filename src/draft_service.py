@@ -0,0 +1,352 @@
+"""Long-lived draft assistant service, with a json api over http
+
+Season scores are loaded once, when the service starts, into template agents. Each live draft is a session holding
+its own DraftBoard and a fresh() copy of a template agent, which shares the template's model data, so creating a
+session and updating it are cheap. Clients report picks as they happen, one event at a time, and ask for ranked
+recommendations for their seat, with the category win probabilities behind each one
+
+The api, with json request and response bodies:
+
+    POST /sessions                          {"seat" : 0, "n_teams" : 12, "agent" : "h"} -> {"session" : id}
+    GET /sessions/<id>                      -> picks so far and the seat's roster
+    POST /sessions/<id>/picks               {"player" : name, "team" : 3, "recommend" : 10} -> pick number, and
+                                            recommendations if requested
+    POST /sessions/<id>/undo                -> the reverted pick
+    GET /sessions/<id>/recommendations?n=10 -> {"recommendations" : [...], "elapsed_ms" : ...}
+    DELETE /sessions/<id>
+
+Sessions are independent and have their own locks, so many drafts can be served concurrently. Run from the
+repository root with e.g. python -m src.draft_service --season 2023 --port 8000
+"""
+
+import time
+import uuid
+import json
+import argparse
+import threading
+import collections
+import urllib.parse
+import http.server
+import numpy as np
+
+from src.simulation import DraftBoard
+
+class SessionNotFound(KeyError):
+    """Raised for requests about a session that does not exist, or has been evicted"""
+
+class DraftSession():
+    """State of one live draft, from the perspective of one seat
+
+    Attributes:
+        agent: fresh copy of a template agent, which tracks the seat's picks
+        seat: team number the recommendations are for
+        n_teams: number of teams in the draft
+        draft_board: DraftBoard of the agent's candidates
+        lock: lock held while the session is read or updated
+        last_used: monotonic time of the last request, for evicting idle sessions
+    """
+    def __init__(self
+                 , agent
+                 , seat
+                 , n_teams):
+        if not 0 <= seat < n_teams:
+            raise ValueError('seat must be between 0 and n_teams - 1')
+        self.agent = agent.fresh()
+        self.seat = seat
+        self.n_teams = n_teams
+        self.draft_board = DraftBoard(self.agent.candidates)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def take(self
+             , player
+             , team):
+        """Records that a player was taken by a team
+
+        Returns:
+            Number of the pick, starting from 0
+
+        Raises:
+            ValueError if the player is unknown or already taken, or the team is not in the draft
+        """
+        if not 0 <= team < self.n_teams:
+            raise ValueError('team must be between 0 and n_teams - 1')
+        player_id = self.draft_board.get_ids([player])[0]
+        if player_id < 0:
+            raise ValueError(str(player) + ' is not a draftable player')
+
+        if team == self.seat and not self.agent.roster.can_add(self.agent.candidate_signatures[player_id]):
+            raise ValueError(str(player) + ' cannot be added to the team without making it ineligible')
+        self.draft_board.take(player_id, team)
+        if team == self.seat:
+            #the board is built from the agent's candidates, so board ids are candidate ids
+            self.agent.commit_pick(player_id)
+        return len(self.draft_board.pick_log) - 1
+
+    def undo(self):
+        """Reverts the most recent pick
+
+        Returns:
+            (player, team) tuple of the reverted pick
+        """
+        if len(self.draft_board.pick_log) == 0:
+            raise ValueError('There are no picks to undo')
+        player_id, team = self.draft_board.undo()
+        if team == self.seat:
+            #agents only move forward, so the seat's remaining picks are replayed onto a reset agent
+            self.agent.reset()
+            for seat_player_id, pick_team in self.draft_board.pick_log:
+                if pick_team == self.seat:
+                    self.agent.commit_pick(seat_player_id)
+        return self.draft_board.players[player_id], team
+
+    def recommend(self
+                  , n = 10):
+        """Ranks the available players the seat can add
+
+        Args:
+            n: number of players to return
+
+        Returns:
+            List of dictionaries with the player, their score for the agent, and, for agents with
+            get_win_probabilities() like HAgent, the probability of winning each category with them. Agents which
+            only have an order of preference, like SimpleAgent, rank players in that order, without scores
+        """
+        agent = self.agent
+        if hasattr(agent, 'round_means') and len(agent.players) >= len(agent.round_means):
+            return []
+
+        candidate_ids = np.flatnonzero(agent.get_available(self.draft_board)
+                                       & agent.roster.addable[agent.candidate_signatures])
+        win_probabilities = None
+        if hasattr(agent, 'get_win_probabilities'):
+            win_probabilities = agent.get_win_probabilities(agent.running_x_sum, candidate_ids)
+            scores = agent.get_adjusted_win_sums(win_probabilities)
+        elif hasattr(agent, 'get_candidate_scores'):
+            scores = agent.get_candidate_scores(candidate_ids)
+        else:
+            scores = None
+
+        #candidates are in the agent's order of preference, so ascending candidate ids rank players by that order
+        top = np.argsort(-scores, kind = 'stable')[0:n] if scores is not None else range(min(n, len(candidate_ids)))
+        recommendations = []
+        for i in top:
+            recommendation = {'player' : str(agent.candidates[candidate_ids[i]])}
+            if scores is not None:
+                recommendation['score'] = float(scores[i])
+            if win_probabilities is not None:
+                recommendation['win_probabilities'] = dict(zip(agent.score_matrix.categories
+                                                               , win_probabilities[i].tolist()))
+            recommendations.append(recommendation)
+        return recommendations
+
+    def get_state(self):
+        """Summarizes the session, with the picks so far and the seat's roster"""
+        return {'seat' : self.seat
+                ,'n_teams' : self.n_teams
+                ,'picks' : [{'player' : str(self.draft_board.players[player_id]), 'team' : team}
+                            for player_id, team in self.draft_board.pick_log]
+                ,'roster' : [str(player) for player in self.agent.players]}
+
+class DraftService():
+    """Holds template agents and live draft sessions
+
+    Attributes:
+        templates: dictionary of agent name -> template agent. Sessions get fresh() copies of these
+        sessions: ordered dictionary of session id -> DraftSession, from least to most recently used
+    """
+    def __init__(self
+                 , templates
+                 , max_sessions = 1000):
+        """Args:
+            templates: dictionary of agent name -> agent, e.g. {'h' : HAgent(season_df, positions)}. The first is
+                       the default
+            max_sessions: number of sessions to keep. When there are more, the least recently used is evicted
+        """
+        for name, template in templates.items():
+            if getattr(template, 'order', None) is None:
+                raise ValueError('Agent ' + str(name) + ' has no players to pick from')
+        self.templates = templates
+        self.default_template = next(iter(templates))
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def create_session(self
+                       , seat
+                       , n_teams = 12
+                       , agent = None):
+        """Starts a session for a new draft
+
+        Returns:
+            Session id string
+        """
+        agent = self.default_template if agent is None else agent
+        if agent not in self.templates:
+            raise ValueError('Unknown agent ' + str(agent) + '. Options are ' + ', '.join(self.templates))
+        session = DraftSession(self.templates[agent], seat, n_teams)
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last = False)
+        return session_id
+
+    def get_session(self
+                    , session_id):
+        """Looks up a session, marking it as recently used"""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                raise SessionNotFound(session_id)
+            self.sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def delete_session(self
+                       , session_id):
+        with self.lock:
+            if self.sessions.pop(session_id, None) is None:
+                raise SessionNotFound(session_id)
+
+    def handle(self
+               , method
+               , path
+               , query
+               , body):
+        """Routes an api request
+
+        Args:
+            method: http method, e.g. 'GET'
+            path: list of path segments, e.g. ['sessions', id, 'picks']
+            query: dictionary of query parameters
+            body: dictionary from the json request body
+
+        Returns:
+            Tuple of (http status, response dictionary)
+        """
+        if path == ['sessions'] and method == 'POST':
+            session_id = self.create_session(int(body.get('seat', 0)), int(body.get('n_teams', 12)), body.get('agent'))
+            return 201, {'session' : session_id}
+        if len(path) < 2 or path[0] != 'sessions':
+            return 404, {'error' : 'Unknown path'}
+
+        if len(path) == 2 and method == 'DELETE':
+            self.delete_session(path[1])
+            return 200, {}
+
+        session = self.get_session(path[1])
+        action = path[2] if len(path) > 2 else None
+        start = time.perf_counter()
+        with session.lock:
+            if action is None and method == 'GET':
+                response = session.get_state()
+            elif action == 'picks' and method == 'POST':
+                response = {'pick' : session.take(body['player'], int(body['team']))}
+                if body.get('recommend'):
+                    response['recommendations'] = session.recommend(int(body['recommend']))
+            elif action == 'undo' and method == 'POST':
+                player, team = session.undo()
+                response = {'player' : str(player), 'team' : team}
+            elif action == 'recommendations' and method == 'GET':
+                response = {'recommendations' : session.recommend(int(query.get('n', 10)))}
+            else:
+                return 404, {'error' : 'Unknown path'}
+        response['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        return 200, response
+
+class DraftServer():
+    """Http server for a DraftService, handling each request on its own thread
+
+    Use as a context manager to serve in the background, e.g. for testing against localhost:
+
+        with DraftServer(service) as server:
+            requests go to server.url + 'sessions'
+
+    or call serve_forever() to run in the foreground
+    """
+    def __init__(self
+                 , service
+                 , host = '127.0.0.1'
+                 , port = 0):
+        """Args:
+            service: DraftService to serve
+            host: address to listen on
+            port: port to listen on. 0 picks a free port
+        """
+        self.service = service
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            #keep-alive connections save a handshake per request
+            protocol_version = 'HTTP/1.1'
+
+            def respond(self, method):
+                parsed = urllib.parse.urlparse(self.path)
+                path = [segment for segment in parsed.path.split('/') if segment]
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    body = json.loads(self.rfile.read(length)) if length > 0 else {}
+                    status, response = service.handle(method, path, query, body)
+                except SessionNotFound as e:
+                    status, response = 404, {'error' : 'Unknown session ' + str(e.args[0])}
+                except (ValueError, KeyError, TypeError) as e:
+                    status, response = 400, {'error' : str(e)}
+                except Exception as e:
+                    #the client still gets a response, and the server keeps serving other requests
+                    status, response = 500, {'error' : 'Internal error: ' + repr(e)}
+
+                payload = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_POST(self):
+                self.respond('POST')
+
+            def do_DELETE(self):
+                self.respond('DELETE')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://' + host + ':' + str(self.server.server_address[1]) + '/'
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def __enter__(self):
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+        return self
+
+    def __exit__(self
+                 , *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == '__main__':
+    from src.helper_functions import setup
+    from src.drafting_agents import HAgent
+
+    parser = argparse.ArgumentParser(description = 'Serve draft recommendations over http')
+    parser.add_argument('--season', type = int, default = 2023)
+    parser.add_argument('--data-path', default = '../data/')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    args = parser.parse_args()
+
+    season_df, positions = setup(args.season, args.data_path)
+    service = DraftService({'h' : HAgent(season_df, positions, season = args.season)
+                            ,'h_winner_take_all' : HAgent(season_df, positions, winner_take_all = True
+                                                          , season = args.season)})
+    server = DraftServer(service, args.host, args.port)
+    print('Serving draft recommendations at ' + server.url)
+    server.serve_forever()
@@ -4,27 +4,156 @@ Drafting agents choose players during drafts, according to pre-set algorithms
 
 import pandas as pd
 import numpy as np
+import time
+import itertools
+import copy
 from scipy import special
-from src.simulation import run_draft
+from src.simulation import run_draft, get_snake_order
 from sklearn.preprocessing import StandardScaler
 from scipy.stats import norm
 
-from src.helper_functions import check_team_eligibility, combinatorial_calculation, calculate_coefficients, calculate_scores_from_coefficients
+from src.helper_functions import RosterState, UTILITY_SIGNATURE, get_eligibility_signatures, calculate_majority_probability, \
+            punt_categories
+from src.score_cache import ScoreMatrix, get_score_matrix
+from src.instrumentation import count
+
+#agents built separately get different tokens. Copies of an agent keep its token, which marks them as sharing model data
+MODEL_TOKENS = itertools.count()
+
+def get_best_eligible(scores
+                      , eligible):
+    """Finds the highest scoring eligible candidate along the last axis
+
+    Candidates with exactly equal scores are resolved in favor of the first one, so that picks made one at a time and
+    picks made in batches agree
+
+    Args:
+        scores: array of candidate scores, with candidates along the last axis
+        eligible: boolean array of the same shape, True for candidates which can be picked
+
+    Returns:
+        Array of candidate positions, with the shape of scores without the last axis
+    """
+    order = np.argsort(-scores, axis = -1, kind = 'stable')
+    first_eligible = np.argmax(np.take_along_axis(eligible, order, axis = -1), axis = -1)
+    return np.take_along_axis(order, np.expand_dims(first_eligible, -1), axis = -1)[..., 0]
 
 class SimpleAgent():
     """Abstract implementation of a simple agent, which picks players according to an internal order
 
     Cannot be used as an actual agent, because it has no order to pick from 
 
+    An agent's attributes are split into model data, like scores and positions, which is never modified after the 
+    agent is built, and draft state, which is listed in draft_state_attributes. fresh() and copies of an agent share 
+    the model data and only get their own draft state
+
     Attributes:
         players: A list of players already chosen by this agent
         positions: Eligible positions of each possible player. Agents need this info to make sure they draft eligible teams
+        signatures: Series of player -> eligibility signature, derived from positions
+        roster: RosterState tracking which eligibility signatures can still be added to the team
+        candidate_signatures: array of eligibility signatures for the agent's candidates
+        score_matrix: shared ScoreMatrix the agent's order or scores come from, if any
     """
     def __init__(self, positions, order = None):
-        self.players = []
+        """Args:
+            positions: Series of player -> eligible positions
+            order: Series of players in order of draft preference, or a ScoreMatrix to order players by total score
+        """
         self.positions = positions
-        self.order = order
+        self.score_matrix = order if isinstance(order, ScoreMatrix) else None
+        self._order = None if isinstance(order, ScoreMatrix) else order
+        self.signatures = get_eligibility_signatures(positions)
+        if order is not None:
+            self.candidate_signatures = get_eligibility_signatures(positions, self.order.index).values
+        self.board_players = None
+        self.model_token = next(MODEL_TOKENS)
+        SimpleAgent.reset_draft_state(self)
+
+    #attributes which change during a draft. Everything else is model data
+    draft_state_attributes = ('players', 'roster')
+
+    def reset_draft_state(self):
+        """Clears the picks tracked by the agent, so that it can be used in a new draft"""
+        self.players = []
+        self.roster = RosterState()
+
+    def reset(self):
+        """Clears the agent's draft state in place
+
+        Returns:
+            The agent
+        """
+        self.reset_draft_state()
+        return self
+
+    def fresh(self):
+        """Creates an agent with new, empty draft state which shares this agent's model data without copying it
+
+        Returns:
+            New agent of the same class
+        """
+        agent = copy.copy(self)
+        agent.reset_draft_state()
+        return agent
+
+    def __deepcopy__(self
+                     , memo):
+        """Copies the draft state, and shares the model data like fresh() does"""
+        agent = copy.copy(self)
+        #registered first, so that references back to this agent from its draft state point to the copy
+        memo[id(self)] = agent
+        for name in self.draft_state_attributes:
+            setattr(agent, name, copy.deepcopy(getattr(self, name), memo))
+        return agent
+
+    @property
+    def order(self):
+        """Series of players in order of draft preference. Orders from a ScoreMatrix are shared, not copied"""
+        return self.score_matrix.get_order() if self.score_matrix is not None else self._order
+
+    @property
+    def candidates(self):
+        """Index of all players the agent might pick"""
+        return self.order.index
+
+    @property
+    def batch_key(self):
+        """Agents with equal batch keys can have their picks made together by make_batch_picks()"""
+        return (type(self), self.model_token, len(self.players))
+
+    def get_board_ids(self
+                      , draft_board):
+        """Maps the agent's candidates to ids on a draft board. The mapping is only recalculated for new boards"""
+        if self.board_players is not draft_board.players:
+            self.board_ids = draft_board.get_ids(self.candidates)
+            self.board_players = draft_board.players
+        return self.board_ids
+
+    def get_available(self
+                      , draft_board):
+        """Returns a boolean array of which of the agent's candidates are still available on a draft board"""
+        board_ids = self.get_board_ids(draft_board)
+        return (board_ids >= 0) & draft_board.available[board_ids]
     
+    def add_player(self
+                   , player
+                   , signature):
+        """Commits a pick, updating the roster state in place"""
+        self.roster.add(signature)
+        self.players = self.players + [player]
+
+    def commit_pick(self
+                    , candidate_id):
+        """Commits the pick of one of the agent's candidates, by row number
+
+        Returns:
+            String indicating chosen player
+        """
+        player = self.candidates[candidate_id]
+        self.add_player(player, self.candidate_signatures[candidate_id])
+        return player
+
     def pick_from_order(self
                         , available_players):
         """Picks players from an ordered Series of available players, with a check for eligibility
@@ -36,33 +165,97 @@ class SimpleAgent():
             String indicating chosen player. Also internally adds player to self.players list
 
         """
-        #every team of less than 5 players is automatically eligible
-        if len(self.players) < 5:
-            player = available_players.index[0]
-            self.players = self.players + [player]
-            return player
-        else:
-            for player in available_players.index:
-                theoretical_team = self.players + [player]
-                if check_team_eligibility(list(self.positions.loc[theoretical_team])):
-                    self.players = theoretical_team
-                    return player
+        signatures = self.signatures.reindex(available_players.index).fillna(UTILITY_SIGNATURE).astype(int).values
+        return self.pick_first_eligible(available_players.index, signatures)
+
+    def pick_first_eligible(self
+                            , candidates
+                            , signatures
+                            , available = None):
+        """Picks the first candidate which can be added to the team, in one vectorized step
+
+        Args:
+            candidates: Index of players in order of draft preference
+            signatures: array of the candidates' eligibility signatures
+            available: optional boolean array of which candidates have not been picked yet
+
+        Returns:
+            String indicating chosen player. Also internally adds player to self.players list
+        """
+        eligible = self.roster.addable[signatures]
+        count('eligibility_checks', len(signatures))
+        if available is not None:
+            eligible = eligible & available
+        if not eligible.any():
+            raise ValueError('No available players!')
+
+        choice = np.argmax(eligible)
+        player = candidates[choice]
+        self.add_player(player, signatures[choice])
+        return player
+
+    def pick_best_scored(self
+                         , draft_board):
+        """Picks the available, eligible candidate with the highest score from get_candidate_scores()
+
+        Args:
+            draft_board: DraftBoard recording which players have been taken
 
+        Returns:
+            String indicating chosen player
+        """
+        candidate_ids = np.flatnonzero(self.get_available(draft_board))
+        scores = self.get_candidate_scores(candidate_ids)
+
+        eligible = self.roster.addable[self.candidate_signatures[candidate_ids]]
+        count('eligibility_checks', len(candidate_ids))
+        if not eligible.any():
+            raise ValueError('No available players!')
+
+        return self.commit_pick(candidate_ids[get_best_eligible(scores, eligible)])
+
+    @classmethod
+    def make_batch_picks(cls
+                         , agents
+                         , draft_boards):
+        """Makes one pick for each of several agents with the same batch key, each in its own draft
+
+        The agents' states are stacked into arrays so that all candidates in all drafts are scored with one 
+        vectorized call to get_batch_scores(). Each agent takes its best available and eligible candidate, with
+        ties resolved like make_pick() does
+
+        Args:
+            agents: list of agents of this class, which share the same model data
+            draft_boards: list of DraftBoards with the same players, one per agent
+
+        Returns:
+            list of strings indicating chosen players
+        """
+        lead_agent = agents[0]
+        board_ids = lead_agent.get_board_ids(draft_boards[0])
+        available = np.stack([draft_board.available for draft_board in draft_boards])[:, board_ids] & (board_ids >= 0)
+        addable = np.stack([agent.roster.addable for agent in agents])
+        eligible = available & addable[:, lead_agent.candidate_signatures]
+        count('eligibility_checks', eligible.size)
+        if not eligible.any(axis = 1).all():
             raise ValueError('No available players!')
 
-    def make_pick(self, player_assignments):
+        scores = cls.get_batch_scores(agents)
+        choices = get_best_eligible(scores, eligible)
+        return [agent.commit_pick(choice) for agent, choice in zip(agents, choices)]
+
+    def make_pick(self, draft_board):
         """Filters for available players and picks from internal order
 
         Args:
-            player_assignments: dict of format
-                   player : team that picked them
+            draft_board: DraftBoard recording which players have been taken
 
         Returns:
             String indicating chosen player
         """        
         #note that in the abstract class, no order is defined
-        available_players = self.order[~self.order.index.isin(player_assignments.keys())]
-        player = self.pick_from_order(available_players)
+        available = self.get_available(draft_board)
+        player = self.pick_first_eligible(self.order.index, self.candidate_signatures, available)
         return player
     
 class HAgent(SimpleAgent):
@@ -73,6 +266,8 @@ class HAgent(SimpleAgent):
                  , n_players = 12*13 
                  , n_punts = 0
                  , winner_take_all = False
+                 , season = None
+                 , score_cache = None
 
 ):
         """Calculates the rank order based on D-score
@@ -85,6 +280,9 @@ class HAgent(SimpleAgent):
             n_players: number of players to use for second-phase standardization
             winner_take_all: Boolean of whether to optimize for the winner-take-all format
                              If False, optimizes for total categories
+            season: optional label of the season, e.g. 2023. Agents for the same season share X-scores through the 
+                    score cache even if they are given different season_df objects
+            score_cache: optional ScoreCache to get X-scores from. Defaults to the shared cache
         Returns:
             None
 
@@ -93,152 +291,479 @@ class HAgent(SimpleAgent):
         
         self.winner_take_all = winner_take_all
         self.n_punts = n_punts
-        
-        all_players = pd.unique(season_df.index.get_level_values('player'))
-        
-        mean_of_means_1, var_of_means_1, mean_of_vars_1 = calculate_coefficients(season_df, all_players)
-    
-        first_order_scores = calculate_scores_from_coefficients(season_df
-                                                       ,mean_of_means_1
-                                                       ,var_of_means_1
-                                                       ,mean_of_vars_1
-                                                       ,alpha_weight = 1
-                                                       ,beta_weight = 0)
 
-        first_order_score_totals = first_order_scores.sum(axis = 1).sort_values(ascending = False)
+        #X-scores come from the two-stage pipeline with alpha = 0 and beta = 1, sorted by first-order score
+        self.score_matrix = get_score_matrix(season_df
+                                             , alpha_weight = 0
+                                             , beta_weight = 1
+                                             , n_players = n_players
+                                             , season = season
+                                             , cache = score_cache)
+        x_scores = self.x_scores
+        self.score_table = x_scores.groupby([np.floor(x/12) for x in range(len(x_scores))]).agg(['mean','var'])
+        self.candidate_signatures = get_eligibility_signatures(positions, x_scores.index).values
+
+        #per-round tables. For round r, other teams are expected to have the average players of rounds 0 through r,
+        #and variance comes from all of the other team's picks plus the rest of this team's picks
+        score_means = self.score_table.loc[:, (x_scores.columns, 'mean')].values
+        score_vars = self.score_table.loc[:, (x_scores.columns, 'var')].values
+        other_team_variance = np.nansum(score_vars[0:13], axis = 0)
+        self.round_means = np.array([np.nansum(score_means[0:(r + 1)], axis = 0) for r in range(len(score_means))])
+        self.round_sds = np.array([np.sqrt(26 + other_team_variance + np.nansum(score_vars[(r + 1):13], axis = 0))
+                                      for r in range(len(score_vars))])
+
+        for model_array in (self.candidate_signatures, self.round_means, self.round_sds):
+            model_array.setflags(write = False)
+        self.reset_draft_state()
+
+    @property
+    def x_scores(self):
+        """Dataframe of X-scores, backed by the shared score matrix"""
+        return self.score_matrix.to_frame(columns = ['pts','trb','ast','stl','blk','fg3','tov','ftp','fgp'])
+
+    @property
+    def x_score_array(self):
+        """Read-only array of X-scores, which picks are calculated from without pandas"""
+        return self.score_matrix.values
+
+    @property
+    def x_score_sum_array(self):
+        """Read-only array of X-scores with missing values as 0, for running totals"""
+        return self.score_matrix.get_filled_matrix().values
+
+    @property
+    def candidates(self):
+        """Index of all players the agent might pick"""
+        return self.score_matrix.players
+
+    draft_state_attributes = SimpleAgent.draft_state_attributes + ('running_x_sum',)
+
+    def reset_draft_state(self):
+        """Clears the picks tracked by the agent, so that it can be used in a new draft"""
+        super(HAgent, self).reset_draft_state()
+        self.running_x_sum = np.zeros(self.x_score_array.shape[1])
+
+    def get_win_probabilities(self
+                              , running_x_sums
+                              , candidate_ids = None):
+        """Calculates category winning probabilities for candidate players, after punting
 
-        representative_player_set = first_order_score_totals.index[0:n_players]
-        mean_of_means_2, var_of_means_2, mean_of_vars_2 = calculate_coefficients(season_df, representative_player_set)
+        Args:
+            running_x_sums: array of the x-score totals of the players already picked. Can be stacked along 
+                            leading axes, to calculate probabilities for several teams at once
+            candidate_ids: optional array of row numbers of x_scores for the candidates. Defaults to all players
 
-        x_scores = calculate_scores_from_coefficients(season_df
-                                                       ,mean_of_means_2
-                                                       ,var_of_means_2
-                                                       ,mean_of_vars_2
-                                                       ,alpha_weight = 0
-                                                       ,beta_weight = 1)
+        Returns:
+            Array of winning probabilities, with one entry per team, candidate and category
+        """
+        round_n = len(self.players)
+        candidate_x_scores = self.x_score_array if candidate_ids is None else self.x_score_array[candidate_ids]
+        diff_means = np.expand_dims(running_x_sums, -2) - self.round_means[round_n]
 
-        x_scores.columns = ['pts','trb','ast','stl','blk','fg3','tov','ftp','fgp']
+        win_probabilities = special.ndtr((diff_means + candidate_x_scores)/self.round_sds[round_n])
+        return punt_categories(win_probabilities, self.n_punts)
+
+    def get_adjusted_win_sums(self
+                              , win_probabilities):
+        """Combines category winning probabilities into one score per candidate, based on the format"""
+        if self.winner_take_all:
+            n_categories = win_probabilities.shape[-1]
+            return calculate_majority_probability(win_probabilities.reshape(-1, n_categories)) \
+                                                .reshape(win_probabilities.shape[:-1])
+        else:
+            return win_probabilities.sum(axis = -1)
+
+    def get_candidate_scores(self
+                             , candidate_ids):
+        """Scores candidates by the probability of winning based on the format"""
+        return self.get_adjusted_win_sums(self.get_win_probabilities(self.running_x_sum, candidate_ids))
+
+    @classmethod
+    def get_batch_scores(cls
+                         , agents):
+        """Scores all candidates for several agents sharing the same model data. Returns one row per agent"""
+        running_x_sums = np.stack([agent.running_x_sum for agent in agents])
+        return agents[0].get_adjusted_win_sums(agents[0].get_win_probabilities(running_x_sums))
+
+    def commit_pick(self
+                    , candidate_id):
+        """Commits the pick of one of the agent's candidates, by row number
+
+        Returns:
+            String indicating chosen player
+        """
+        self.running_x_sum = self.running_x_sum + self.x_score_sum_array[candidate_id]
+        return super(HAgent, self).commit_pick(candidate_id)
 
-        x_scores = x_scores.loc[first_order_score_totals.sort_values(ascending = False).index]
-        
-        self.x_scores = x_scores
-        self.score_table = x_scores.groupby([np.floor(x/12) for x in range(len(x_scores))]).agg(['mean','var'])
-        
-        
-           
     def make_pick(self
-                  , player_assignments):
+                  , draft_board):
         
         """Picks a player based on the D-score algorithm
 
         Args:
-            player_assignments: dict of format
-                   player : team that picked them
+            draft_board: DraftBoard recording which players have been taken
                    
         Returns:
             String indicating chosen player
         """
-        round_n = len(self.players) 
+        return self.pick_best_scored(draft_board)
+    
+class PAgent(SimpleAgent):
+    """Agent which takes a simple grid of scores and punts
 
-        current_score_table = self.score_table[0:round_n].sum()
+    Attributes:
+        players: A list of players already chosen by this agent
+        positions: Eligible positions of each possible player. Agents need this info to make sure they draft eligible teams
+        scores: dataframe with column for category and row for player
+        running_score_sum: array of the category score totals of the players already picked
+    """
+    def __init__(self, positions, scores, n_punts =0):
+        """Args:
+            positions: Series of player -> eligible positions
+            scores: dataframe of scores, or a shared ScoreMatrix, e.g. from get_score_matrix().get_filled_matrix()
+            n_punts: number of categories to punt
+        """
+        super(PAgent, self).__init__(positions)
+        self.score_matrix = scores if isinstance(scores, ScoreMatrix) else ScoreMatrix(None, scores)
+        self.n_punts = n_punts
+        self.candidate_signatures = get_eligibility_signatures(positions, self.score_matrix.players).values
+        
+        self.reset_draft_state()
 
-        x_self_sum = self.x_scores.loc[self.players].sum(axis = 0)
+    draft_state_attributes = SimpleAgent.draft_state_attributes + ('running_score_sum',)
 
-        diff_means =  x_self_sum - current_score_table.loc[(self.x_scores.columns,'mean')].droplevel(1)
-        
-        other_team_variance = self.score_table.loc[0:12,(self.x_scores.columns,'var')].sum().droplevel(1)
-        rest_of_team_variance = self.score_table.loc[(round_n + 1):12,(self.x_scores.columns,'var')].sum().droplevel(1)
+    def reset_draft_state(self):
+        """Clears the picks tracked by the agent, so that it can be used in a new draft"""
+        super(PAgent, self).reset_draft_state()
+        self.running_score_sum = np.zeros(len(self.score_matrix.categories))
 
-        diff_var = 26 + other_team_variance + rest_of_team_variance
+    @property
+    def scores(self):
+        """Dataframe of scores, backed by the score matrix"""
+        return self.score_matrix.to_frame()
 
-        x_scores_available = self.x_scores[~self.x_scores.index.isin(player_assignments.keys())]
+    @property
+    def score_array(self):
+        """Read-only array of scores, which picks are calculated from without pandas"""
+        return self.score_matrix.values
 
-        win_probabilities = pd.DataFrame(norm.cdf(diff_means + x_scores_available, scale = np.sqrt(diff_var))
-                                         ,index = x_scores_available.index)
-        
-        win_probabilities.columns = self.x_scores.columns
+    @property
+    def candidates(self):
+        """Index of all players the agent might pick"""
+        return self.score_matrix.players
 
-        #punt_rewards = - win_probabilities + np.array((self.v_scores * (12 - round_n))).reshape(1,9)
-        #punt_rewards.loc[:,'no_punt'] = 0
-        #optimal_punt_reward = punt_rewards.max(axis = 1)
-      
-        #punt
-        win_probabilities = win_probabilities.where(win_probabilities.rank(axis=1, method='min', ascending=True) > self.n_punts, 0)
+    def get_punted_sums(self
+                        , running_score_sums
+                        , candidate_ids = None):
+        """Totals the category scores teams would have with each candidate, after punting their weakest categories
 
+        Args:
+            running_score_sums: array of the score totals of the players already picked. Can be stacked along 
+                                leading axes, to calculate totals for several teams at once
+            candidate_ids: optional array of row numbers of scores for the candidates. Defaults to all players
 
-        if self.winner_take_all:
-            adjusted_win_sums = combinatorial_calculation(win_probabilities
-                                                          , 1 - win_probabilities
-                                                          , categories = win_probabilities.columns
-                             )
-        else:
-            adjusted_win_sums = win_probabilities.sum(axis = 1) #+ optimal_punt_reward
-        
-        players_sorted = adjusted_win_sums.sort_values(ascending = False)
-        player = self.pick_from_order(players_sorted)
-        return player
-    
-class PAgent():
-    """Agent which takes a simple grid of scores and punts
+        Returns:
+            Array of total scores, with one entry per team and candidate
+        """
+        candidate_scores = self.score_array if candidate_ids is None else self.score_array[candidate_ids]
+        theoretical_scores = candidate_scores + np.expand_dims(running_score_sums, -2)
+        return punt_categories(theoretical_scores, self.n_punts).sum(axis = -1)
+
+    def get_candidate_scores(self
+                             , candidate_ids):
+        """Scores candidates by the punted score total of the team with them"""
+        return self.get_punted_sums(self.running_score_sum, candidate_ids)
+
+    @classmethod
+    def get_batch_scores(cls
+                         , agents):
+        """Scores all candidates for several agents sharing the same model data. Returns one row per agent"""
+        running_score_sums = np.stack([agent.running_score_sum for agent in agents])
+        return agents[0].get_punted_sums(running_score_sums)
+
+    def commit_pick(self
+                    , candidate_id):
+        """Commits the pick of one of the agent's candidates, by row number
 
-    Cannot be used as an actual agent, because it has no order to pick from 
+        Returns:
+            String indicating chosen player
+        """
+        self.running_score_sum = self.running_score_sum + self.score_array[candidate_id]
+        return super(PAgent, self).commit_pick(candidate_id)
+
+    def make_pick(self, draft_board):
+        """Filters for available players and picks based on the punted score total
+
+        Args:
+            draft_board: DraftBoard recording which players have been taken
+
+        Returns:
+            String indicating chosen player
+        """        
+        return self.pick_best_scored(draft_board)
+
+#fraction of a SearchAgent's time budget kept back from rollouts, for choosing and committing the pick
+ROLLOUT_DEADLINE_MARGIN = 0.05
+
+class SearchAgent(HAgent):
+    """Agent which looks ahead at future picks with Monte Carlo rollouts, within a time budget per pick
+
+    The best candidates by HAgent score are each evaluated by rollouts of the draft. A rollout takes the candidate,
+    lets the other teams pick with a cheap surrogate model until the agent has made `depth` more picks of its own
+    greedily by HAgent score, and values the resulting team by its HAgent win probability. Surrogate opponents pick
+    uniformly from the best few available players in a G-score order, which stands in for the variety of real 
+    drafters. Rollouts are applied to the real draft board and undone in O(1) time per pick, and team values are 
+    memoized, since many rollouts end in the same team. The candidate with the best mean value is picked 
+
+    Rollouts are spread over the candidates until the time budget is used up. A rollout is only started if the
+    longest one so far would finish in time, and a rollout still running at the deadline is abandoned, so picks keep
+    to the budget. If not every candidate gets a rollout, the agent falls back on HAgent's choice
+
+    The agent infers its seat from the draft board at its first pick, so it has to be used in snake drafts with 
+    n_teams teams, like run_draft() runs
 
     Attributes:
-        players: A list of players already chosen by this agent
-        positions: Eligible positions of each possible player. Agents need this info to make sure they draft eligible teams
-        scores: dataframe with column for category and row for player
+        surrogate_order: Series of players in the order surrogate opponents prefer them
+        seat: team number of the agent in the current draft
+        team_values: memo of team values in the current draft, keyed by the number of players picked before the 
+                     pick being searched and the hypothetical players added to them
     """
-    def __init__(self, positions, scores, n_punts =0):
-        self.players = []
-        self.positions = positions
-        self.scores = scores
-        self.n_punts = n_punts
-        
-        self.running_score_sum = pd.Series([0] * len(scores.columns), index = scores.columns)
-    
-    def pick_from_order(self
-                        , available_players):
-        """Picks players from an ordered Series of available players, with a check for eligibility
+    def __init__(self
+                 , season_df
+                 , positions
+                 , n_players = 12*13
+                 , n_punts = 0
+                 , winner_take_all = False
+                 , season = None
+                 , score_cache = None
+                 , n_teams = 12
+                 , n_rounds = 13
+                 , n_candidates = 5
+                 , depth = 1
+                 , opponent_window = 3
+                 , n_lookahead_candidates = 20
+                 , time_budget = 0.25
+                 , max_rollouts = 200
+                 , seed = None):
+        """Sets up the agent
 
         Args:
-            available_players: Series of players in order of draft preference
+            season_df, positions, n_players, n_punts, winner_take_all, season, score_cache: as for HAgent
+            n_teams: number of teams in the draft
+            n_rounds: number of rounds in the draft
+            n_candidates: number of the best candidates by HAgent score to search between
+            depth: number of the agent's own future picks to simulate in each rollout
+            opponent_window: surrogate opponents pick uniformly from this many of the best available players
+            n_lookahead_candidates: number of available players, in first-order score order, that the agent's own
+                                    simulated picks are chosen between
+            time_budget: seconds to spend on rollouts per pick
+            max_rollouts: most rollouts per pick, to stop early when more would not change the choice
+            seed: seed for the random choices of surrogate opponents
+        """
+        #set first, because HAgent's constructor resets the draft state, which seeds the agent's random generator
+        self.seed = seed
+        super(SearchAgent, self).__init__(season_df
+                                          , positions
+                                          , n_players = n_players
+                                          , n_punts = n_punts
+                                          , winner_take_all = winner_take_all
+                                          , season = season
+                                          , score_cache = score_cache)
+        self.surrogate_order = get_score_matrix(season_df
+                                                , alpha_weight = 1
+                                                , beta_weight = 1
+                                                , n_players = n_players
+                                                , season = season
+                                                , cache = score_cache).get_order()
+        self.n_teams = n_teams
+        self.n_rounds = n_rounds
+        self.snake_order = np.array(get_snake_order(n_teams, n_rounds))
+        self.n_candidates = n_candidates
+        self.depth = depth
+        self.opponent_window = opponent_window
+        self.n_lookahead_candidates = n_lookahead_candidates
+        self.time_budget = time_budget
+        self.max_rollouts = max_rollouts
+        self.surrogate_board_players = None
+
+    draft_state_attributes = HAgent.draft_state_attributes + ('seat', 'team_values', 'rng')
+
+    def reset_draft_state(self):
+        """Clears the picks tracked by the agent, so that it can be used in a new draft"""
+        super(SearchAgent, self).reset_draft_state()
+        self.seat = None
+        self.team_values = {}
+        self.rng = np.random.default_rng(self.seed)
+
+    @property
+    def batch_key(self):
+        """Search agents are never batched, so that run_drafts() calls make_pick() for each of them"""
+        return ('single', id(self))
+
+    def get_surrogate_ids(self
+                          , draft_board):
+        """Maps the surrogate order to ids on a draft board. The mapping is only recalculated for new boards"""
+        if self.surrogate_board_players is not draft_board.players:
+            surrogate_ids = draft_board.get_ids(self.surrogate_order.index)
+            self.surrogate_ids = surrogate_ids[surrogate_ids >= 0]
+            self.surrogate_board_players = draft_board.players
+        return self.surrogate_ids
+
+    def get_team_value(self
+                       , hypothetical_ids
+                       , x_sum):
+        """Values a team by its HAgent win probability, with memoization
+
+        Args:
+            hypothetical_ids: candidate ids of the players added to the agent's real picks in a rollout
+            x_sum: X-score totals of the team
 
         Returns:
-            String indicating chosen player. Also internally adds player to self.players list
+            Probability of winning based on the format, as HAgent would score the team's last pick
+        """
+        key = (len(self.players), tuple(sorted(hypothetical_ids)))
+        if key not in self.team_values:
+            round_n = min(len(self.players) + len(hypothetical_ids), len(self.round_means)) - 1
+            win_probabilities = special.ndtr((x_sum - self.round_means[round_n])/self.round_sds[round_n])
+            self.team_values[key] = float(self.get_adjusted_win_sums(punt_categories(win_probabilities[None, :]
+                                                                                      , self.n_punts))[0])
+        return self.team_values[key]
+
+    def pick_greedily(self
+                      , draft_board
+                      , roster
+                      , x_sum
+                      , n_picked):
+        """Chooses a simulated pick for the agent, by HAgent score among the top available players
 
+        Returns:
+            Candidate id of the pick, or None if no player can be added
         """
-        #every team of less than 5 players is automatically eligible
-        if len(self.players) < 5:
-            player = available_players.index[0]
-            self.players = self.players + [player]
-            return player
-        else:
-            for player in available_players.index:
-                theoretical_team = self.players + [player]
-                if check_team_eligibility(list(self.positions.loc[theoretical_team])):
-                    self.players = theoretical_team
-                    return player
+        board_ids = self.get_board_ids(draft_board)
+        candidate_ids = np.flatnonzero((board_ids >= 0) & draft_board.available[board_ids]
+                                       & roster.addable[self.candidate_signatures])[0:self.n_lookahead_candidates]
+        if len(candidate_ids) == 0:
+            return None
+        round_n = min(n_picked, len(self.round_means) - 1)
+        win_probabilities = special.ndtr((x_sum - self.round_means[round_n] + self.x_score_array[candidate_ids])
+                                         /self.round_sds[round_n])
+        scores = self.get_adjusted_win_sums(punt_categories(win_probabilities, self.n_punts))
+        return candidate_ids[np.argmax(scores)]
+
+    def run_rollout(self
+                    , draft_board
+                    , candidate_id
+                    , pick_number
+                    , deadline = None):
+        """Simulates the draft after the agent takes a candidate, then undoes every simulated pick
+
+        Simulated picks are undone even if the rollout fails, so the draft board is always left as it was
 
-            raise ValueError('No available players!')
+        Args:
+            draft_board: DraftBoard of the real draft, which simulated picks are applied to
+            candidate_id: candidate id of the pick to evaluate
+            pick_number: number of the pick being searched
+            deadline: optional time.perf_counter() value. The rollout is abandoned if it would not finish by then
 
-    def make_pick(self, player_assignments):
-        """Filters for available players and picks from internal order
+        Returns:
+            Value of the agent's team at the end of the rollout, or None if it was abandoned
+        """
+        board_ids = self.get_board_ids(draft_board)
+        surrogate_ids = self.get_surrogate_ids(draft_board)
+        n_taken = 0
+
+        try:
+            draft_board.take(board_ids[candidate_id], self.seat)
+            n_taken += 1
+            hypothetical_ids = [candidate_id]
+            roster = self.roster.copy()
+            roster.add(self.candidate_signatures[candidate_id])
+            x_sum = self.running_x_sum + self.x_score_sum_array[candidate_id]
+
+            #the rollout is abandoned unless a simulated pick as slow as the slowest so far would finish in time
+            own_picks_left = self.depth
+            longest_step = 0
+            last_step = time.perf_counter()
+            for team in self.snake_order[(pick_number + 1):]:
+                if deadline is not None:
+                    now = time.perf_counter()
+                    longest_step = max(longest_step, now - last_step)
+                    last_step = now
+                    if now + longest_step > deadline:
+                        return None
+                if team == self.seat:
+                    if own_picks_left == 0:
+                        break
+                    own_pick = self.pick_greedily(draft_board, roster, x_sum
+                                                  , len(self.players) + len(hypothetical_ids))
+                    if own_pick is None:
+                        break
+                    draft_board.take(board_ids[own_pick], self.seat)
+                    n_taken += 1
+                    hypothetical_ids.append(own_pick)
+                    roster.add(self.candidate_signatures[own_pick])
+                    x_sum = x_sum + self.x_score_sum_array[own_pick]
+                    own_picks_left -= 1
+                else:
+                    options = surrogate_ids[draft_board.available[surrogate_ids]][0:self.opponent_window]
+                    if len(options) == 0:
+                        break
+                    draft_board.take(options[self.rng.integers(len(options))], team)
+                    n_taken += 1
+
+            return self.get_team_value(hypothetical_ids, x_sum)
+        finally:
+            for i in range(n_taken):
+                draft_board.undo()
 
-        Args:
-            player_assignments: dict of format
-                   player : team that picked them
+    def make_pick(self
+                  , draft_board):
+        """Picks the candidate with the best mean rollout value, within the time budget
 
+        Args:
+            draft_board: DraftBoard recording which players have been taken
+                   
         Returns:
             String indicating chosen player
-        """        
-        #note that in the abstract class, no order is defined
-        available_players = self.scores[~self.scores.index.isin(player_assignments.keys())]
-        theoretical_scores = available_players + self.running_score_sum
-        
-        punted_scores = theoretical_scores.where(theoretical_scores.rank(axis=1, method='min', ascending=True) > self.n_punts, 0)
-        punted_sums = punted_scores.sum(axis = 1).sort_values(ascending = False)
-            
-        player = self.pick_from_order(punted_sums)
-        self.running_score_sum = self.running_score_sum + available_players.loc[player]
-        return player
-    
+        """
+        #rollouts stop early enough to leave time for choosing and committing the pick
+        deadline = time.perf_counter() + self.time_budget * (1 - ROLLOUT_DEADLINE_MARGIN)
+        pick_number = len(draft_board.pick_log)
+        if self.seat is None:
+            self.seat = int(self.snake_order[pick_number])
+
+        candidate_ids = np.flatnonzero(self.get_available(draft_board))
+        candidate_ids = candidate_ids[self.roster.addable[self.candidate_signatures[candidate_ids]]]
+        count('eligibility_checks', len(candidate_ids))
+        if len(candidate_ids) == 0:
+            raise ValueError('No available players!')
+
+        scores = self.get_candidate_scores(candidate_ids)
+        #the same order as get_best_eligible(), so that with no rollouts the pick is the same as HAgent's
+        candidate_ids = candidate_ids[np.argsort(-scores, kind = 'stable')][0:self.n_candidates]
+
+        #rollouts go round robin over the candidates, so they all get similar numbers of rollouts
+        #a rollout is only started if the longest one so far would still finish before the deadline, and any
+        #rollout still running at the deadline is abandoned, so the budget holds even for the first rollout
+        totals = np.zeros(len(candidate_ids))
+        n_rollouts = np.zeros(len(candidate_ids))
+        n_total = 0
+        longest_rollout = 0
+        now = time.perf_counter()
+        if len(candidate_ids) > 1:
+            while n_total < self.max_rollouts and now + longest_rollout < deadline:
+                i = n_total % len(candidate_ids)
+                value = self.run_rollout(draft_board, candidate_ids[i], pick_number, deadline)
+                if value is None:
+                    break
+                totals[i] += value
+                n_rollouts[i] += 1
+                n_total += 1
+                longest_rollout = max(longest_rollout, time.perf_counter() - now)
+                now = time.perf_counter()
+
+        if n_rollouts.min() == 0:
+            choice = 0
+        else:
+            choice = np.argmax(totals/n_rollouts)
+        return self.commit_pick(candidate_ids[choice])
@@ -0,0 +1,275 @@
+"""Parallel runner for retro-drafting strategy experiments
+
+An experiment grid is a list of tasks, each of which is one (season, primary agent, default agent, seat, format)
+combination. For each task, the primary agent drafts from the given seat against default agents in every other
+seat, and the resulting teams are simulated over many seasons. Tasks are spread over a process pool, and results
+are collected into the res_dict structure used by the Retro Drafting notebook:
+
+    res_dict[season][primary + ' vs ' + default][format] = {'res' : mean winning fraction across seats
+                                                            ,'detail' : category results of each seat}
+"""
+
+import os
+import pickle
+import itertools
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.simulation import run_draft, run_multiple_seasons
+from src.score_cache import get_score_matrix
+
+CATEGORIES = ['pts', 'trb', 'ast', 'stl', 'blk', 'fg3','tov', 'fg_pct','ft_pct']
+
+#data shared with each worker process once, when the worker starts
+_season_data = {}
+_agent_factories = {}
+_agent_cache = {}
+
+def make_h_agent(season_df
+                 , positions
+                 , winner_take_all
+                 , n_punts = 0):
+    """Agent factory for HAgent"""
+    from src.drafting_agents import HAgent
+    return HAgent(season_df, positions, n_punts = n_punts, winner_take_all = winner_take_all)
+
+def make_g_agent(season_df
+                 , positions
+                 , winner_take_all):
+    """Agent factory for a SimpleAgent ranking players by total G-score"""
+    from src.drafting_agents import SimpleAgent
+    return SimpleAgent(order = get_score_matrix(season_df, alpha_weight = 1, beta_weight = 1), positions = positions)
+
+def make_z_plus_agent(season_df
+                      , positions
+                      , winner_take_all):
+    """Agent factory for a SimpleAgent ranking players by total Z-score"""
+    from src.drafting_agents import SimpleAgent
+    return SimpleAgent(order = get_score_matrix(season_df, alpha_weight = 1, beta_weight = 0), positions = positions)
+
+def make_punting_agent(season_df
+                       , positions
+                       , winner_take_all
+                       , n_punts = 4
+                       , alpha_weight = 1
+                       , beta_weight = 1):
+    """Agent factory for PAgent, by default with G-scores"""
+    from src.drafting_agents import PAgent
+    scores = get_score_matrix(season_df, alpha_weight = alpha_weight, beta_weight = beta_weight).get_filled_matrix()
+    return PAgent(scores = scores, positions = positions, n_punts = n_punts)
+
+def build_experiment_grid(seasons
+                          , matchups
+                          , seats = range(12)
+                          , formats = ('wta','tot')):
+    """Declares the tasks of an experiment
+
+    Args:
+        seasons: list of seasons, e.g. [2021, 2022, 2023]
+        matchups: list of (primary agent name, default agent name) tuples. Names refer to agent factories
+        seats: draft positions for the primary agent
+        formats: 'wta' for winner take all and/or 'tot' for total categories
+
+    Returns:
+        List of (season, primary agent name, default agent name, seat, format) tuples
+    """
+    return [(season, primary, default, seat, fmt)
+            for season, (primary, default), fmt, seat in itertools.product(seasons, matchups, formats, seats)]
+
+def _initialize_worker(season_data
+                       , agent_factories):
+    """Stores data which is shared by all tasks of a worker process"""
+    global _season_data, _agent_factories, _agent_cache
+    _season_data = season_data
+    _agent_factories = agent_factories
+    _agent_cache = {}
+
+def _get_agent(season
+               , name
+               , fmt):
+    """Builds an agent with the worker's season data, or gets it from the worker's cache"""
+    key = (season, name, fmt)
+    if key not in _agent_cache:
+        season_df, positions = _season_data[season]
+        _agent_cache[key] = _agent_factories[name](season_df, positions, winner_take_all = fmt == 'wta')
+    return _agent_cache[key]
+
+def run_experiment_task(task
+                        , n_seasons
+                        , n_teams = 12
+                        , n_rounds = 13):
+    """Runs one task of an experiment grid in the current process
+
+    Args:
+        task: (season, primary agent name, default agent name, seat, format) tuple
+        n_seasons: number of seasons to simulate
+        n_teams: number of teams in the league
+        n_rounds: number of draft rounds
+
+    Returns:
+        Tuple of (task, winning fraction of the primary agent, dataframe of its category win and tie rates)
+    """
+    season, primary, default, seat, fmt = task
+    season_df, positions = _season_data[season]
+
+    primary_agent = _get_agent(season, primary, fmt)
+    default_agent = _get_agent(season, default, fmt)
+
+    #each seat needs its own draft state. fresh() shares the model data instead of copying it
+    agents = [default_agent.fresh() for x in range(seat)] + \
+                [primary_agent.fresh()] + \
+                [default_agent.fresh() for x in range(n_teams - 1 - seat)]
+
+    teams = run_draft(agents, n_rounds)
+    res, details = run_multiple_seasons(teams = teams
+                                        , season_df = season_df
+                                        , categories = CATEGORIES
+                                        , n_seasons = n_seasons
+                                        , winner_take_all = fmt == 'wta'
+                                        , return_detailed_results = True)
+    victory_res = res.get(seat) if res.get(seat) is not None else 0
+    return task, victory_res, details.loc[seat,:]
+
+def load_checkpoint(checkpoint_path
+                    , n_seasons):
+    """Loads completed task results from a checkpoint file
+
+    Records are read up to the first one which cannot be loaded, e.g. a partially written final record, and the file
+    is cut back to the end of the last good record so that new records are appended after it. Only results
+    simulated with the same number of seasons are used
+
+    Args:
+        checkpoint_path: path of the checkpoint file, or None
+        n_seasons: number of seasons per task of the current run
+
+    Returns:
+        Dictionary of task -> (winning fraction, detail dataframe)
+    """
+    results = {}
+    if checkpoint_path is None or not os.path.isfile(checkpoint_path):
+        return results
+
+    good_end = 0
+    try:
+        with open(checkpoint_path, 'rb') as f:
+            while True:
+                try:
+                    key, victory_res, detail = pickle.load(f)
+                except EOFError:
+                    break
+                good_end = f.tell()
+                #records of older checkpoints are keyed by the task alone, and are never reused
+                if isinstance(key, tuple) and len(key) == 2 and key[1] == n_seasons:
+                    results[key[0]] = (victory_res, detail)
+    except Exception:
+        #a damaged record means that nothing after it can be trusted
+        pass
+
+    if os.path.getsize(checkpoint_path) > good_end:
+        with open(checkpoint_path, 'r+b') as f:
+            f.truncate(good_end)
+    return results
+
+def get_task_group(task):
+    """Gets the (season, matchup, format) group of a task, which res_dict summarizes over seats"""
+    season, primary, default, seat, fmt = task
+    return (season, primary + ' vs ' + default, fmt)
+
+def get_task_groups(tasks):
+    """Groups tasks by get_task_group()
+
+    Returns:
+        Dictionary of group -> list of tasks
+    """
+    groups = {}
+    for task in tasks:
+        groups.setdefault(get_task_group(task), []).append(task)
+    return groups
+
+def add_group_to_res_dict(res_dict
+                          , results
+                          , group
+                          , group_tasks):
+    """Summarizes the results of one fully completed group of tasks into res_dict"""
+    season, matchup, fmt = group
+    group_tasks = sorted(group_tasks, key = lambda task: task[3])
+    res_dict.setdefault(season, {}).setdefault(matchup, {})[fmt] = \
+        {'res' : np.mean([results[task][0] for task in group_tasks])
+         ,'detail' : pd.concat([results[task][1] for task in group_tasks])}
+
+def add_to_res_dict(res_dict
+                    , results
+                    , tasks):
+    """Adds the results of every fully completed (season, matchup, format) group of tasks to res_dict
+
+    Args:
+        res_dict: dictionary to update in place
+        results: dictionary of task -> (winning fraction, detail dataframe)
+        tasks: list of all tasks of the experiment
+
+    Returns:
+        The updated res_dict
+    """
+    for group, group_tasks in get_task_groups(tasks).items():
+        if all(task in results for task in group_tasks):
+            add_group_to_res_dict(res_dict, results, group, group_tasks)
+    return res_dict
+
+def run_experiments(tasks
+                    , season_data
+                    , agent_factories
+                    , n_seasons
+                    , n_workers = None
+                    , checkpoint_path = None
+                    , res_dict = None):
+    """Runs an experiment grid over a process pool
+
+    Each worker process receives the season data and agent factories once, when it starts, rather than with every
+    task. Completed tasks are appended to an optional checkpoint file as soon as they finish, and tasks already in
+    the checkpoint with the same n_seasons are skipped, so a partially finished grid can be resumed by calling this
+    function again
+
+    Args:
+        tasks: list of tasks, as produced by build_experiment_grid()
+        season_data: dictionary of season -> (season_df, positions), as produced by setup(), or a StatCube.
+                     A StatCube is sent to workers as just its path, and workers share its memory map
+        agent_factories: dictionary of agent name -> function(season_df, positions, winner_take_all) which
+                         returns an agent. Functions need to be defined at module level so workers can load them
+        n_seasons: number of seasons to simulate per task
+        n_workers: number of worker processes. Defaults to the number of CPUs
+        checkpoint_path: optional path of a file to save completed task results to and resume from
+        res_dict: optional dictionary to add results to. It is updated in place as groups of tasks finish
+
+    Returns:
+        res_dict, with the structure
+        res_dict[season][primary + ' vs ' + default][format] = {'res' : ..., 'detail' : ...}
+    """
+    res_dict = {} if res_dict is None else res_dict
+    results = load_checkpoint(checkpoint_path, n_seasons)
+    pending_tasks = [task for task in tasks if task not in results]
+    add_to_res_dict(res_dict, results, tasks)
+
+    #groups are summarized as soon as their last task completes, without going over the other tasks
+    groups = get_task_groups(tasks)
+    n_pending = {group : sum(task not in results for task in group_tasks) for group, group_tasks in groups.items()}
+
+    if len(pending_tasks) > 0:
+        with ProcessPoolExecutor(max_workers = n_workers
+                                 , initializer = _initialize_worker
+                                 , initargs = (season_data, agent_factories)) as executor:
+            futures = [executor.submit(run_experiment_task, task, n_seasons) for task in pending_tasks]
+
+            for future in as_completed(futures):
+                task, victory_res, detail = future.result()
+                results[task] = (victory_res, detail)
+                if checkpoint_path is not None:
+                    with open(checkpoint_path, 'ab') as f:
+                        pickle.dump(((task, n_seasons), victory_res, detail), f)
+
+                group = get_task_group(task)
+                n_pending[group] -= 1
+                if n_pending[group] == 0:
+                    add_group_to_res_dict(res_dict, results, group, groups[group])
+
+    return res_dict
@@ -0,0 +1,431 @@
+"""On-disk store of per-(player, season) features for projecting player statistics
+
+For each season, the store holds the player aggregates used as prediction targets (the mean of each category over
+weeks played, volume and percentage stats, and the rate of weeks without playing), plus lag features: the same
+aggregates from each player's previous n_lags seasons played. Seasons are added incrementally. Adding a season
+only computes its own aggregates, and the lag features of it and any later seasons already in the store
+
+Each season is saved to its own directory of .npy files, one per block of columns:
+
+    players.npy: players with data in the season
+    aggregates.npy: (player x FEATURE_COLUMNS) array of the season's aggregates
+    lags.npy: (player x lag column) array of lag features, in the order of get_lag_columns()
+
+Player metadata, like age and height from the kaggle player data and the stats API, is saved once under
+metadata/ with one .npy file per column. meta.json lists the seasons, their source fingerprints, and the columns.
+Train and test matrices for the per-category models are served from the store without touching the box scores
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+from src.helper_functions import setup, get_season_source_paths
+from src.season_store import get_source_fingerprint
+from src.normalization import DEFAULT_NAME_NORMALIZER
+
+COUNTING_STATISTICS = ['pts', 'trb', 'ast', 'stl', 'blk', 'fg3','tov']
+
+#prediction targets, in the column order of the Metric prediction notebook
+FEATURE_COLUMNS = COUNTING_STATISTICS + ['fta','ft_pct','fga','fg_pct','no_play']
+
+#metadata columns which are identifiers or raw labels rather than model features
+NON_FEATURE_METADATA_COLUMNS = ['pos','lg','tm','seas_id','player_id']
+
+FEATURE_STORE_VERSION = 1
+
+def get_lag_columns(n_lags = 4):
+    """Names of the lag feature columns, e.g. pts_lag_1, ..., no_play_lag_4"""
+    return [c + '_lag_' + str(k) for k in range(1, n_lags + 1) for c in FEATURE_COLUMNS]
+
+def get_season_aggregates(season_df):
+    """Aggregates a season's weekly numbers into one row of features per player
+
+    Counting statistics are averaged over the weeks a player played. Volume and percentage statistics are
+    calculated over all weeks, and no_play is the fraction of weeks without any recorded numbers
+
+    Args:
+        season_df: dataframe of weekly numbers per player and week, as produced by setup()
+
+    Returns:
+        Dataframe indexed by player, with FEATURE_COLUMNS
+    """
+    values = season_df.astype(float)
+    no_play = values.sum(axis = 1) == 0
+    by_player = values.groupby(level = 'player')
+    means = by_player.mean()
+
+    aggregates = values[~no_play][COUNTING_STATISTICS].groupby(level = 'player').mean().reindex(means.index)
+    aggregates['fta'] = means['fta']
+    aggregates['ft_pct'] = means['ft']/means['fta']
+    aggregates['fga'] = means['fga']
+    aggregates['fg_pct'] = means['fg']/means['fga']
+    aggregates['no_play'] = no_play.groupby(level = 'player').mean()
+    return aggregates[FEATURE_COLUMNS]
+
+def get_lag_features(history
+                     , season
+                     , players
+                     , n_lags = 4):
+    """Looks up the aggregates of players' previous seasons played, as lag features
+
+    Lags count seasons a player has data for, so a player who missed a season gets the season before it as their
+    next lag, as with a groupby('player').shift() over seasons
+
+    Args:
+        history: dataframe of aggregates indexed by (player, season), including every season before season
+        season: season to get lag features for
+        players: players to get lag features for
+        n_lags: number of previous seasons to include
+
+    Returns:
+        Dataframe indexed by players, with the columns of get_lag_columns()
+    """
+    earlier = history[history.index.get_level_values('season') < season].sort_index(level = 'season')
+    earlier = earlier[earlier.index.get_level_values('player').isin(players)]
+
+    #number the seasons of each player from the most recent backwards, so season k back is lag k
+    lag_numbers = earlier.groupby(level = 'player', sort = False).cumcount(ascending = False) + 1
+    earlier = earlier[lag_numbers.values <= n_lags]
+    lag_numbers = lag_numbers[lag_numbers <= n_lags]
+
+    lags = earlier.set_axis(pd.MultiIndex.from_arrays([earlier.index.get_level_values('player'), lag_numbers.values]
+                                                      , names = ['player','lag'])) \
+                  .unstack('lag')
+    lags.columns = [c + '_lag_' + str(k) for c, k in lags.columns]
+    return lags.reindex(index = players, columns = get_lag_columns(n_lags))
+
+def load_player_metadata(data_path = '../data/'):
+    """Loads and cleans up player metadata from the kaggle player data and the stats API metadata files
+
+    Returns:
+        Dataframe indexed by (player, season), with one row per player and season
+    """
+    basic_player_data = pd.read_csv(data_path + 'raw/player_data.csv')
+    basic_player_data['player'] = DEFAULT_NAME_NORMALIZER.normalize(basic_player_data['player'])
+    basic_player_data = basic_player_data.groupby(['player','season']).first().reset_index()
+
+    additional_player_data = pd.concat([pd.read_csv(data_path + 'raw/metadata_from_api_' + str(n) + '.csv')
+                                        for n in [1,2,3]]).rename(columns = {'PLAYER_NAME' : 'player'})
+    additional_player_data['player'] = DEFAULT_NAME_NORMALIZER.normalize(additional_player_data['player'])
+    additional_player_data['DRAFT_NUMBER'] = pd.to_numeric(additional_player_data['DRAFT_NUMBER'], errors = 'coerce')
+
+    height_breakdown = additional_player_data['HEIGHT'].str.split('-')
+    additional_player_data['HEIGHT'] = height_breakdown.str[0].astype(float)*12 + height_breakdown.str[1].astype(float)
+
+    player_data = pd.merge(basic_player_data
+                           , additional_player_data[['player','DRAFT_NUMBER','HEIGHT','WEIGHT']]
+                           , on = ['player'])
+
+    #make sure there is one row per player/season
+    player_data = player_data.groupby(['player','season']).first()
+    return player_data.drop(columns = ['birth_year'], errors = 'ignore')
+
+def save_columns(path
+                 , df):
+    """Saves a dataframe as one .npy file per column, plus its index. Text columns are saved as strings
+
+    Returns:
+        Dictionary of column name -> file and kind, to record in the store's metadata
+    """
+    os.makedirs(path, exist_ok = True)
+    columns = {}
+    for i, (name, column) in enumerate(df.reset_index().items()):
+        file = 'column_' + str(i) + '.npy'
+        if pd.api.types.is_numeric_dtype(column.dtype) or pd.api.types.is_bool_dtype(column.dtype):
+            np.save(os.path.join(path, file), column.to_numpy(dtype = float))
+            kind = 'numeric'
+        else:
+            #missing text is saved as '' and restored as NaN
+            np.save(os.path.join(path, file), np.array(column.fillna('').astype(str), dtype = str))
+            kind = 'text'
+        columns[str(name)] = {'file' : file, 'kind' : kind}
+    return {'columns' : columns, 'index_names' : list(df.index.names)}
+
+def load_columns(path
+                 , layout):
+    """Loads a dataframe saved by save_columns(), given the layout it returned"""
+    data = {}
+    for name, column in layout['columns'].items():
+        values = np.load(os.path.join(path, column['file']))
+        if column['kind'] == 'text':
+            values = values.astype(object)
+            values[values == ''] = np.nan
+        data[name] = values
+    df = pd.DataFrame(data)
+    if 'season' in df.columns:
+        df['season'] = df['season'].astype(int)
+    return df.set_index(layout['index_names'])
+
+class FeatureStore():
+    """Incrementally built store of per-(player, season) aggregates and lag features
+
+    Attributes:
+        store_path: directory of the store
+        n_lags: number of previous seasons in the lag features
+        seasons: sorted list of seasons in the store
+    """
+    def __init__(self
+                 , store_path
+                 , n_lags = 4):
+        """Opens a store, creating an empty one if the directory does not have one
+
+        Args:
+            store_path: directory of the store
+            n_lags: number of lag seasons. An existing store built with a different number is rebuilt from its
+                    aggregates the next time a season is added
+        """
+        self.store_path = store_path
+        self.n_lags = n_lags
+        self.meta = {'version' : FEATURE_STORE_VERSION, 'n_lags' : n_lags, 'seasons' : {}, 'metadata' : None}
+        self.cache = {}
+
+        meta_path = os.path.join(store_path, 'meta.json')
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['version'] == FEATURE_STORE_VERSION:
+                self.meta = meta
+
+    @property
+    def seasons(self):
+        return sorted(int(season) for season in self.meta['seasons'])
+
+    def __contains__(self
+                     , season):
+        return str(season) in self.meta['seasons']
+
+    def get_season_path(self
+                        , season):
+        return os.path.join(self.store_path, 'seasons', str(season))
+
+    def write_meta(self):
+        """Writes meta.json atomically, so the store is never left listing a partially written season"""
+        os.makedirs(self.store_path, exist_ok = True)
+        tmp_path = os.path.join(self.store_path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, os.path.join(self.store_path, 'meta.json'))
+
+    def load_season(self
+                    , season
+                    , lags = True):
+        """Loads one season's aggregates, and optionally its lag features, as a dataframe indexed by player"""
+        key = (season, lags)
+        if key not in self.cache:
+            season_path = self.get_season_path(season)
+            players = pd.Index(np.load(os.path.join(season_path, 'players.npy')).astype(object), name = 'player')
+            features = pd.DataFrame(np.load(os.path.join(season_path, 'aggregates.npy'))
+                                    , index = players
+                                    , columns = FEATURE_COLUMNS)
+            if lags:
+                features = pd.concat([features, pd.DataFrame(np.load(os.path.join(season_path, 'lags.npy'))
+                                                             , index = players
+                                                             , columns = get_lag_columns(self.n_lags))], axis = 1)
+            self.cache[key] = features
+        return self.cache[key]
+
+    def get_aggregates(self
+                       , seasons = None):
+        """Gets aggregates of the given seasons, by default all of them, as a dataframe indexed by (player, season)"""
+        seasons = self.seasons if seasons is None else seasons
+        if len(seasons) == 0:
+            return pd.DataFrame(columns = FEATURE_COLUMNS
+                                , index = pd.MultiIndex.from_tuples([], names = ['player','season']))
+        return pd.concat({season : self.load_season(season, lags = False) for season in seasons}
+                         , names = ['season']).swaplevel().sort_index()
+
+    def write_lags(self
+                   , seasons
+                   , history):
+        """Calculates and saves the lag features of seasons already in the store"""
+        for season in seasons:
+            players = self.load_season(season, lags = False).index
+            lags = get_lag_features(history, season, players, self.n_lags)
+            np.save(os.path.join(self.get_season_path(season), 'lags.npy'), lags.values.astype(float))
+            self.cache.pop((season, True), None)
+
+    def add_season(self
+                   , season
+                   , season_df
+                   , fingerprint = None):
+        """Adds or replaces a season, calculating its aggregates and the lag features that depend on it
+
+        Args:
+            season: season, by the year it ends in
+            season_df: dataframe of weekly numbers per player and week, as produced by setup()
+            fingerprint: optional fingerprint of the season's source files, to detect when it needs rebuilding
+        """
+        aggregates = get_season_aggregates(season_df)
+        season_path = self.get_season_path(season)
+        shutil.rmtree(season_path, ignore_errors = True)
+        os.makedirs(season_path)
+        np.save(os.path.join(season_path, 'players.npy'), np.array(aggregates.index, dtype = str))
+        np.save(os.path.join(season_path, 'aggregates.npy'), aggregates.values.astype(float))
+        self.cache.pop((season, False), None)
+
+        #lags of this season and every later season may change. If the number of lags changed, all are redone
+        self.meta['seasons'][str(season)] = {'fingerprint' : fingerprint}
+        if self.meta['n_lags'] != self.n_lags:
+            self.meta['n_lags'] = self.n_lags
+            affected_seasons = self.seasons
+        else:
+            affected_seasons = [s for s in self.seasons if s >= season]
+        self.write_lags(affected_seasons, self.get_aggregates())
+        self.write_meta()
+
+    def update(self
+               , seasons
+               , data_path = '../data/'
+               , cube = None
+               , verbose = False):
+        """Adds every season which is missing from the store or whose source files changed
+
+        Args:
+            seasons: seasons to include, e.g. range(2001, 2024)
+            data_path: directory of the source data, as for setup()
+            cube: optional StatCube to load seasons from. Seasons from a cube are only added if they are missing
+            verbose: If True, print each season as it is added
+
+        Returns:
+            List of the seasons that were added or rebuilt
+        """
+        added = []
+        for season in seasons:
+            if cube is not None and season in cube:
+                fingerprint = None
+            else:
+                fingerprint = get_source_fingerprint(get_season_source_paths(season, data_path)[0:1])
+
+            if season in self and self.meta['seasons'][str(season)]['fingerprint'] == fingerprint \
+                    and self.meta['n_lags'] == self.n_lags:
+                continue
+
+            season_df, _ = setup(season, data_path, cube = cube)
+            self.add_season(season, season_df, fingerprint)
+            added.append(season)
+            if verbose:
+                print('Added ' + str(season))
+        return added
+
+    def set_metadata(self
+                     , player_data):
+        """Saves player metadata to the store, replacing any saved before
+
+        Args:
+            player_data: dataframe indexed by (player, season), e.g. from load_player_metadata()
+        """
+        metadata_path = os.path.join(self.store_path, 'metadata')
+        shutil.rmtree(metadata_path, ignore_errors = True)
+        self.meta['metadata'] = save_columns(metadata_path, player_data)
+        self.cache.pop('metadata', None)
+        self.write_meta()
+
+    def get_metadata(self):
+        """Loads the player metadata, or returns None if none has been saved"""
+        if self.meta['metadata'] is None:
+            return None
+        if 'metadata' not in self.cache:
+            self.cache['metadata'] = load_columns(os.path.join(self.store_path, 'metadata'), self.meta['metadata'])
+        return self.cache['metadata']
+
+    def get_features(self
+                     , seasons = None):
+        """Gets aggregates, lag features and player metadata of the given seasons, by default all of them
+
+        Players without metadata are dropped when metadata is saved, as in the Metric prediction notebook
+
+        Returns:
+            Dataframe indexed by (player, season)
+        """
+        seasons = self.seasons if seasons is None else seasons
+        features = pd.concat({season : self.load_season(season) for season in seasons}, names = ['season']) \
+                        .swaplevel().sort_index()
+        metadata = self.get_metadata()
+        if metadata is not None:
+            features = features.merge(metadata, left_index = True, right_index = True)
+        return features
+
+    def get_projection_features(self
+                                , season):
+        """Gets features for projecting the season after the given one, from data through the given season
+
+        The given season's aggregates become the first lag, and its metadata is aged by one season
+
+        Returns:
+            Dataframe indexed by player, with the feature columns of get_features() except the targets
+        """
+        players = self.load_season(season, lags = False).index
+        history = self.get_aggregates([s for s in self.seasons if s <= season])
+        features = get_lag_features(history, season + 1, players, self.n_lags)
+
+        metadata = self.get_metadata()
+        if metadata is not None:
+            season_metadata = metadata[metadata.index.get_level_values('season') == season].droplevel('season')
+            features = features.merge(season_metadata, left_index = True, right_index = True)
+            for column in ('age','experience'):
+                if column in features.columns:
+                    features[column] = features[column] + 1
+        return features
+
+    def get_pos_categories(self):
+        """Sorted list of the position labels in the metadata, which pos_n encodes as integers"""
+        metadata = self.get_metadata()
+        if metadata is None or 'pos' not in metadata.columns:
+            return []
+        return sorted(metadata['pos'].dropna().unique())
+
+    def get_model_inputs(self
+                         , features
+                         , pos_categories = None):
+        """Converts features from get_features() or get_projection_features() to model inputs
+
+        Targets and non-feature metadata are dropped, and positions are encoded as the integer column pos_n
+
+        Args:
+            features: dataframe of features
+            pos_categories: position labels to encode pos_n with, e.g. those a model was trained with. Defaults to
+                            get_pos_categories(). Labels which are not in the list are encoded as -1
+        """
+        x = features.drop(columns = [c for c in FEATURE_COLUMNS + NON_FEATURE_METADATA_COLUMNS
+                                     if c in features.columns])
+        if 'pos' in features.columns:
+            pos_categories = self.get_pos_categories() if pos_categories is None else pos_categories
+            x['pos_n'] = pd.Categorical(features['pos'], categories = pos_categories).codes
+        return x
+
+    def get_model_matrices(self
+                           , test_seasons
+                           , first_season = 2005
+                           , reference_season = None
+                           , time_decay = 0.99):
+        """Serves train and test matrices for the per-category models
+
+        Args:
+            test_seasons: seasons to hold out for testing. Earlier seasons are used for training
+            first_season: first season to train on. Earlier seasons do not have a full set of lags
+            reference_season: season that time weights are relative to. Defaults to the last season in the store
+            time_decay: rate at which the weight of older seasons decays, per 20 seasons
+
+        Returns:
+            Dictionary with keys 'train' and 'test', each a dictionary of 'x' (model inputs), 'y' (targets), 'weight'
+            (1 - the no_play rate), and 'time_weight' (exponentially decaying with the age of the season), and
+            'pos_categories', the position labels pos_n was encoded with
+        """
+        reference_season = max(self.seasons) if reference_season is None else reference_season
+        features = self.get_features([s for s in self.seasons if s >= first_season])
+        feature_seasons = features.index.get_level_values('season')
+
+        pos_categories = self.get_pos_categories()
+        matrices = {'pos_categories' : pos_categories}
+        for name, rows in (('train', feature_seasons < min(test_seasons))
+                           , ('test', feature_seasons.isin(list(test_seasons)))):
+            subset = features[rows]
+            matrices[name] = {'x' : self.get_model_inputs(subset, pos_categories)
+                              ,'y' : subset[FEATURE_COLUMNS]
+                              ,'weight' : 1 - subset['no_play']
+                              ,'time_weight' : np.exp(-time_decay * np.asarray(reference_season
+                                                                     - subset.index.get_level_values('season'))/20)}
+        return matrices
@@ -4,51 +4,98 @@
 import cvxpy
 import pandas as pd
 import numpy as np
-from unidecode import unidecode
-import re
 import itertools
+import functools
+import hashlib
+import weakref
 from scipy.stats import norm
 
+from src.instrumentation import count
+from src.normalization import DEFAULT_NAME_NORMALIZER, encode_position, encode_positions
+from src.season_store import get_source_fingerprint, load_season_store, save_season_store
+
+#maximum number of players at each of the 8 team positions: C, PG, SG, G, SF, PF, F, U
+POSITION_CAPACITIES = np.array([2,1,1,2,1,1,2,3])
+
+#total capacity of every subset of team positions, indexed by the subset's bitmask
+SLOT_SUBSET_CAPACITIES = ((np.arange(256)[:, None] >> np.arange(8)) & 1) @ POSITION_CAPACITIES
+
+#SUPERSET_INDICATOR[s, m] is 1 if position subset m contains every position in signature s
+SUPERSET_INDICATOR = ((np.arange(256)[None, :] & np.arange(256)[:, None]) == np.arange(256)[:, None]).astype(int)
+SUPERSET_INDICATOR_BOOL = SUPERSET_INDICATOR.astype(bool)
+
+#signature of a player with no known positions, who can only fill the utility slot
+UTILITY_SIGNATURE = 128
+
 def cleanup_name_str(x):
     """Cleans up names from our player data file to official records 
 
+    Corrections come from the table of src.normalization.NAME_CORRECTIONS. To clean up many names at once, use
+    NameNormalizer.normalize(), which processes each distinct name once
     """
-    x = unidecode(x) #gets rid of special characters and such
-    #the first few here are probability not needed
-    if x == 'Robert Williams':
-        return 'Robert Williams III'
-    if x == 'OG Anunoby':
-        return 'O.G. Anunoby'
-    if x == 'Marcus Morris':
-        return 'Marcus Morris Sr.'
-    if x == 'Alekesej Pokusevski':
-        return 'Aleksej Pokusevski'
-    if x == 'Pooh Jeter':
-        return 'Eugene Jeter'
-    if x == 'Nicolas Claxton':
-        return 'Nic Claxton'
-    if x == 'Richard Manning':
-        return 'Rich Manning'
-    if x== 'Xavier Tillman Sr.':
-        return 'Xavier Tillman'
-                   
-    return x
-
-def setup(season):
-    """Prepares a stat dataframe and a position series for a season"""
+    return DEFAULT_NAME_NORMALIZER.normalize_name(x)
 
+def get_season_source_paths(season
+                            , data_path = '../data/'):
+    """Lists the source files that setup() reads for a season"""
     season_str = str(season - 1) + '-' + str(season)[2:]
-    stat_df = pd.read_csv('../data/stat_data/' + season_str + '_complete.csv')\
+    return [data_path + 'stat_data/' + season_str + '_complete.csv'
+            ,data_path + 'player_id_reference.csv'
+            ,data_path + 'positions.csv']
+
+def setup(season
+          , data_path = '../data/'
+          , use_store = True
+          , cube = None):
+    """Prepares a stat dataframe and a position series for a season
+
+    The prepared data is saved to a store under data_path + 'season_store/', and later calls load it from there
+    instead of parsing the source csv files again. The store is rebuilt whenever a source file changes
+
+    Args:
+        season: season, by the year it ends in, e.g. 2023 for 2022-23
+        data_path: directory of the source data
+        use_store: If False, always prepare the data from the source files and leave the store untouched
+        cube: optional StatCube. If it includes the season, the season is returned as a zero-copy view of it
+
+    Returns:
+        Tuple of (dataframe of weekly numbers per player and week, series of position strings per player)
+    """
+    if cube is not None and season in cube:
+        return cube[season]
+
+    source_paths = get_season_source_paths(season, data_path)
+    if not use_store:
+        return build_season_data(*source_paths, season)
+
+    store_path = data_path + 'season_store/' + str(season)
+    fingerprint = get_source_fingerprint(source_paths)
+    stored = load_season_store(store_path, fingerprint)
+    if stored is not None:
+        return stored
+
+    season_df, positions = build_season_data(*source_paths, season)
+    save_season_store(store_path, season_df, positions, fingerprint)
+    return season_df, positions
+
+def build_season_data(stat_path
+                      , player_reference_path
+                      , position_path
+                      , season):
+    """Prepares a stat dataframe and a position series for a season from the source csv files"""
+    stat_df = pd.read_csv(stat_path)\
             [['PLAYER_ID','PTS','REB','AST','STL','BLK','FG3M','TO','FGM','FGA','FTM','FTA','date']]
     stat_df.columns = ['id','pts','trb','ast','stl','blk','fg3','tov','fg','fga','ft','fta','date']
 
-    player_df = pd.read_csv('../data/player_id_reference.csv')
-    position_df = pd.read_csv('../data/positions.csv')
+    player_df = pd.read_csv(player_reference_path)
+    position_df = pd.read_csv(position_path)
 
     essential_info = stat_df.merge(player_df[['id','player']])
 
+    #positions files written by normalization.write_positions() include encoded signatures, which we use directly
     position_df = position_df[position_df['season'] == season] 
-    positions = position_df.set_index(['player'])['pos']
+    positions = position_df.set_index(['player'])['pos_mask' if 'pos_mask' in position_df.columns else 'pos'] \
+                    .rename('pos')
     
     essential_info['date'] = pd.to_datetime(essential_info['date'])
     essential_info['week'] = essential_info['date'].dt.isocalendar()['week']
@@ -65,8 +112,11 @@ def setup(season):
 def check_team_eligibility(players):    
     """Checks if a team is eligible or not, based on the players' possible positions
 
-    The function works by setting up an optimization problem for assigning players to team positions
-    If the optimization problem is infeasible, the team is not eligible
+    Each player is reduced to a bitmask signature of the team positions they can fill. A team is eligible if 
+    every player can be matched to a distinct slot, which by Hall's theorem (the max-flow/min-cut condition for
+    this bipartite matching) is true exactly when, for every subset of team positions, the number of players 
+    who can only play within that subset does not exceed the subset's total capacity. Results are memoized 
+    on the multiset of signatures, since only a few dozen distinct signatures exist
     
     Args:
         players:Lists of players, which are themselves lists of eligible positions. E.g. 
@@ -75,6 +125,135 @@ def check_team_eligibility(players):
     Returns:
         True or False, depending on if the team is found to be eligible or not
 
+    """
+    count('eligibility_checks')
+    signatures = tuple(sorted(get_eligibility_signature(player) for player in players))
+    return check_signature_eligibility(signatures)
+
+@functools.lru_cache(maxsize = None)
+def check_signature_eligibility(signatures):
+    """Checks if a team is eligible based on a sorted tuple of eligibility signatures
+
+    Args:
+        signatures: sorted tuple of integer bitmasks, as produced by get_eligibility_signature()
+
+    Returns:
+        True or False, depending on if the team is found to be eligible or not
+    """
+    counts = np.bincount(np.array(signatures, dtype = int), minlength = 256)
+    return bool(np.all(get_subset_sums(counts) <= SLOT_SUBSET_CAPACITIES))
+
+def get_subset_sums(values):
+    """For an array indexed by 8-bit position masks, sums the values of all submasks of each mask
+
+    Args:
+        values: array of length 256, one entry per subset of team positions
+
+    Returns:
+        Array of length 256, where entry m is the sum of values[s] over all s that are subsets of m
+    """
+    #with one binary axis per position, summing over submasks is a cumulative sum along every axis
+    res = np.asarray(values).reshape([2] * 8)
+    for axis in range(8):
+        res = np.cumsum(res, axis = axis)
+    return res.reshape(256)
+
+def get_superset_minimums(values):
+    """For an array indexed by 8-bit position masks, takes the minimum value over all supermasks of each mask
+
+    Args:
+        values: array of length 256, one entry per subset of team positions
+
+    Returns:
+        Array of length 256, where entry m is the minimum of values[s] over all s that contain m
+    """
+    res = np.asarray(values).reshape([2] * 8)
+    for axis in range(8):
+        res = np.flip(np.minimum.accumulate(np.flip(res, axis = axis), axis = axis), axis = axis)
+    return res.reshape(256)
+
+EMPTY_ROSTER_ADDABLE = get_superset_minimums(SLOT_SUBSET_CAPACITIES) >= 1
+
+class RosterState():
+    """Incrementally tracked eligibility state of a team that is being drafted
+
+    Instead of re-checking the whole roster for every candidate, the state keeps the remaining slack of every
+    subset of team positions: its capacity minus the number of rostered players who can only play within it.
+    By the same matching argument as check_team_eligibility, a player with signature s can be added exactly
+    when every position subset containing s still has at least one unit of slack. That answer is precomputed
+    for all 256 signatures whenever a player is added, so checking a candidate is a single array lookup
+
+    Attributes:
+        signatures: list of the eligibility signatures of rostered players
+        slack: remaining capacity of each subset of team positions, indexed by bitmask
+        addable: boolean array indexed by signature, True if a player with that signature can be added
+    """
+    def __init__(self, signatures = ()):
+        self.signatures = []
+        self.slack = SLOT_SUBSET_CAPACITIES.copy()
+        self.addable = EMPTY_ROSTER_ADDABLE.copy()
+        for signature in signatures:
+            self.add(signature)
+
+    def copy(self):
+        """Copies the state, e.g. to explore hypothetical picks without changing the original"""
+        roster = RosterState.__new__(RosterState)
+        roster.signatures = list(self.signatures)
+        roster.slack = self.slack.copy()
+        #addable is replaced rather than modified by add(), so copies can share it
+        roster.addable = self.addable
+        return roster
+
+    def can_add(self, signature):
+        """Checks if a player with the given eligibility signature can be added to the team"""
+        return bool(self.addable[signature])
+
+    def add(self, signature):
+        """Adds a player with the given eligibility signature to the team, updating slack in place
+
+        Raises:
+            ValueError if the player would make the team ineligible
+        """
+        if not self.addable[signature]:
+            raise ValueError('Player cannot be added without making the team ineligible')
+        self.signatures.append(signature)
+        self.slack -= SUPERSET_INDICATOR[signature]
+        #a signature is blocked if any position subset containing it has no slack left. Only subsets that contain 
+        #the new player's signature lose slack, so only the signatures within them can become blocked
+        newly_full = np.flatnonzero((self.slack == 0) & SUPERSET_INDICATOR_BOOL[signature])
+        if len(newly_full) > 0:
+            self.addable = self.addable & ~SUPERSET_INDICATOR_BOOL[:, newly_full].any(axis = 1)
+
+def get_eligibility_signatures(positions
+                               , players = None):
+    """Converts a Series of player -> eligible positions into a Series of player -> eligibility signature
+
+    Args:
+        positions: Series of player -> list of eligible positions, position string, or encoded signature
+        players: optional index of players to return signatures for. Players without positions can only be 
+                 used as utility players
+
+    Returns:
+        Series of integer signatures
+    """
+    signatures = encode_positions(positions)
+    if players is not None:
+        signatures = signatures.reindex(players).fillna(UTILITY_SIGNATURE)
+    return signatures.astype(int)
+
+def check_team_eligibility_lp(players):    
+    """Checks team eligibility by solving the slot assignment as a linear program
+
+    This is the original cvxpy formulation, kept as a reference to validate check_team_eligibility against.
+    If the optimization problem is infeasible, the team is not eligible
+    
+    Args:
+        players:Lists of players, which are themselves lists of eligible positions, or positions in any other 
+                format accepted by encode_position(), like encoded signatures. E.g. [['SF','PF'],['C'],['SF']]
+
+    Returns:
+        True or False, depending on if the team is found to be eligible or not
+
     """
     n_players = len(players)
     
@@ -87,7 +266,7 @@ def check_team_eligibility(players):
     one_position_constraint = cvxpy.sum(X,axis = 1) == 1
     
     #total number of players in each category cannot exceed the maximum for the category
-    available_positions_constraint = cvxpy.sum(X,axis = 0) <= [2,1,1,2,1,1,2,3]    
+    available_positions_constraint = cvxpy.sum(X,axis = 0) <= POSITION_CAPACITIES
     
     #players can only play at positions they are eligible for 
     eligibility_constraint = X <= eligibility 
@@ -101,23 +280,25 @@ def check_team_eligibility(players):
     return not problem.status == "infeasible"
 
 def get_eligibility_row(pos):
-    """Converts a list of player positions into a binary vector of length 8, for the 8 team positions"""
-    eligibility = {7}
-    if 'C' in pos:
-        eligibility.add(0)
-    if 'PG' in pos: 
-        eligibility.update((1,3))
-    if 'SG' in pos: 
-        eligibility.update((2,3))
-    if 'SF' in pos: 
-        eligibility.update((4,6))
-    if 'PF' in pos: 
-        eligibility.update((5,6))
-    return np.array([[i in eligibility for i in range(8)]])
+    """Converts a player's positions into a binary vector of length 8, for the 8 team positions
+
+    Positions can be in any format accepted by encode_position(), so the vector always matches the signature
+    """
+    signature = encode_position(pos)
+    return np.array([[bool(signature & (1 << i)) for i in range(8)]])
+
+def get_eligibility_signature(pos):
+    """Converts a list of player positions into an integer bitmask, with bit i set if team position i is eligible
+
+    Positions can be in any format accepted by encode_position(), including already encoded signatures
+    """
+    return encode_position(pos)
+
 
 
 #this recursive function allows us to enumerate the winning probabilities efficiently
 #it allows the drafter to work ~5 times faster than it would with a list comprehension for the same step 
+#calculate_majority_probability is a faster closed-form alternative; see benchmark_majority_probability
 def combinatorial_calculation(c
                               , c_comp
                               , categories
@@ -163,50 +344,243 @@ def combinatorial_calculation(c
         return data
 
 
+def calculate_majority_probability(win_probabilities
+                                   , tie_probabilities = None):
+    """Calculates the probability of winning a majority of categories, given independent category probabilities
+
+    The number of categories won follows a Poisson-binomial distribution. Its probability mass is built up one
+    category at a time with a dynamic-programming convolution, which takes O(players * categories^2) operations
+    on plain arrays instead of enumerating every win/loss scenario like combinatorial_calculation does. Any number 
+    of categories is supported. Consistent with combinatorial_calculation, winning exactly half of an even number 
+    of categories does not count as a win
+
+    If tie probabilities are provided, the calculation follows the rules of run_multiple_seasons instead: a
+    tied category counts as half a win, and a matchup is tied when a team gets exactly half of the categories
+
+    Args:
+        win_probabilities: array or dataframe of category winning probabilities. One column per category, one row 
+                           per player
+        tie_probabilities: optional array or dataframe of category tie probabilities, with the same shape
+
+    Returns:
+        Probability of winning a majority of categories for each player. If tie probabilities are provided, a tuple
+        of (probability of winning the matchup, probability of tying the matchup). Dataframe inputs produce Series
+    """
+    index = win_probabilities.index if isinstance(win_probabilities, pd.DataFrame) else None
+    #categories are laid out along the first axis, so that each step works on contiguous rows
+    c = np.array(win_probabilities, dtype = float).T
+    n_categories, n_players = c.shape
+
+    if tie_probabilities is None:
+        #dist[k] is the probability of having won k of the categories processed so far 
+        dist = np.zeros((n_categories + 1, n_players))
+        dist[0] = 1
+        for j in range(n_categories):
+            p_win = c[j]
+            p_loss = 1 - p_win
+            dist[1:(j + 2)] = dist[1:(j + 2)] * p_loss + dist[0:(j + 1)] * p_win
+            dist[0] *= p_loss
+        res = dist[(n_categories // 2 + 1):].sum(axis = 0)
+        return res if index is None else pd.Series(res, index = index)
+    else:
+        #scores are tracked in half-categories so that ties count for one point and wins for two
+        t = np.array(tie_probabilities, dtype = float).T
+        dist = np.zeros((2 * n_categories + 1, n_players))
+        dist[0] = 1
+        for j in range(n_categories):
+            p_win = c[j]
+            p_tie = t[j]
+            p_loss = 1 - p_win - p_tie
+            dist[2:(2 * j + 3)] = dist[2:(2 * j + 3)] * p_loss + dist[1:(2 * j + 2)] * p_tie + dist[0:(2 * j + 1)] * p_win
+            dist[1] = dist[1] * p_loss + dist[0] * p_tie
+            dist[0] *= p_loss
+        res_win = dist[(n_categories + 1):].sum(axis = 0)
+        res_tie = dist[n_categories]
+        if index is None:
+            return res_win, res_tie
+        else:
+            return pd.Series(res_win, index = index), pd.Series(res_tie, index = index)
+
+def punt_categories(values
+                    , n_punts):
+    """Sets each row's n_punts lowest category values to zero, as a punting strategy would
+
+    This is equivalent to values.where(values.rank(axis=1, method='min') > n_punts, 0) for a dataframe. Partitioning 
+    puts nans last, so a category is kept only if it is larger than the n_punts-th smallest category. Categories 
+    without data are always zeroed out
+
+    Args:
+        values: array with categories along the last axis
+        n_punts: number of categories to punt
+
+    Returns:
+        Array of the same shape as values 
+    """
+    if n_punts > 0:
+        threshold = np.partition(values, n_punts - 1, axis = -1)[..., (n_punts - 1):n_punts]
+        return np.where(values > threshold, values, 0)
+    else:
+        return np.nan_to_num(values)
+
+#makes and attempts of the percentage categories, which need cross terms for their volume-adjusted variances
+PERCENTAGE_STATS = {'ft_pct' : ('ft','fta'), 'fg_pct' : ('fg','fga')}
+
+def get_frame_fingerprint(df):
+    """Summarizes a dataframe's shape, labels and values into a key which changes whenever the dataframe does
+
+    Hashing takes one vectorized pass over the rows, which is far cheaper than the statistics cached under the key
+
+    Args:
+        df: dataframe
+
+    Returns:
+        Hashable tuple of (shape, column labels, digest of the index and values in row order)
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index = True).values
+    return (df.shape, tuple(df.columns), hashlib.sha1(row_hashes.tobytes()).hexdigest())
+
+#cache of player statistics by season dataframe id, with the fingerprint of the dataframe they were calculated from.
+#Entries are removed when their dataframe is garbage collected
+_player_statistics_cache = {}
+
+def get_player_statistics(season_df):
+    """Calculates sufficient statistics of each player's weekly numbers, once per season dataframe
+
+    Statistics are the count of known values, their sum, and their sum of squares. For each percentage category
+    there are also columns for makes and attempts on weeks where both are known, and their cross products. Means,
+    variances and covariances of any set of players can be derived from these without going over weekly rows again
+
+    Results are cached for as long as season_df exists. The cache checks the dataframe's fingerprint, so statistics
+    are recalculated if season_df has been modified in place since
+
+    Args:
+        season_df: dataframe of weekly numbers per player
+
+    Returns:
+        Dataframe indexed by player, with columns (statistic, stat) for statistic in count, sum and sum_sq
+    """
+    fingerprint = get_frame_fingerprint(season_df)
+    cached = _player_statistics_cache.get(id(season_df))
+    if cached is not None and cached[0]() is season_df and cached[1] == fingerprint:
+        return cached[2]
+
+    values = season_df.astype(float)
+    for category, (makes, attempts) in PERCENTAGE_STATS.items():
+        both_known = values[makes].notna() & values[attempts].notna()
+        values[category + '_makes'] = values[makes].where(both_known)
+        values[category + '_attempts'] = values[attempts].where(both_known)
+        values[category + '_cross'] = values[makes] * values[attempts]
+
+    player_statistics = pd.concat({'count' : values.notna().astype(float)
+                                   ,'sum' : values
+                                   ,'sum_sq' : values**2}
+                                  , axis = 1).groupby(level = 'player').sum()
+
+    if cached is None or cached[0]() is not season_df:
+        weakref.finalize(season_df, _player_statistics_cache.pop, id(season_df), None)
+    _player_statistics_cache[id(season_df)] = (weakref.ref(season_df), fingerprint, player_statistics)
+    return player_statistics
+
+def clear_player_statistics_cache(season_df = None):
+    """Empties the cache of get_player_statistics(), e.g. to time the full calculation
+
+    Args:
+        season_df: optional season dataframe to clear the statistics of. By default the whole cache is cleared
+    """
+    if season_df is None:
+        _player_statistics_cache.clear()
+    else:
+        _player_statistics_cache.pop(id(season_df), None)
+
+def get_player_moments(player_statistics):
+    """Calculates each player's means, sample variances, and make-attempt covariances from sufficient statistics
+
+    Args:
+        player_statistics: dataframe from get_player_statistics()
+
+    Returns:
+        Tuple of (dataframe of means, dataframe of variances, dataframe of covariances between makes and attempts
+        with one column per percentage category), each indexed by player
+    """
+    counts = player_statistics['count']
+    means = player_statistics['sum']/counts
+    variances = ((player_statistics['sum_sq'] - player_statistics['sum']**2/counts)/(counts - 1)).clip(lower = 0)
+
+    covariances = pd.DataFrame(index = player_statistics.index)
+    for category in PERCENTAGE_STATS:
+        pair_count = counts[category + '_cross']
+        covariances[category] = (player_statistics[('sum', category + '_cross')] - \
+                                    player_statistics[('sum', category + '_makes')] * \
+                                    player_statistics[('sum', category + '_attempts')]/pair_count)/(pair_count - 1)
+        covariances[category] = covariances[category].where(pair_count > 1)
+
+    return means, variances.where(counts > 1), covariances
+
+def get_volume_adjusted_variances(player_vars
+                                  , player_covariances
+                                  , category
+                                  , agg_average
+                                  , attempt_mean_of_means):
+    """Calculates each player's variance of (makes - attempts * agg_average)/attempt_mean_of_means
+
+    Args:
+        player_vars: dataframe of variances, from get_player_moments()
+        player_covariances: dataframe of make-attempt covariances, from get_player_moments()
+        category: percentage category, e.g. 'ft_pct'
+        agg_average: aggregate percentage of the representative players
+        attempt_mean_of_means: average number of attempts of the representative players
+
+    Returns:
+        Series of variances by player
+    """
+    variances = (player_vars[category + '_makes'] \
+                 - 2*agg_average*player_covariances[category] \
+                 + agg_average**2*player_vars[category + '_attempts'])/attempt_mean_of_means**2
+    return variances.clip(lower = 0)
+
 def calculate_coefficients(season_df
                      , representative_player_set):
-    """calculate the coefficients for each category- \mu,\sigma, and \tau, so we can use them for Z-scores and G-scores """
+    """calculate the coefficients for each category- \mu,\sigma, and \tau, so we can use them for Z-scores and G-scores 
+
+    Coefficients are derived from cached per-player statistics, so repeated calls for the same season_df with 
+    different representative player sets do not go over weekly rows again. season_df is not modified
+    """
+    return calculate_coefficients_from_moments(*get_player_moments(get_player_statistics(season_df))
+                                               , representative_player_set)
+
+def calculate_coefficients_from_moments(player_means
+                                        , player_vars
+                                        , player_covariances
+                                        , representative_player_set):
+    """calculate the coefficients for each category from per-player moments, as returned by get_player_moments()"""
 
     main_categories = ['pts', 'trb', 'ast', 'stl', 'blk', 'fg3','tov']
-    player_stats = season_df.groupby(level = 'player').agg(['mean','var'])
 
     #counting stats
-    mean_of_vars = player_stats.loc[representative_player_set,(main_categories,'var')].mean(axis = 0)
-    var_of_means = player_stats.loc[representative_player_set,(main_categories,'mean')].var(axis = 0)
-    mean_of_means = player_stats.loc[representative_player_set,(main_categories,'mean')].mean(axis = 0)
-
-    #free throw percent
-    ft_mean_of_means = player_stats.loc[representative_player_set, ('ft','mean')].mean()
-    fta_mean_of_means = player_stats.loc[representative_player_set, ('fta','mean')].mean()
-    mean_of_means.loc['fta'] = fta_mean_of_means
-    ftp = player_stats.loc[:, ('ft','mean')]/player_stats.loc[:, ('fta','mean')]
-    ftp_agg_average = ft_mean_of_means / fta_mean_of_means
-    mean_of_means.loc['ft_pct'] = ftp_agg_average
-    ftp_numerator = player_stats.loc[:, ('fta','mean')]/fta_mean_of_means * (ftp - ftp_agg_average)
-    ftp_var_of_means = ftp_numerator.loc[representative_player_set].var()
-    var_of_means.loc['ft_pct'] = ftp_var_of_means
-    
-    season_df.loc[:,'volume_adjusted_ftp'] = (season_df['ft'] - season_df['fta']*ftp_agg_average)/ \
-                                            fta_mean_of_means
-    ftp_mean_of_vars = season_df['volume_adjusted_ftp'].loc[representative_player_set].groupby('player').var().mean()
-    mean_of_vars.loc['ft_pct'] = ftp_mean_of_vars
-
-    #field goal percent
-    fg_mean_of_means = player_stats.loc[representative_player_set, ('fg','mean')].mean()
-    fga_mean_of_means = player_stats.loc[representative_player_set, ('fga','mean')].mean()
-    mean_of_means.loc['fga'] = fga_mean_of_means
-    fgp_agg_average = fg_mean_of_means / fga_mean_of_means
-    mean_of_means.loc['fg_pct'] = fgp_agg_average
-    fgp = player_stats.loc[:, ('fg','mean')]/player_stats.loc[:, ('fga','mean')]
-    fgp_numerator = player_stats.loc[:, ('fga','mean')]/fga_mean_of_means * (fgp - fgp_agg_average)
-    fgp_var_of_means = fgp_numerator.loc[representative_player_set].var()
-    var_of_means.loc['fg_pct'] = fgp_var_of_means
-    season_df.loc[:,'volume_adjusted_fgp'] = (season_df['fg'] - season_df['fga']*fgp_agg_average)/ \
-                                        fga_mean_of_means
-    fgp_mean_of_vars = season_df['volume_adjusted_fgp'].loc[representative_player_set].groupby('player').var().mean()    
-    mean_of_vars.loc['fg_pct'] = fgp_mean_of_vars
+    mean_of_vars = player_vars.loc[representative_player_set, main_categories].mean(axis = 0)
+    var_of_means = player_means.loc[representative_player_set, main_categories].var(axis = 0)
+    mean_of_means = player_means.loc[representative_player_set, main_categories].mean(axis = 0)
+
+    for category, (makes, attempts) in PERCENTAGE_STATS.items():
+        makes_mean_of_means = player_means.loc[representative_player_set, makes].mean()
+        attempts_mean_of_means = player_means.loc[representative_player_set, attempts].mean()
+        mean_of_means.loc[attempts] = attempts_mean_of_means
+
+        pct = player_means.loc[:, makes]/player_means.loc[:, attempts]
+        agg_average = makes_mean_of_means / attempts_mean_of_means
+        mean_of_means.loc[category] = agg_average
+
+        numerator = player_means.loc[:, attempts]/attempts_mean_of_means * (pct - agg_average)
+        var_of_means.loc[category] = numerator.loc[representative_player_set].var()
+
+        volume_adjusted_vars = get_volume_adjusted_variances(player_vars
+                                                             , player_covariances
+                                                             , category
+                                                             , agg_average
+                                                             , attempts_mean_of_means)
+        mean_of_vars.loc[category] = volume_adjusted_vars.loc[representative_player_set].mean()
         
-    return mean_of_means.droplevel(1), var_of_means.droplevel(1), mean_of_vars.droplevel(1)
+    return mean_of_means, var_of_means, mean_of_vars
 
 def calculate_scores_from_coefficients(season_df
                                        ,mean_of_means
@@ -215,9 +589,22 @@ def calculate_scores_from_coefficients(season_df
                                        ,alpha_weight = 1
                                        ,beta_weight = 1):
     """Calculate scores based on player info and coefficients. alpha_weight is for \sigma, beta_weight is for \tau"""
+    return calculate_scores_from_means(get_player_moments(get_player_statistics(season_df))[0]
+                                       ,mean_of_means
+                                       ,var_of_means
+                                       ,mean_of_vars
+                                       ,alpha_weight = alpha_weight
+                                       ,beta_weight = beta_weight)
+
+def calculate_scores_from_means(player_stats
+                                ,mean_of_means
+                                ,var_of_means
+                                ,mean_of_vars
+                                ,alpha_weight = 1
+                                ,beta_weight = 1):
+    """Calculate scores based on a dataframe of each player's mean weekly numbers and coefficients"""
     
     main_categories = ['pts', 'trb', 'ast', 'stl', 'blk', 'fg3','tov']
-    player_stats = season_df.groupby(level = 'player').mean()
 
     main_cat_mean_of_means = mean_of_means.loc[main_categories]
     main_cat_var_of_means = var_of_means.loc[main_categories]
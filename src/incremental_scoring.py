@@ -0,0 +1,211 @@
+"""Incremental coefficient and X-score updates for in-season use
+
+IncrementalScorer holds each player's weekly totals and running moments: the number of weeks, the mean of every
+stat, the sum of squared deviations (M2), and the co-moment of makes and attempts for the percentage categories.
+New box score rows are folded in with Welford-style updates which only touch the affected players, and the
+coefficients and X-scores are then refreshed from the moments, without another pass over weekly rows
+
+Weeks follow the format of setup(): every player has a row for every week, with zeros for weeks they did not play.
+A row for a new week therefore adds a zero week to every player, and a new player starts with zeros for every
+existing week
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.helper_functions import PERCENTAGE_STATS, calculate_coefficients_from_moments, calculate_scores_from_means
+
+def calculate_x_scores_from_moments(player_means
+                                    , player_vars
+                                    , player_covariances
+                                    , all_players
+                                    , n_players = 12 * 13):
+    """Calculates X-scores as HAgent does, from per-player moments
+
+    Coefficients are first calculated over all players to get first-order scores. The top n_players by total
+    first-order score are the representative set for the coefficients of the X-scores
+
+    Args:
+        player_means: dataframe of mean weekly numbers, indexed by player
+        player_vars: dataframe of variances of weekly numbers, indexed by player
+        player_covariances: dataframe of make-attempt covariances, indexed by player
+        all_players: index of all players
+        n_players: number of players in the representative set
+
+    Returns:
+        Tuple of (dataframe of X-scores, sorted by total first-order score from highest to lowest,
+        tuple of mean_of_means, var_of_means and mean_of_vars series for the representative set)
+    """
+    first_order_scores = calculate_scores_from_means(player_means
+                                                     ,*calculate_coefficients_from_moments(player_means
+                                                                                           ,player_vars
+                                                                                           ,player_covariances
+                                                                                           ,all_players)
+                                                     ,alpha_weight = 1
+                                                     ,beta_weight = 0)
+    first_order_score_totals = first_order_scores.sum(axis = 1).sort_values(ascending = False)
+    representative_player_set = first_order_score_totals.index[0:n_players]
+
+    coefficients = calculate_coefficients_from_moments(player_means
+                                                       ,player_vars
+                                                       ,player_covariances
+                                                       ,representative_player_set)
+    x_scores = calculate_scores_from_means(player_means, *coefficients, alpha_weight = 0, beta_weight = 1)
+    return x_scores.loc[first_order_score_totals.index], coefficients
+
+class IncrementalScorer():
+    """Keeps coefficients and X-scores up to date as new weekly data arrives"""
+
+    def __init__(self
+                 , season_df
+                 , n_players = 12 * 13):
+        """Initializes the scorer with a season's weekly data so far
+
+        Args:
+            season_df: dataframe of weekly numbers per player, indexed by player and week, as produced by setup()
+            n_players: number of players in the representative set for X-score coefficients
+
+        Returns:
+            None
+        """
+        self.n_players = n_players
+        self.stats = list(season_df.columns)
+        self.stat_positions = {stat : i for i, stat in enumerate(self.stats)}
+        self.pair_positions = [(self.stat_positions[makes], self.stat_positions[attempts])
+                                    for makes, attempts in PERCENTAGE_STATS.values()]
+
+        #players are kept in order of appearance, like pd.unique() of the season dataframe's player level
+        self.players = pd.Index(pd.unique(season_df.index.get_level_values('player')), name = 'player')
+        self.weeks = pd.Index(pd.unique(season_df.index.get_level_values('week')), name = 'week')
+        self.week_values = np.zeros((len(self.players), len(self.weeks), len(self.stats)))
+        self.week_values[self.players.get_indexer(season_df.index.get_level_values('player'))
+                         , self.weeks.get_indexer(season_df.index.get_level_values('week'))] = season_df.values
+
+        self.count = np.full(len(self.players), float(len(self.weeks)))
+        self.mean = self.week_values.mean(axis = 1)
+        deviations = self.week_values - self.mean[:, None, :]
+        self.m2 = (deviations**2).sum(axis = 1)
+        self.comoment = np.stack([(deviations[:, :, m] * deviations[:, :, a]).sum(axis = 1)
+                                  for m, a in self.pair_positions], axis = 1)
+
+        self.x_scores, self.coefficients = self.calculate_x_scores()
+
+    def get_moments(self):
+        """Converts the running moments to the dataframes of means, variances and covariances that
+        get_player_moments() returns, sorted by player
+        """
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            variances = np.where(self.count[:, None] > 1, self.m2/(self.count[:, None] - 1), np.nan)
+            covariances = np.where(self.count[:, None] > 1, self.comoment/(self.count[:, None] - 1), np.nan)
+
+        player_means = pd.DataFrame(self.mean, index = self.players, columns = self.stats)
+        player_vars = pd.DataFrame(variances, index = self.players, columns = self.stats)
+        for category, (makes, attempts) in PERCENTAGE_STATS.items():
+            player_vars[category + '_makes'] = player_vars[makes]
+            player_vars[category + '_attempts'] = player_vars[attempts]
+        player_covariances = pd.DataFrame(covariances, index = self.players, columns = list(PERCENTAGE_STATS))
+
+        return player_means.sort_index(), player_vars.sort_index(), player_covariances.sort_index()
+
+    def calculate_x_scores(self):
+        """Calculates X-scores and coefficients from the running moments"""
+        return calculate_x_scores_from_moments(*self.get_moments(), self.players, n_players = self.n_players)
+
+    def add_players(self
+                    , new_players):
+        """Adds players with zeros for every existing week"""
+        self.players = self.players.append(pd.Index(new_players, name = 'player'))
+        self.week_values = np.concatenate([self.week_values
+                                           , np.zeros((len(new_players), len(self.weeks), len(self.stats)))])
+        self.count = np.concatenate([self.count, np.full(len(new_players), float(len(self.weeks)))])
+        self.mean = np.concatenate([self.mean, np.zeros((len(new_players), len(self.stats)))])
+        self.m2 = np.concatenate([self.m2, np.zeros((len(new_players), len(self.stats)))])
+        self.comoment = np.concatenate([self.comoment, np.zeros((len(new_players), len(self.pair_positions)))])
+
+    def add_weeks(self
+                  , new_weeks):
+        """Adds weeks with zeros for every player, updating each player's moments with a zero observation"""
+        self.weeks = self.weeks.append(pd.Index(new_weeks, name = 'week'))
+        self.week_values = np.concatenate([self.week_values
+                                           , np.zeros((len(self.players), len(new_weeks), len(self.stats)))]
+                                          , axis = 1)
+        for week in new_weeks:
+            self.count += 1
+            delta = - self.mean
+            self.mean = self.mean + delta/self.count[:, None]
+            self.m2 += delta * (0 - self.mean)
+            for k, (m, a) in enumerate(self.pair_positions):
+                self.comoment[:, k] += delta[:, m] * (0 - self.mean[:, a])
+
+    def replace_values(self
+                       , player_ids
+                       , week_id
+                       , new_values):
+        """Replaces one week's values for a set of distinct players, updating their moments in place
+
+        Replacing x_old with x_new in a set of n values moves the mean by (x_new - x_old)/n and M2 by
+        (x_new - x_old) * ((x_new - new mean) + (x_old - old mean)). Co-moments are updated symmetrically
+        """
+        old_values = self.week_values[player_ids, week_id]
+        old_mean = self.mean[player_ids]
+        delta = new_values - old_values
+        new_mean = old_mean + delta/self.count[player_ids, None]
+
+        new_deviations = new_values - new_mean
+        old_deviations = old_values - old_mean
+        self.m2[player_ids] += delta * (new_deviations + old_deviations)
+        for k, (m, a) in enumerate(self.pair_positions):
+            self.comoment[player_ids, k] += (delta[:, m] * (new_deviations[:, a] + old_deviations[:, a]) \
+                                             + delta[:, a] * (new_deviations[:, m] + old_deviations[:, m]))/2
+
+        self.mean[player_ids] = new_mean
+        self.week_values[player_ids, week_id] = new_values
+
+    def fold_rows(self
+                  , rows):
+        """Folds new box score rows into the weekly totals, then refreshes coefficients and X-scores
+
+        Only the moments of touched players are updated. The coefficients are then refreshed from the moments of
+        the representative set, and every X-score is recalculated with them in one vectorized step
+
+        Args:
+            rows: dataframe of new numbers indexed by player and week, with the same stat columns as season_df.
+                  Rows are added to existing weekly totals, so they can be a full new week or a single day
+
+        Returns:
+            Index of players whose own numbers changed, in X-score order: players with non-zero rows, new players,
+            and every player when the rows start a new week, since that adds a zero week to everyone. The X-scores
+            of other players only move with the coefficients
+        """
+        rows = rows[self.stats].groupby(level = ['player','week']).sum()
+        row_players = rows.index.get_level_values('player')
+        row_weeks = rows.index.get_level_values('week')
+
+        new_players = pd.unique(row_players[~row_players.isin(self.players)])
+        if len(new_players) > 0:
+            self.add_players(new_players)
+        new_weeks = pd.unique(row_weeks[~row_weeks.isin(self.weeks)])
+        if len(new_weeks) > 0:
+            self.add_weeks(new_weeks)
+
+        #each player appears at most once per week, so the rows of one week can be updated together
+        player_ids = self.players.get_indexer(row_players)
+        week_ids = self.weeks.get_indexer(row_weeks)
+        for week_id in np.unique(week_ids):
+            in_week = week_ids == week_id
+            self.replace_values(player_ids[in_week]
+                                , week_id
+                                , self.week_values[player_ids[in_week], week_id] + rows.values[in_week])
+
+        self.x_scores, self.coefficients = self.calculate_x_scores()
+
+        if len(new_weeks) > 0:
+            touched = self.players
+        else:
+            touched = row_players[(rows.values != 0).any(axis = 1)].union(pd.Index(new_players))
+        return self.x_scores.index[self.x_scores.index.isin(touched)]
+
+    def get_season_df(self):
+        """Rebuilds the weekly dataframe from the stored weekly totals, in the format of setup()"""
+        index = pd.MultiIndex.from_product([self.players, self.weeks], names = ['player','week'])
+        return pd.DataFrame(self.week_values.reshape(-1, len(self.stats)), index = index, columns = self.stats)
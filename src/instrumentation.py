@@ -0,0 +1,183 @@
+"""Opt-in timing instrumentation for drafts and season simulations
+
+Instrumentation is off unless a Profiler is activated with profiling(). While it is off, instrumented code only
+checks whether a profiler is active, so it runs at full speed. While it is on:
+
+    run_draft() records the latency of every pick, labeled with the class of the agent making it, along with the
+    number of eligibility checks made during the pick
+    run_multiple_seasons() records the time spent in each stage of the simulation: sampling weekly performances,
+    aggregating them into team totals, looking up opponents, and resolving winners
+
+For example:
+
+    with profiling() as profiler:
+        teams = run_draft(agents, 13)
+        run_multiple_seasons(teams, season_df, categories)
+    print(profiler.get_summary().to_string())
+    profiler.write_chrome_trace('trace.json')
+
+Traces are in the Chrome trace event format, which chrome://tracing, Perfetto and speedscope can load
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+import collections
+import numpy as np
+import pandas as pd
+
+_active_profiler = None
+
+class Profiler():
+    """Collects timed events and counters
+
+    Attributes:
+        events: list of dictionaries with the name, category, start and duration in seconds, and arguments of each
+                timed event, in the order they finished
+        counters: Counter of named counts, e.g. 'eligibility_checks'
+    """
+    def __init__(self):
+        self.events = []
+        self.counters = collections.Counter()
+        self.start_time = time.perf_counter()
+
+    def record(self
+               , name
+               , category
+               , start
+               , duration
+               , args = None):
+        """Records a timed event
+
+        Args:
+            name: name of the event, e.g. the stage of a simulation
+            category: category of the event, e.g. 'pick' or 'simulation'
+            start: perf_counter() value at the start of the event
+            duration: length of the event in seconds
+            args: optional dictionary of details about the event
+        """
+        self.events.append({'name' : name
+                            ,'category' : category
+                            ,'start' : start - self.start_time
+                            ,'duration' : duration
+                            ,'thread' : threading.get_ident()
+                            ,'args' : args or {}})
+
+    @contextlib.contextmanager
+    def stage(self
+              , name
+              , category = 'stage'
+              , **args):
+        """Context manager which records the time spent inside it as an event"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter() - start, args)
+
+    def count(self
+              , name
+              , n = 1):
+        """Adds n to a named counter"""
+        self.counters[name] += n
+
+    def get_events(self):
+        """Returns the events as a dataframe, with one column per event argument"""
+        if len(self.events) == 0:
+            return pd.DataFrame(columns = ['name','category','start','duration'])
+        events = pd.DataFrame([{k : v for k, v in event.items() if k != 'args'} for event in self.events])
+        args = pd.DataFrame([event['args'] for event in self.events], index = events.index)
+        return pd.concat([events, args], axis = 1)
+
+    def get_summary(self):
+        """Summarizes time spent by event category and name
+
+        Returns:
+            Dataframe indexed by (category, name), with the number of events, their total time in seconds, and
+            their mean, 95th percentile and maximum times in milliseconds
+        """
+        events = self.get_events()
+        summary = events.groupby(['category','name'])['duration'].agg(['count','sum','mean'
+                                                                        , lambda x: np.percentile(x, 95),'max'])
+        summary.columns = ['count','total_seconds','mean_ms','p95_ms','max_ms']
+        summary[['mean_ms','p95_ms','max_ms']] *= 1000
+        return summary
+
+    def get_pick_summary(self):
+        """Summarizes draft picks by agent class
+
+        Returns:
+            Dataframe indexed by agent class, with the number of picks, their mean, 95th percentile and maximum
+            latency in milliseconds, and the mean number of eligibility checks per pick
+        """
+        picks = self.get_events()
+        picks = picks[picks['category'] == 'pick']
+        summary = picks.groupby('name').agg(picks = ('duration','count')
+                                            , mean_ms = ('duration','mean')
+                                            , p95_ms = ('duration', lambda x: np.percentile(x, 95))
+                                            , max_ms = ('duration','max')
+                                            , eligibility_checks_per_pick = ('eligibility_checks','mean'))
+        summary[['mean_ms','p95_ms','max_ms']] *= 1000
+        summary.index.name = 'agent_class'
+        return summary
+
+    def get_chrome_trace(self):
+        """Converts the events to the Chrome trace event format, with times in microseconds"""
+        pid = os.getpid()
+        return {'traceEvents' : [{'name' : event['name']
+                                  ,'cat' : event['category']
+                                  ,'ph' : 'X'
+                                  ,'ts' : event['start'] * 1e6
+                                  ,'dur' : event['duration'] * 1e6
+                                  ,'pid' : pid
+                                  ,'tid' : event['thread']
+                                  ,'args' : {k : str(v) for k, v in event['args'].items()}}
+                                 for event in self.events]
+                ,'displayTimeUnit' : 'ms'
+                ,'otherData' : {k : v for k, v in self.counters.items()}}
+
+    def write_chrome_trace(self
+                           , path):
+        """Writes the events to a json trace file"""
+        with open(path, 'w') as f:
+            json.dump(self.get_chrome_trace(), f)
+
+def get_profiler():
+    """Returns the active Profiler, or None if instrumentation is off"""
+    return _active_profiler
+
+@contextlib.contextmanager
+def profiling(profiler = None):
+    """Turns instrumentation on inside a with block
+
+    Args:
+        profiler: optional Profiler to collect into, e.g. to add to the results of an earlier block
+
+    Yields:
+        The active Profiler
+    """
+    global _active_profiler
+    previous_profiler = _active_profiler
+    _active_profiler = Profiler() if profiler is None else profiler
+    try:
+        yield _active_profiler
+    finally:
+        _active_profiler = previous_profiler
+
+def count(name
+          , n = 1):
+    """Adds n to a counter of the active profiler, if there is one"""
+    if _active_profiler is not None:
+        _active_profiler.count(name, n)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+def stage(name
+          , category = 'stage'
+          , **args):
+    """Times a with block as an event of the active profiler. Does nothing if instrumentation is off"""
+    if _active_profiler is None:
+        return _NULL_STAGE
+    return _active_profiler.stage(name, category, **args)
@@ -0,0 +1,186 @@
+"""Ingest-time normalization of player names and positions
+
+Player names are cleaned up with unidecode and a table of corrections from our player data to official records.
+The table can be extended from a csv file, and results are cached, so each distinct raw name is only processed once
+
+Positions are encoded once as the 8-bit signature of team positions a player can fill, with bit i set if team position
+i of C, PG, SG, G, SF, PF, F, U is eligible. These are the same bitmasks as get_eligibility_signature() produces, so
+eligibility checks downstream can use them without parsing position strings again
+"""
+
+import re
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+#corrections from unidecoded names in our player data to official records
+NAME_CORRECTIONS = {'Robert Williams' : 'Robert Williams III'
+                    ,'OG Anunoby' : 'O.G. Anunoby'
+                    ,'Marcus Morris' : 'Marcus Morris Sr.'
+                    ,'Alekesej Pokusevski' : 'Aleksej Pokusevski'
+                    ,'Pooh Jeter' : 'Eugene Jeter'
+                    ,'Nicolas Claxton' : 'Nic Claxton'
+                    ,'Richard Manning' : 'Rich Manning'
+                    ,'Xavier Tillman Sr.' : 'Xavier Tillman'}
+
+#team position bits of each listed position. G and F are the generic guard and forward listings of some sources
+POSITION_MASKS = {'C' : 0b00000001
+                  ,'PG' : 0b00001010
+                  ,'SG' : 0b00001100
+                  ,'SF' : 0b01010000
+                  ,'PF' : 0b01100000
+                  ,'G' : 0b00001110
+                  ,'F' : 0b01110000}
+
+#every player can fill the utility slot
+UTILITY_MASK = 0b10000000
+
+class NameNormalizer():
+    """Maps raw player names to cleaned up names, with a cache of every name seen so far"""
+
+    def __init__(self
+                 , corrections = None):
+        """Args:
+            corrections: dictionary of unidecoded name -> corrected name. Defaults to NAME_CORRECTIONS
+        """
+        self.corrections = dict(NAME_CORRECTIONS if corrections is None else corrections)
+        self.cache = {}
+
+    def add_corrections(self
+                        , corrections):
+        """Adds entries to the corrections table
+
+        Args:
+            corrections: dictionary of unidecoded name -> corrected name
+        """
+        self.corrections.update(corrections)
+        self.cache = {}
+
+    def load_corrections(self
+                         , path):
+        """Adds entries to the corrections table from a csv file with raw_name and name columns"""
+        corrections = pd.read_csv(path)
+        self.add_corrections(dict(zip(corrections['raw_name'], corrections['name'])))
+
+    def normalize_name(self
+                       , name):
+        """Cleans up one name"""
+        if name not in self.cache:
+            decoded = unidecode(name)
+            self.cache[name] = self.corrections.get(decoded, decoded)
+        return self.cache[name]
+
+    def normalize(self
+                  , names):
+        """Cleans up many names, processing each distinct name once
+
+        Args:
+            names: Series or list of raw names
+
+        Returns:
+            Series of cleaned up names, with the index of names if it is a Series
+        """
+        names = names if isinstance(names, pd.Series) else pd.Series(names)
+        codes, uniques = pd.factorize(names)
+        normalized = np.array([self.normalize_name(name) for name in uniques] + [np.nan], dtype = object)
+        return pd.Series(normalized[codes], index = names.index, name = names.name)
+
+DEFAULT_NAME_NORMALIZER = NameNormalizer()
+
+def encode_position(pos):
+    """Encodes one position listing as an eligibility signature
+
+    Args:
+        pos: position string in any of our formats, e.g. 'SF-PF', 'PG,SG' or "{'SF', 'PF'}", a list or set of
+             positions, an already encoded integer signature, or a missing value
+
+    Returns:
+        Integer signature. Players without positions can only fill the utility slot
+    """
+    if isinstance(pos, (int, np.integer)):
+        return int(pos) | UTILITY_MASK
+    if isinstance(pos, str):
+        tokens = re.findall('[A-Z]+', pos)
+    elif isinstance(pos, (list, tuple, set, frozenset)):
+        tokens = pos
+    else:
+        tokens = []
+
+    mask = UTILITY_MASK
+    for token in tokens:
+        mask |= POSITION_MASKS.get(token, 0)
+    return mask
+
+def encode_positions(positions):
+    """Encodes a Series of position listings as eligibility signatures, parsing each distinct listing once
+
+    Args:
+        positions: Series of position listings, in any format accepted by encode_position()
+
+    Returns:
+        Series of integer signatures with the same index
+    """
+    if pd.api.types.is_integer_dtype(positions.dtype):
+        return (positions.astype(int) | UTILITY_MASK).rename(positions.name)
+
+    #lists and sets are not hashable, so they are made into sorted tuples before finding the distinct listings
+    keys = positions.map(lambda pos: tuple(sorted(pos)) if isinstance(pos, (list, set, frozenset)) else pos) \
+                if positions.dtype == object else positions
+    codes, uniques = pd.factorize(keys)
+    masks = np.array([encode_position(pos) for pos in uniques] + [UTILITY_MASK], dtype = int)
+    return pd.Series(masks[codes], index = positions.index, name = positions.name)
+
+def decode_position_mask(mask):
+    """Converts a signature back to a readable position string, e.g. 'PG,SG'"""
+    return ','.join(pos for pos in ['C','PG','SG','SF','PF'] if mask & POSITION_MASKS[pos] == POSITION_MASKS[pos])
+
+def normalize_player_data(player_data
+                          , name_normalizer = None
+                          , name_column = 'player'
+                          , position_column = 'pos'):
+    """Normalizes names and encodes positions of raw player metadata, e.g. the kaggle player data
+
+    Args:
+        player_data: dataframe with a name column and optionally a position column
+        name_normalizer: NameNormalizer to use. Defaults to a shared one with the standard corrections
+        name_column: name of the column of player names
+        position_column: name of the column of position strings
+
+    Returns:
+        Copy of player_data with normalized names, and a 'pos_mask' column of signatures if positions are included
+    """
+    name_normalizer = DEFAULT_NAME_NORMALIZER if name_normalizer is None else name_normalizer
+    player_data = player_data.copy()
+    player_data[name_column] = name_normalizer.normalize(player_data[name_column])
+    if position_column in player_data.columns:
+        player_data['pos_mask'] = encode_positions(player_data[position_column])
+    return player_data
+
+def combine_position_masks(player_data
+                           , keys = ['player','season']):
+    """Combines the signatures of players listed more than once, e.g. after trades, into one per key
+
+    A player is eligible for a team position if any of their listings is, so signatures are combined with a
+    bitwise or, calculated as the maximum of each bit
+
+    Args:
+        player_data: dataframe with a pos_mask column and the key columns, from normalize_player_data()
+        keys: columns to combine listings by
+
+    Returns:
+        Series of integer signatures indexed by the keys
+    """
+    bits = (player_data['pos_mask'].values[:, None] >> np.arange(8)) & 1
+    bit_df = pd.DataFrame(bits, index = pd.MultiIndex.from_frame(player_data[keys]))
+    combined_bits = bit_df.groupby(level = keys).max()
+    return pd.Series(combined_bits.values @ (1 << np.arange(8)), index = combined_bits.index, name = 'pos_mask')
+
+def write_positions(position_masks
+                    , path):
+    """Writes combined signatures to a positions file like positions.csv, which setup() can read
+
+    The file keeps a readable pos column alongside the pos_mask column, so older readers still work
+    """
+    positions_df = position_masks.reset_index()
+    positions_df.insert(len(positions_df.columns) - 1, 'pos', positions_df['pos_mask'].map(decode_position_mask))
+    positions_df.to_csv(path, index = False)
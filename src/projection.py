@@ -0,0 +1,263 @@
+"""Projection of next-season player statistics with one gradient boosted model per category
+
+Models are trained on matrices from a FeatureStore, with the hand-tuned parameters of the Metric prediction
+notebook. Categories are trained in parallel over a process pool, with the cores split between workers so that
+LightGBM's own threads do not oversubscribe the machine. Fitted models are kept as LightGBM model strings, which
+are saved together in one compressed file
+
+A ProjectionEngine projects every category for a whole league with one batched call per model, then blends
+counting stats with each player's previous season in one vectorized step:
+
+    engine = ProjectionEngine.train(feature_store.get_model_matrices([2022, 2023]), feature_store = feature_store)
+    projections = engine.project(players, 2024)
+"""
+
+import os
+import json
+import gzip
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from lightgbm import LGBMRegressor, Booster
+
+from src.feature_store import FEATURE_COLUMNS
+
+#hand-tuned model parameters per category. Percentage models weight rows by their volume column
+PARAMETERS = {'pts' : {'num_leaves' : 17, 'max_depth' : 6, 'boosting' : 'gbdt', 'min_data_in_leaf' : 10}
+              ,'trb' : {'num_leaves' : 50, 'max_depth' : 6, 'boosting' : 'gbdt', 'min_data_in_leaf' : 20}
+              ,'ast' : {'num_leaves' : 10, 'max_depth' : 5, 'boosting' : 'gbdt', 'min_data_in_leaf' : 15}
+              ,'stl' : {'num_leaves' : 30, 'max_depth' : 7, 'boosting' : 'gbdt', 'min_data_in_leaf' : 30}
+              ,'blk' : {'num_leaves' : 25, 'max_depth' : 6, 'boosting' : 'gbdt', 'min_data_in_leaf' : 40}
+              ,'fg3' : {'num_leaves' : 30, 'max_depth' : 5, 'boosting' : 'gbdt', 'min_data_in_leaf' : 15}
+              ,'tov' : {'num_leaves' : 30, 'max_depth' : 5, 'boosting' : 'gbdt', 'min_data_in_leaf' : 20}
+              ,'fta' : {'num_leaves' : 30, 'max_depth' : 6, 'boosting' : 'gbdt', 'min_data_in_leaf' : 70}
+              ,'ft_pct' : {'num_leaves' : 200, 'max_depth' : 10, 'boosting' : 'gbdt', 'min_data_in_leaf' : 30
+                           ,'volume' : 'fta'}
+              ,'fga' : {'num_leaves' : 30, 'max_depth' : 7, 'boosting' : 'gbdt', 'min_data_in_leaf' : 80}
+              ,'fg_pct' : {'num_leaves' : 12, 'max_depth' : 5, 'boosting' : 'gbdt', 'min_data_in_leaf' : 40
+                           ,'volume' : 'fga'}
+              ,'no_play' : {'num_leaves' : 30, 'max_depth' : 7, 'boosting' : 'dart', 'min_data_in_leaf' : 60
+                            ,'time_weight_only' : True}}
+
+#projections of these categories are blended with the player's previous season, when there is one
+LAG_BLEND_WEIGHT = 0.2
+UNBLENDED_CATEGORIES = ['no_play','ft_pct','fg_pct']
+
+PERCENTAGE_VOLUMES = {'ft_pct' : ('ft','fta'), 'fg_pct' : ('fg','fga')}
+
+def get_sample_weights(matrices
+                       , category
+                       , parameters = PARAMETERS):
+    """Gets the training weights of one category's model
+
+    Args:
+        matrices: dictionary of 'y', 'weight' and 'time_weight', e.g. one part of FeatureStore.get_model_matrices()
+        category: category of the model
+        parameters: dictionary of model parameters per category
+
+    Returns:
+        Array of sample weights
+    """
+    if parameters[category].get('time_weight_only'):
+        return np.asarray(matrices['time_weight'], dtype = float)
+    weights = np.asarray(matrices['weight'], dtype = float) * np.asarray(matrices['time_weight'], dtype = float)
+    if 'volume' in parameters[category]:
+        weights = weights * matrices['y'][parameters[category]['volume']].values
+    return weights
+
+def get_thread_budget(n_models
+                      , n_cores = None):
+    """Splits the cores between parallel model fits
+
+    Returns:
+        Tuple of (number of worker processes, number of LightGBM threads per worker)
+    """
+    n_cores = (os.cpu_count() or 1) if n_cores is None else n_cores
+    n_workers = max(1, min(n_models, n_cores))
+    return n_workers, max(1, n_cores // n_workers)
+
+def train_category_model(category
+                         , x
+                         , y
+                         , sample_weight
+                         , model_parameters
+                         , n_threads = 1
+                         , categorical_features = ['pos_n']):
+    """Fits one category's model. Rows with a missing target are left out
+
+    This is a module-level function so that it can run in a worker process
+
+    Returns:
+        Tuple of (category, LightGBM model string)
+    """
+    known = ~np.isnan(y)
+    model = LGBMRegressor(num_leaves = model_parameters['num_leaves']
+                          , max_depth = model_parameters['max_depth']
+                          , boosting_type = model_parameters['boosting']
+                          , min_data_in_leaf = model_parameters['min_data_in_leaf']
+                          , importance_type = 'gain'
+                          , n_jobs = n_threads
+                          , verbose = -1)
+    model.fit(x[known]
+              , y[known]
+              , sample_weight = sample_weight[known]
+              , categorical_feature = [c for c in categorical_features if c in x.columns])
+    return category, model.booster_.model_to_string()
+
+class ProjectionEngine():
+    """Projects player statistics with one fitted model per category
+
+    Attributes:
+        models: dictionary of category -> LightGBM Booster
+        feature_names: model input columns, in order
+        pos_categories: position labels that pos_n was encoded with in training
+        feature_store: optional FeatureStore that project() gets inputs from
+    """
+    def __init__(self
+                 , model_strings
+                 , feature_names
+                 , feature_store = None
+                 , pos_categories = None):
+        """Args:
+            model_strings: dictionary of category -> LightGBM model string
+            feature_names: model input columns, in order
+            feature_store: optional FeatureStore for project()
+            pos_categories: position labels that pos_n was encoded with in training. project() encodes positions
+                            with the same labels, even if the feature store has gained new ones since
+        """
+        self.model_strings = model_strings
+        self.models = {category : Booster(model_str = model_string) for category, model_string in model_strings.items()}
+        self.feature_names = list(feature_names)
+        self.feature_store = feature_store
+        self.pos_categories = None if pos_categories is None else list(pos_categories)
+        self.feature_cache = {}
+
+    @classmethod
+    def train(cls
+              , matrices
+              , parameters = PARAMETERS
+              , categories = None
+              , split = 'train'
+              , n_cores = None
+              , feature_store = None):
+        """Trains one model per category over a process pool
+
+        Args:
+            matrices: dictionary from FeatureStore.get_model_matrices()
+            parameters: dictionary of model parameters per category
+            categories: categories to train models for. Defaults to every category in parameters
+            split: which part of matrices to train on. 'all' trains on train and test together
+            n_cores: number of cores to use. Defaults to all of them
+            feature_store: optional FeatureStore for project()
+
+        Returns:
+            ProjectionEngine
+        """
+        categories = list(parameters) if categories is None else categories
+        if split == 'all':
+            training = {k : pd.concat([matrices['train'][k], matrices['test'][k]]) if k in ('x','y') else
+                               np.concatenate([np.asarray(matrices['train'][k]), np.asarray(matrices['test'][k])])
+                        for k in ('x','y','weight','time_weight')}
+        else:
+            training = matrices[split]
+
+        x = training['x']
+        n_workers, n_threads = get_thread_budget(len(categories), n_cores)
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            futures = [executor.submit(train_category_model
+                                       , category
+                                       , x
+                                       , training['y'][category].values.astype(float)
+                                       , get_sample_weights(training, category, parameters)
+                                       , parameters[category]
+                                       , n_threads) for category in categories]
+            model_strings = dict(future.result() for future in futures)
+
+        return cls(model_strings, x.columns, feature_store, matrices.get('pos_categories'))
+
+    def save(self
+             , path):
+        """Saves the models, with their input columns and position labels, to one gzipped json file"""
+        with gzip.open(path, 'wt', encoding = 'utf-8') as f:
+            json.dump({'feature_names' : self.feature_names
+                       ,'pos_categories' : self.pos_categories
+                       ,'models' : self.model_strings}, f)
+
+    @classmethod
+    def load(cls
+             , path
+             , feature_store = None):
+        """Loads models saved by save()"""
+        with gzip.open(path, 'rt', encoding = 'utf-8') as f:
+            saved = json.load(f)
+        return cls(saved['models'], saved['feature_names'], feature_store, saved.get('pos_categories'))
+
+    def predict(self
+                , x):
+        """Predicts every category for a matrix of model inputs, without post-processing
+
+        Returns:
+            Dataframe of predictions with the index of x and one column per category
+        """
+        x_values = x.reindex(columns = self.feature_names).values.astype(float)
+        return pd.DataFrame({category : model.predict(x_values) for category, model in self.models.items()}
+                            , index = x.index)
+
+    def blend_with_lags(self
+                        , predictions
+                        , x):
+        """Blends projections of counting stats with each player's previous season, where there is one
+
+        All categories are blended in one vectorized step
+        """
+        blended_categories = [c for c in predictions.columns if c not in UNBLENDED_CATEGORIES
+                              and c + '_lag_1' in x.columns]
+        predicted = predictions[blended_categories].values
+        previous = x[[c + '_lag_1' for c in blended_categories]].values
+        predictions = predictions.copy()
+        predictions[blended_categories] = np.where(np.isnan(previous)
+                                                   , predicted
+                                                   , predicted * (1 - LAG_BLEND_WEIGHT) + previous * LAG_BLEND_WEIGHT)
+        return predictions
+
+    def project_from_features(self
+                              , x):
+        """Projects a full stat table from model inputs
+
+        Returns:
+            Dataframe of projections, with makes derived from projected attempts and percentages, so that it can
+            be passed to calculate_scores_from_coefficients() or calculate_scores_from_means()
+        """
+        projections = self.blend_with_lags(self.predict(x), x)
+        for category, (makes, attempts) in PERCENTAGE_VOLUMES.items():
+            if category in projections.columns and attempts in projections.columns:
+                projections[makes] = projections[attempts] * projections[category]
+        return projections
+
+    def get_projection_inputs(self
+                              , season):
+        """Gets model inputs for projecting a season from the feature store, once per season"""
+        if season not in self.feature_cache:
+            if self.feature_store is None:
+                raise ValueError('Projecting by season requires a feature store')
+            features = self.feature_store.get_projection_features(season - 1)
+            self.feature_cache[season] = self.feature_store.get_model_inputs(features, self.pos_categories)
+        return self.feature_cache[season]
+
+    def project(self
+                , players
+                , season):
+        """Projects the statistics of players for a season, from their data through the previous season
+
+        Args:
+            players: list of players. Players without data in the previous season get rows of NaN
+            season: season to project, by the year it ends in
+
+        Returns:
+            Dataframe indexed by player, with one column per projected statistic
+        """
+        x = self.get_projection_inputs(season)
+        projections = self.project_from_features(x[x.index.isin(players)])
+        projections = projections.reindex(pd.Index(players, name = 'player'))
+        return projections[[c for c in FEATURE_COLUMNS if c in projections.columns]
+                           + [c for c in projections.columns if c not in FEATURE_COLUMNS]]
@@ -0,0 +1,153 @@
+"""Weekly matchup schedules for simulated seasons
+
+A schedule is a (week x team) integer array, where entry [w, t] is the number of the team that team t plays during
+week w. Every week must pair teams up, so that if t plays u then u plays t, and no team plays itself. Schedules
+are returned read-only so that cached tables can be shared safely
+"""
+
+import functools
+import numpy as np
+import pandas as pd
+
+def validate_schedule(schedule
+                      , n_teams = None):
+    """Checks that every week of a schedule pairs teams up with each other
+
+    Args:
+        schedule: (week x team) array of opponent team numbers
+        n_teams: expected number of teams. Defaults to the number of columns of the schedule
+
+    Returns:
+        The schedule as a read-only integer array
+    """
+    schedule = np.array(schedule, dtype = int)
+    n_teams = schedule.shape[1] if n_teams is None else n_teams
+
+    if schedule.ndim != 2 or schedule.shape[1] != n_teams or len(schedule) == 0:
+        raise ValueError('Schedule needs to be a (week x team) table with ' + str(n_teams) + ' teams')
+    if np.any(schedule < 0) or np.any(schedule >= n_teams):
+        raise ValueError('Schedule contains team numbers outside of 0 to ' + str(n_teams - 1))
+
+    weeks = np.arange(len(schedule))[:, None]
+    if np.any(schedule == np.arange(n_teams)) or np.any(schedule[weeks, schedule] != np.arange(n_teams)):
+        raise ValueError('Each week of the schedule needs to pair every team with exactly one other team')
+
+    schedule.setflags(write = False)
+    return schedule
+
+@functools.lru_cache(maxsize = None)
+def get_round_robin_schedule(n_teams = 12
+                             , n_weeks = None):
+    """Builds a round robin schedule table, where every team plays every other team once per n_teams - 1 weeks
+
+    Based on the circle method as defined by wikipedia, matching round_robin_opponent() for every team and week
+    https://en.wikipedia.org/wiki/Round-robin_tournament#Circle_method
+
+    Tables are cached per (n_teams, n_weeks), so repeated simulations share one table
+
+    Args:
+        n_teams: number of teams - must be an even number
+        n_weeks: number of weeks. Defaults to one full round robin, n_teams - 1 weeks. Longer schedules repeat
+
+    Returns:
+        Read-only (week x team) array of opponent team numbers
+    """
+    if n_teams < 2 or n_teams % 2 != 0:
+        raise ValueError('Round robin schedules need an even number of teams')
+
+    n_weeks = n_teams - 1 if n_weeks is None else n_weeks
+    n = n_teams - 1
+    w = np.arange(n_weeks)[:, None] % n
+    t = np.arange(1, n_teams)[None, :]
+
+    #position 0 remains fixed, and the other teams rotate around their (n - 1) spots
+    res = (((n - (t + w) % n) % n) - w) % n
+    opponents = np.where(res == 0, n, res)
+    #in spot (n-1) of the non-zero spots, the opponent is 0
+    opponents = np.where((t + w) % n == 0, 0, opponents)
+
+    schedule = np.empty((n_weeks, n_teams), dtype = int)
+    schedule[:, 0] = ((n - 1 - w[:, 0]) % n) + 1
+    schedule[:, 1:] = opponents
+    return validate_schedule(schedule)
+
+def get_random_schedule(n_teams
+                        , n_weeks
+                        , seed = None):
+    """Builds a randomized round robin schedule
+
+    Each block of n_teams - 1 weeks is a full round robin, with teams relabeled and weeks shuffled at random.
+    Every team still plays every other team equally often over complete blocks
+
+    Args:
+        n_teams: number of teams - must be an even number
+        n_weeks: number of weeks
+        seed: seed or numpy random Generator
+
+    Returns:
+        Read-only (week x team) array of opponent team numbers
+    """
+    rng = np.random.default_rng(seed)
+    round_robin = get_round_robin_schedule(n_teams)
+
+    blocks = []
+    for block_start in range(0, n_weeks, len(round_robin)):
+        #relabel teams with a permutation: if team t plays u in the base schedule, perm[t] plays perm[u]
+        perm = rng.permutation(n_teams)
+        block = np.empty_like(round_robin)
+        block[:, perm] = perm[round_robin]
+        blocks.append(block[rng.permutation(len(block))])
+
+    return validate_schedule(np.concatenate(blocks)[0:n_weeks], n_teams)
+
+def get_schedule_from_matchups(matchups
+                               , n_teams):
+    """Builds a schedule table from a list of weekly matchups
+
+    Args:
+        matchups: list with one entry per week, each a list of (team number, team number) pairs
+        n_teams: number of teams
+
+    Returns:
+        Read-only (week x team) array of opponent team numbers
+    """
+    schedule = np.full((len(matchups), n_teams), -1)
+    for week, week_matchups in enumerate(matchups):
+        for team_a, team_b in week_matchups:
+            if schedule[week, team_a] != -1 or schedule[week, team_b] != -1:
+                raise ValueError('Week ' + str(week) + ' has a team in more than one matchup')
+            schedule[week, team_a] = team_b
+            schedule[week, team_b] = team_a
+    return validate_schedule(schedule, n_teams)
+
+def load_schedule(path
+                  , n_teams = None):
+    """Loads a schedule from a csv file with week, team, and opponent columns
+
+    Weeks and teams are numbered from 0. Matchups may be listed from one or both sides
+
+    Args:
+        path: path of the csv file
+        n_teams: number of teams. Defaults to the highest team number plus one
+
+    Returns:
+        Read-only (week x team) array of opponent team numbers
+    """
+    schedule_df = pd.read_csv(path)
+    n_teams = int(schedule_df[['team','opponent']].values.max()) + 1 if n_teams is None else n_teams
+    n_weeks = int(schedule_df['week'].max()) + 1
+
+    matchups = [[] for w in range(n_weeks)]
+    for week, team, opponent in schedule_df[['week','team','opponent']].itertuples(index = False):
+        if (opponent, team) not in matchups[week]:
+            matchups[week].append((team, opponent))
+    return get_schedule_from_matchups(matchups, n_teams)
+
+def save_schedule(schedule
+                  , path):
+    """Saves a schedule table to a csv file with week, team, and opponent columns, readable by load_schedule()"""
+    schedule = np.asarray(schedule)
+    weeks, teams = np.indices(schedule.shape)
+    pd.DataFrame({'week' : weeks.ravel()
+                  ,'team' : teams.ravel()
+                  ,'opponent' : schedule.ravel()}).to_csv(path, index = False)
@@ -0,0 +1,194 @@
+"""Cache of precomputed score matrices
+
+Scores come from a two-stage pipeline. First-order scores, with alpha_weight = 1 and beta_weight = 0, are calculated
+with coefficients over all players. The top n_players by first-order score total are then the representative set for
+the coefficients of the final scores. The result depends only on the season's data and (alpha_weight, beta_weight,
+n_players), so it is calculated once per key and shared as a read-only ScoreMatrix. Agents hold a reference to the matrix instead of
+their own copies of the scores, and copying an agent does not copy its matrix
+"""
+
+import weakref
+import collections
+import numpy as np
+import pandas as pd
+
+from src.helper_functions import calculate_coefficients, calculate_scores_from_coefficients, get_frame_fingerprint
+
+class ScoreMatrix():
+    """Read-only matrix of scores, with one row per player and one column per category
+
+    Rows of matrices from the cache are sorted by first-order score total, from highest to lowest
+
+    Attributes:
+        key: cache key the matrix was calculated for
+        players: index of players, in row order
+        categories: list of categories, in column order
+        values: read-only array of scores
+        first_order_totals: read-only array of the first-order score totals of each row, if known
+    """
+    def __init__(self
+                 , key
+                 , scores
+                 , first_order_totals = None):
+        self.key = key
+        self.players = scores.index
+        self.categories = list(scores.columns)
+        self.values = np.array(scores.values, dtype = float)
+        self.values.setflags(write = False)
+        if first_order_totals is not None:
+            first_order_totals = np.array(first_order_totals, dtype = float)
+            first_order_totals.setflags(write = False)
+        self.first_order_totals = first_order_totals
+        self.derived = {}
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self
+                     , memo):
+        return self
+
+    def to_frame(self
+                 , columns = None):
+        """Wraps the matrix in a read-only dataframe, without copying it
+
+        Args:
+            columns: optional list of column names to use instead of the categories
+        """
+        return pd.DataFrame(self.values
+                            , index = self.players
+                            , columns = self.categories if columns is None else columns
+                            , copy = False)
+
+    def get_derived(self
+                    , name
+                    , func):
+        """Calculates data derived from the matrix once, and shares it between every holder of the matrix
+
+        Args:
+            name: name to store the derived data under
+            func: function taking the matrix and returning the derived data. Arrays should not be modified later
+
+        Returns:
+            The derived data
+        """
+        if name not in self.derived:
+            self.derived[name] = func(self)
+        return self.derived[name]
+
+    def get_filled_matrix(self):
+        """Gets a matrix with missing scores, e.g. percentages of players with no attempts, replaced by 0"""
+        return self.get_derived('filled_matrix', lambda score_matrix: ScoreMatrix(score_matrix.key
+                                                                                  , score_matrix.to_frame().fillna(0)
+                                                                                  , score_matrix.first_order_totals))
+
+    def get_order(self):
+        """Gets a series of players by total score, from highest to lowest, for use as a SimpleAgent order"""
+        return self.get_derived('order', lambda score_matrix: score_matrix.to_frame().sum(axis = 1) \
+                                                                .sort_values(ascending = False))
+
+def calculate_score_matrix(season_df
+                           , alpha_weight
+                           , beta_weight
+                           , n_players = 12 * 13
+                           , key = None):
+    """Calculates the scores of the two-stage pipeline
+
+    Args:
+        season_df: dataframe with weekly data for the season
+        alpha_weight: weight of the variance of means (\\sigma) in the final scores
+        beta_weight: weight of the mean of variances (\\tau) in the final scores
+        n_players: number of players in the representative set
+        key: key to record on the matrix
+
+    Returns:
+        ScoreMatrix
+    """
+    all_players = pd.unique(season_df.index.get_level_values('player'))
+    first_order_scores = calculate_scores_from_coefficients(season_df
+                                                            ,*calculate_coefficients(season_df, all_players)
+                                                            ,alpha_weight = 1
+                                                            ,beta_weight = 0)
+    first_order_score_totals = first_order_scores.sum(axis = 1).sort_values(ascending = False)
+    representative_player_set = first_order_score_totals.index[0:n_players]
+
+    scores = calculate_scores_from_coefficients(season_df
+                                                ,*calculate_coefficients(season_df, representative_player_set)
+                                                ,alpha_weight = alpha_weight
+                                                ,beta_weight = beta_weight)
+    return ScoreMatrix(key, scores.loc[first_order_score_totals.index], first_order_score_totals.values)
+
+class ScoreCache():
+    """Least-recently-used cache of score matrices
+
+    Matrices are keyed by (season, fingerprint of season_df, alpha_weight, beta_weight, n_players), so a label is
+    only shared between dataframes with the same contents, and a dataframe changed in place gets a new matrix
+    """
+
+    def __init__(self
+                 , max_size = 32):
+        """Creates an empty cache
+
+        Args:
+            max_size: number of matrices to keep. When the cache is full, the least recently used one is dropped
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def get(self
+            , season_df
+            , alpha_weight
+            , beta_weight
+            , n_players = 12 * 13
+            , season = None):
+        """Gets a score matrix, calculating it if it is not in the cache
+
+        Args:
+            season_df: dataframe with weekly data for the season
+            alpha_weight: weight of the variance of means (\\sigma) in the scores
+            beta_weight: weight of the mean of variances (\\tau) in the scores
+            n_players: number of players in the representative set
+            season: label of the season, e.g. 2023. With it, matrices are shared between callers which pass
+                    different season_df objects with the same contents. Without it, matrices are only shared between
+                    callers which pass the same season_df object
+
+        Returns:
+            ScoreMatrix
+        """
+        key = (season if season is not None else id(season_df)
+               , get_frame_fingerprint(season_df)
+               , alpha_weight
+               , beta_weight
+               , n_players)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            source, score_matrix = entry
+            if source is None or source() is season_df:
+                self.entries.move_to_end(key)
+                return score_matrix
+
+        score_matrix = calculate_score_matrix(season_df, alpha_weight, beta_weight, n_players, key)
+        self.entries[key] = (None if season is not None else weakref.ref(season_df), score_matrix)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last = False)
+        return score_matrix
+
+DEFAULT_SCORE_CACHE = ScoreCache()
+
+def get_score_matrix(season_df
+                     , alpha_weight = 1
+                     , beta_weight = 1
+                     , n_players = 12 * 13
+                     , season = None
+                     , cache = None):
+    """Gets a score matrix from a cache, by default the module's shared cache. See ScoreCache.get()"""
+    cache = DEFAULT_SCORE_CACHE if cache is None else cache
+    return cache.get(season_df, alpha_weight, beta_weight, n_players = n_players, season = season)
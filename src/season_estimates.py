@@ -0,0 +1,235 @@
+"""Analytic estimates of season outcomes, as a fast alternative to simulating seasons with run_multiple_seasons()
+
+Instead of resampling weeks, each team's weekly stat totals are summarized by their means and covariances, which
+are exact sums of the moments of its players' real weeks. Category results of every pairing of teams follow from
+normal approximations:
+
+    Counting stats are differences of integer totals, so a category is won when the difference is at least 0.5 and
+    tied when it is within 0.5 of zero
+    Percentages are ratios of makes to attempts, with variances from the delta method. They are never tied
+
+Matchup results are combined from category results with calculate_majority_probability(), the dynamic-programming
+form of combinatorial_calculation(), under the tie rules of run_multiple_seasons(). Each team's season point total
+is then a sum of independent weekly results over the schedule, and season winner shares are calculated from those
+distributions, treating teams' totals as independent. Ties between teams with the most points are split evenly,
+without the tiebreaker on tied weeks that the simulation uses
+
+Since season week numbers continue from season to season, seasons start at different points of the schedule when
+it does not divide evenly into seasons. Estimates are averaged over every starting point, as simulations are
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from src.helper_functions import calculate_majority_probability
+from src.simulation import PERCENTAGE_CATEGORIES, prepare_season_simulation, get_detailed_results
+
+def get_team_moments(simulation):
+    """Calculates the means and covariances of each team's weekly stat totals
+
+    Each player's week is drawn uniformly from their real weeks, independently of other players, so team moments
+    are sums of player moments
+
+    Args:
+        simulation: dictionary from prepare_season_simulation()
+
+    Returns:
+        Tuple of (team x stat array of means, team x stat x stat array of covariances)
+    """
+    season_array = simulation['season_array']
+    counts = simulation['counts']
+    in_sample = (np.arange(season_array.shape[1]) < counts[:, None])[..., None]
+
+    player_means = (season_array * in_sample).sum(axis = 1)/counts[:, None]
+    deviations = (season_array - player_means[:, None, :]) * in_sample
+    player_covariances = np.einsum('pws,pwt->pst', deviations, deviations)/counts[:, None, None]
+
+    team_starts = simulation['team_starts']
+    return np.add.reduceat(player_means, team_starts, axis = 0), np.add.reduceat(player_covariances, team_starts, axis = 0)
+
+def get_category_moments(team_means
+                         , team_covariances
+                         , stats
+                         , categories):
+    """Converts team stat moments into the means and variances of category values, as get_category_values() defines them
+
+    Returns:
+        Tuple of (team x category array of means, team x category array of variances)
+    """
+    stat_positions = {stat : i for i, stat in enumerate(stats)}
+    means, variances = [], []
+    for category in categories:
+        if category in PERCENTAGE_CATEGORIES:
+            makes, attempts = [stat_positions[stat] for stat in PERCENTAGE_CATEGORIES[category]]
+            makes_mean, attempts_mean = team_means[:, makes], team_means[:, attempts]
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                ratio = np.where(attempts_mean > 0, makes_mean/attempts_mean, 0)
+                #delta method, with gradient (1/attempts, -makes/attempts^2) of makes/attempts
+                variance = (team_covariances[:, makes, makes] - 2 * ratio * team_covariances[:, makes, attempts] \
+                                + ratio**2 * team_covariances[:, attempts, attempts])/attempts_mean**2
+            means.append(ratio)
+            variances.append(np.where(attempts_mean > 0, variance, 0))
+        else:
+            position = stat_positions[category]
+            means.append(- team_means[:, position] if category == 'tov' else team_means[:, position])
+            variances.append(team_covariances[:, position, position])
+    return np.stack(means, axis = -1), np.stack(variances, axis = -1)
+
+def get_category_probabilities(category_means
+                               , category_variances
+                               , categories):
+    """Calculates the probabilities of each team winning and tying each category against each other team
+
+    Returns:
+        Tuple of (team x opponent x category array of win probabilities, same for tie probabilities)
+    """
+    difference_means = category_means[:, None, :] - category_means[None, :, :]
+    difference_sds = np.sqrt(category_variances[:, None, :] + category_variances[None, :, :])
+    #integer differences are tied within 0.5 of zero. Ratios have no margin
+    margin = np.array([0 if category in PERCENTAGE_CATEGORIES else 0.5 for category in categories])
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        upper = np.where(difference_sds > 0, (difference_means - margin)/difference_sds
+                         , np.where(difference_means > margin, np.inf, -np.inf))
+        lower = np.where(difference_sds > 0, (difference_means + margin)/difference_sds
+                         , np.where(difference_means >= - margin, np.inf, -np.inf))
+    win_probabilities = ndtr(upper)
+    tie_probabilities = ndtr(lower) - win_probabilities
+    return win_probabilities, tie_probabilities
+
+def get_count_distribution(probabilities):
+    """Calculates the distribution of the number of successes of independent events, along the last axis
+
+    Returns:
+        Array with the leading shape of probabilities, and entry k along the last axis the probability of k successes
+    """
+    n_events = probabilities.shape[-1]
+    distribution = np.zeros(probabilities.shape[:-1] + (n_events + 1,))
+    distribution[..., 0] = 1
+    for i in range(n_events):
+        p = probabilities[..., i:(i + 1)]
+        distribution[..., 1:] = distribution[..., 1:] * (1 - p) + distribution[..., :-1] * p
+        distribution[..., 0:1] = distribution[..., 0:1] * (1 - p)
+    return distribution
+
+def get_season_point_distributions(week_point_distributions
+                                   , schedule
+                                   , first_week
+                                   , n_weeks):
+    """Convolves weekly point distributions over a season
+
+    Args:
+        week_point_distributions: team x opponent x points array of each team's weekly point distribution
+        schedule: (week x team) array of opponent team positions
+        first_week: week of the schedule the season starts on
+        n_weeks: number of weeks per season
+
+    Returns:
+        team x points array of season point distributions
+    """
+    n_teams, _, n_points = week_point_distributions.shape
+    teams = np.arange(n_teams)
+    season_distribution = np.zeros((n_teams, (n_points - 1) * n_weeks + 1))
+    season_distribution[:, 0] = 1
+    for week in range(n_weeks):
+        opponents = schedule[(first_week + week) % len(schedule)]
+        week_distribution = week_point_distributions[teams, opponents]
+        new_distribution = np.zeros_like(season_distribution)
+        for points in range(n_points):
+            new_distribution[:, points:] += season_distribution[:, :season_distribution.shape[1] - points] \
+                                                * week_distribution[:, points:(points + 1)]
+        season_distribution = new_distribution
+    return season_distribution
+
+def get_winner_shares(season_distributions):
+    """Calculates each team's expected share of season wins from independent season point distributions
+
+    A team wins outright when every other team has fewer points. With ties for the most points, the win is split
+    evenly between the tied teams
+
+    Args:
+        season_distributions: team x points array of season point distributions
+
+    Returns:
+        Array of expected winner shares, one per team
+    """
+    below = np.cumsum(season_distributions, axis = 1) - season_distributions
+    n_teams = len(season_distributions)
+    shares = np.zeros(n_teams)
+    for i in range(n_teams):
+        #coefficient m of the product over other teams of (below + at * t) is the probability that every other team
+        #has at most k points and exactly m of them have k. The tied teams split the win, so m contributes 1/(m + 1)
+        coefficients = np.zeros((season_distributions.shape[1], n_teams))
+        coefficients[:, 0] = 1
+        for j in range(n_teams):
+            if j != i:
+                coefficients[:, 1:] = coefficients[:, 1:] * below[j, :, None] \
+                                        + coefficients[:, :-1] * season_distributions[j, :, None]
+                coefficients[:, 0] = coefficients[:, 0] * below[j]
+        shares[i] = season_distributions[i] @ (coefficients @ (1/np.arange(1, n_teams + 1)))
+    return shares
+
+def estimate_multiple_seasons(teams
+                              , season_df
+                              , categories
+                              , n_weeks = 25
+                              , winner_take_all = True
+                              , return_detailed_results = False
+                              , schedule = None):
+    """Estimates season outcomes analytically, with the same arguments and outputs as run_multiple_seasons()
+
+    Args:
+        teams: player assignment dict, as produced by the run_draft() function
+        season_df: dataframe of weekly numbers per players
+        categories: list of categories
+        n_weeks: number of weeks per season
+        winner_take_all: If True, the winner of a majority of categories in a week gets a point.
+                         If false, each player gets a point for each category won
+        return_detailed_results: If True, also return expected category win and tie rates
+        schedule: (week x team) array of opponent team numbers. Defaults to a round robin schedule
+
+    Returns:
+        Series of estimated winning fractions with the structure
+         team_number : winning_fraction
+        and, if return_detailed_results is True, a dataframe of category results like get_detailed_results() makes
+    """
+    simulation = prepare_season_simulation(teams, season_df, categories, n_weeks, schedule)
+    team_numbers = simulation['team_numbers']
+    schedule = simulation['schedule']
+
+    category_means, category_variances = get_category_moments(*get_team_moments(simulation)
+                                                              , simulation['stats']
+                                                              , categories)
+    win_probabilities, tie_probabilities = get_category_probabilities(category_means, category_variances, categories)
+
+    if winner_take_all:
+        n_teams, _, n_categories = win_probabilities.shape
+        matchup_wins, _ = calculate_majority_probability(win_probabilities.reshape(-1, n_categories)
+                                                         , tie_probabilities.reshape(-1, n_categories))
+        matchup_wins = matchup_wins.reshape(n_teams, n_teams)
+        week_point_distributions = np.stack([1 - matchup_wins, matchup_wins], axis = -1)
+    else:
+        week_point_distributions = get_count_distribution(win_probabilities)
+
+    #seasons start at each of these weeks of the schedule equally often
+    first_weeks = np.unique((np.arange(len(schedule)) * n_weeks) % len(schedule))
+    shares = np.mean([get_winner_shares(get_season_point_distributions(week_point_distributions
+                                                                       , schedule
+                                                                       , first_week
+                                                                       , n_weeks))
+                      for first_week in first_weeks], axis = 0)
+
+    wins_by_teams = pd.Series(shares/shares.sum()
+                              , index = pd.Index(team_numbers, name = 'team')
+                              , name = 'winner_points_adjusted')
+    if not return_detailed_results:
+        return wins_by_teams
+
+    #expected category results, summed over one pass through the schedule per starting week
+    teams = np.arange(len(team_numbers))
+    weeks = (first_weeks[:, None] + np.arange(n_weeks)).ravel() % len(schedule)
+    opponents = schedule[weeks]
+    cat_wins = win_probabilities[teams, opponents].sum(axis = 0)
+    cat_ties = tie_probabilities[teams, opponents].sum(axis = 0)
+    return wins_by_teams, get_detailed_results(cat_wins, cat_ties, len(weeks), team_numbers, categories)
@@ -0,0 +1,131 @@
+"""On-disk store for the weekly season data prepared by setup()
+
+Each season is saved to its own directory as a set of .npy files plus a small json file of metadata:
+
+    values.npy: (player-week x stat) array of weekly numbers, in the row order of season_df
+    players.npy, weeks.npy: the unique players and weeks. season_df's index is their product, in that order
+    position_players.npy, position_values.npy: the index and values of the positions series, which are either
+        position strings or encoded signatures
+    meta.json: column names, dtypes, and the fingerprint of the source files the store was built from
+
+The fingerprint holds the size and modification time of each source file, so a store is rebuilt automatically
+when one of its source files changes
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 1
+
+def get_source_fingerprint(source_paths):
+    """Summarizes the size and modification time of each source file
+
+    Args:
+        source_paths: list of file paths
+
+    Returns:
+        List of [path, size in bytes, modification time in nanoseconds] lists, which is json serializable
+    """
+    fingerprint = []
+    for path in source_paths:
+        stat = os.stat(path)
+        fingerprint.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+def save_season_store(store_path
+                      , season_df
+                      , positions
+                      , fingerprint):
+    """Writes a season's weekly dataframe and positions to a store directory
+
+    The store is written to a uniquely named temporary directory first and then moved into place, so a partially
+    written store is never loaded. Several processes can build the same store at once; if another process moves its
+    store into place first, that store is kept
+
+    Args:
+        store_path: directory to save the store to
+        season_df: dataframe of weekly numbers per player, indexed by the full product of players and weeks
+        positions: series of position strings, indexed by player
+        fingerprint: fingerprint of the source files, from get_source_fingerprint()
+    """
+    players = season_df.index.levels[0][season_df.index.codes[0]].unique()
+    weeks = season_df.index.levels[1][season_df.index.codes[1]].unique()
+    if len(season_df) != len(players) * len(weeks):
+        raise ValueError('season_df needs to be indexed by the full product of players and weeks')
+
+    parent_path = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(parent_path, exist_ok = True)
+    tmp_path = tempfile.mkdtemp(prefix = os.path.basename(store_path) + '.', suffix = '.tmp', dir = parent_path)
+
+    try:
+        np.save(os.path.join(tmp_path, 'values.npy'), season_df.values)
+        np.save(os.path.join(tmp_path, 'players.npy'), np.array(players, dtype = str))
+        np.save(os.path.join(tmp_path, 'weeks.npy'), np.array(weeks, dtype = np.int64))
+        np.save(os.path.join(tmp_path, 'position_players.npy'), np.array(positions.index, dtype = str))
+        if pd.api.types.is_integer_dtype(positions.dtype):
+            np.save(os.path.join(tmp_path, 'position_values.npy'), positions.values.astype(np.int64))
+        else:
+            np.save(os.path.join(tmp_path, 'position_values.npy'), np.array(positions.fillna(''), dtype = str))
+
+        meta = {'version' : STORE_VERSION
+                ,'columns' : list(season_df.columns)
+                ,'index_names' : list(season_df.index.names)
+                ,'week_dtype' : str(weeks.dtype)
+                ,'positions_name' : positions.name
+                ,'positions_index_name' : positions.index.name
+                ,'fingerprint' : fingerprint}
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(store_path, ignore_errors = True)
+        try:
+            os.replace(tmp_path, store_path)
+        except OSError:
+            #another process moved the same store into place between the rmtree and the replace
+            if not os.path.isfile(os.path.join(store_path, 'meta.json')):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors = True)
+
+def load_season_store(store_path
+                      , fingerprint = None):
+    """Loads a season's weekly dataframe and positions from a store directory
+
+    Args:
+        store_path: directory the store was saved to
+        fingerprint: optional fingerprint of the current source files. If it does not match the fingerprint the
+                     store was built from, the store is considered stale
+
+    Returns:
+        Tuple of (season_df, positions), or None if the store does not exist or is stale
+    """
+    meta_path = os.path.join(store_path, 'meta.json')
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta['version'] != STORE_VERSION or (fingerprint is not None and meta['fingerprint'] != fingerprint):
+        return None
+
+    players = np.load(os.path.join(store_path, 'players.npy')).astype(object)
+    weeks = pd.array(np.load(os.path.join(store_path, 'weeks.npy')), dtype = meta['week_dtype'])
+    index = pd.MultiIndex.from_product([players, weeks], names = meta['index_names'])
+    season_df = pd.DataFrame(np.load(os.path.join(store_path, 'values.npy'))
+                             , index = index
+                             , columns = meta['columns'])
+
+    #positions are either encoded signatures, or strings with missing values saved as ''
+    position_values = np.load(os.path.join(store_path, 'position_values.npy'))
+    if position_values.dtype.kind == 'U':
+        position_values = position_values.astype(object)
+        position_values[position_values == ''] = np.nan
+    positions = pd.Series(position_values
+                          , index = pd.Index(np.load(os.path.join(store_path, 'position_players.npy')).astype(object)
+                                             , name = meta['positions_index_name'])
+                          , name = meta['positions_name'])
+    return season_df, positions
@@ -1,41 +1,410 @@
-from src.helper_functions import round_robin_opponent
+from src.schedule import get_round_robin_schedule
+from src.instrumentation import get_profiler, stage
+import time
 import numpy as np
 import pandas as pd
+from functools import reduce
+
+class DraftBoard():
+    """Shared record of which players have been taken during a draft
+
+    Player names are mapped to integer ids once, when the board is created. Availability is then a boolean
+    array indexed by id, which agents can read through a zero-copy, read-only view. Picks can be taken and 
+    undone in O(1) time, which search-based strategies need to explore hypothetical picks
+
+    Attributes:
+        players: Index of all draftable players. Each player's position in the index is their id
+        available: read-only view of the availability array. True if the player has not been taken
+        pick_log: list of (player id, team number) tuples, in pick order
+    """
+    def __init__(self
+                 , players
+                 , available = None):
+        """Sets up the board
+
+        Args:
+            players: names of all draftable players
+            available: optional boolean array to hold availability in, e.g. one row of an array shared by many boards
+        """
+        self.players = pd.Index(players)
+        if available is None:
+            available = np.ones(len(self.players), dtype = bool)
+        self._available = available
+        self.available = self._available.view()
+        self.available.flags.writeable = False
+        self.pick_log = []
+
+    def get_ids(self
+                , players):
+        """Converts player names to ids. Players who are not on the board get id -1"""
+        return self.players.get_indexer(players)
+
+    def get_id(self
+               , player):
+        """Converts a single player name to an id"""
+        return self.players.get_loc(player)
+
+    def take(self
+             , player_id
+             , team):
+        """Marks a player as taken by a team
+
+        Raises:
+            ValueError if the player was already taken
+        """
+        if not self._available[player_id]:
+            raise ValueError(str(self.players[player_id]) + ' has already been taken')
+        self._available[player_id] = False
+        self.pick_log.append((player_id, team))
+
+    def undo(self):
+        """Reverts the most recent pick
+
+        Returns:
+            (player id, team number) tuple of the reverted pick
+        """
+        player_id, team = self.pick_log.pop()
+        self._available[player_id] = True
+        return player_id, team
+
+    def get_player_assignments(self):
+        """Returns the picks so far as a dictionary of {'player name' : team_number}"""
+        return {self.players[player_id] : team for player_id, team in self.pick_log}
+
+def get_snake_order(n_teams
+                    , n_rounds):
+    """Lists the team number making each pick of a snake draft, like 0 -> 1 -> 2 -> 2 -> 1 -> 0 -> 0 -> 1 etc."""
+    return [j if i % 2 == 0 else n_teams - 1 - j for i in range(n_rounds) for j in range(n_teams)]
+
+def get_player_universe(agents):
+    """Combines the candidates of all agents into one index of draftable players"""
+    #copies of an agent share a model token and the same candidates, so they only need to be included once
+    candidates = {getattr(agent, 'model_token', id(agent)) : agent.candidates for agent in agents}
+    return reduce(lambda x, y: x.union(y), candidates.values())
 
 def run_draft(agents
-              , n_rounds):
+              , n_rounds
+              , draft_board = None):
     """Run a snake draft
 
     Snake drafts wrap around like 1 -> 2 -> 3 -> 3 -> 2 -> 1 -> 1 -> 2 -> 3 etc. 
     
     Args:
-        agents: list of Agents, which are required to have make_pick() methods
+        agents: list of Agents, which are required to have make_pick() methods that take a DraftBoard
         n_rounds: number of rounds to do of the snake draft. Each drafter will get n_rounds * 2 players
+        draft_board: optional DraftBoard to draft on. By default, a new board is made with all players that any
+                     of the agents can pick
         
     Returns:
         dictionary of player assignments with the structure
          {'player name' : team_number } 
     """
     
-    player_assignments = {}
+    if draft_board is None:
+        draft_board = DraftBoard(get_player_universe(agents))
     
-    for i in range(n_rounds):
-        
-        if i % 2 ==0:
-            for j in range(len(agents)):
+    profiler = get_profiler()
+    for pick_number, j in enumerate(get_snake_order(len(agents), n_rounds)):
+        if profiler is None:
+            chosen_player = agents[j].make_pick(draft_board)
+        else:
+            #picks are timed individually, with the eligibility checks the agent makes along the way
+            eligibility_checks = profiler.counters['eligibility_checks']
+            start = time.perf_counter()
+            chosen_player = agents[j].make_pick(draft_board)
+            profiler.record(type(agents[j]).__name__, 'pick', start, time.perf_counter() - start
+                            , {'pick' : pick_number
+                               ,'team' : j
+                               ,'eligibility_checks' : profiler.counters['eligibility_checks'] - eligibility_checks})
+        draft_board.take(draft_board.get_id(chosen_player), j)
 
-                agent = agents[j]
-                chosen_player = agent.make_pick(player_assignments)
-                player_assignments[chosen_player] = j
+    return draft_board.get_player_assignments()
+
+def run_drafts(agent_lists
+               , n_rounds):
+    """Run many independent snake drafts in lockstep
+
+    All drafts advance one pick at a time together. At each pick, agents that have a get_batch_scores() method 
+    (PAgent and HAgent) and share the same model data are grouped, and their candidates are scored for all drafts 
+    with one vectorized call. Other agents make their picks draft by draft. The availability of all draft boards 
+    is held in one stacked array
+    
+    Args:
+        agent_lists: list of lists of Agents, one list per draft. Every draft must have the same number of agents
+        n_rounds: number of rounds to do of each snake draft
         
+    Returns:
+        list of dictionaries of player assignments, one per draft, with the structure
+         {'player name' : team_number } 
+    """
+    n_teams = len(agent_lists[0])
+    players = get_player_universe([agent for agents in agent_lists for agent in agents])
+    available = np.ones((len(agent_lists), len(players)), dtype = bool)
+    draft_boards = [DraftBoard(players, available[d]) for d in range(len(agent_lists))]
+
+    for j in get_snake_order(n_teams, n_rounds):
+        #group the drafts by which agents can be batched together for this pick
+        groups = {}
+        for d, agents in enumerate(agent_lists):
+            agent = agents[j]
+            key = agent.batch_key if hasattr(agent, 'get_batch_scores') else ('single', d)
+            groups.setdefault(key, []).append(d)
+
+        for key, draft_numbers in groups.items():
+            agents = [agent_lists[d][j] for d in draft_numbers]
+            boards = [draft_boards[d] for d in draft_numbers]
+            if key[0] == 'single':
+                chosen_players = [agents[0].make_pick(boards[0])]
+            else:
+                chosen_players = type(agents[0]).make_batch_picks(agents, boards)
+
+            for draft_board, chosen_player in zip(boards, chosen_players):
+                draft_board.take(draft_board.get_id(chosen_player), j)
+
+    return [draft_board.get_player_assignments() for draft_board in draft_boards]
+
+PERCENTAGE_CATEGORIES = {'fg_pct' : ('fg','fga'), 'ft_pct' : ('ft','fta')}
+
+def get_full_product_shape(season_df):
+    """Checks if a season dataframe has one row for every player and week, in player-major order, as setup() makes
+
+    Returns:
+        Tuple of (index of players in row order, number of weeks), or (None, None) if the rows are not a full product
+    """
+    codes = season_df.index.codes
+    if len(codes) != 2 or len(season_df) == 0:
+        return None, None
+
+    player_codes, week_codes = codes
+    n_players = len(pd.unique(player_codes))
+    n_weeks = len(season_df) // n_players
+    if n_players * n_weeks != len(season_df):
+        return None, None
+
+    player_codes = player_codes.reshape(n_players, n_weeks)
+    week_codes = week_codes.reshape(n_players, n_weeks)
+    if np.any(player_codes != player_codes[:, [0]]) or np.any(week_codes != week_codes[[0]]) \
+            or len(pd.unique(week_codes[0])) != n_weeks:
+        return None, None
+
+    return season_df.index.levels[0][player_codes[:, 0]], n_weeks
+
+def get_season_array(season_df
+                     , players
+                     , stats):
+    """Converts weekly data for a set of players into a dense (player x week x stat) array
+
+    Args:
+        season_df: dataframe of weekly numbers per player, indexed by player
+        players: list of players to include
+        stats: list of columns to include
+
+    Returns:
+        Tuple of (array of weekly stats, zero-padded for players with fewer weeks, array of the number of weeks 
+        available for each player)
+    """
+    season_players, n_weeks = get_full_product_shape(season_df)
+    if season_players is not None:
+        #every player has a row for every week, so the values are already a (player x week x stat) block. Frames
+        #with one dtype, like those of a StatCube, give a view of their values, and selecting columns would copy
+        #all of them, so only the requested players and then stats are gathered
+        values = season_df.values.reshape(len(season_players), n_weeks, len(season_df.columns))
+        player_codes = season_players.get_indexer(players)
+        season_array = values[player_codes][:, :, season_df.columns.get_indexer(stats)]
+        season_array = np.where((player_codes >= 0)[:, None, None], season_array, 0).astype(float)
+        return season_array, np.where(player_codes >= 0, n_weeks, 0)
+
+    player_values = season_df.index.get_level_values('player')
+    player_codes = pd.Index(players).get_indexer(player_values)
+    in_players = player_codes >= 0
+    player_codes = player_codes[in_players]
+    values = season_df.loc[in_players, stats].values.astype(float)
+
+    #rows are placed in order of appearance within each player 
+    order = np.argsort(player_codes, kind = 'stable')
+    counts = np.bincount(player_codes, minlength = len(players))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    week_positions = np.arange(len(order)) - np.repeat(starts, counts)
+
+    season_array = np.zeros((len(players), max(counts.max(), 1), len(stats)))
+    season_array[player_codes[order], week_positions] = values[order]
+    return season_array, counts
+
+def get_category_values(team_totals
+                        , stats
+                        , categories):
+    """Calculates category values from summed team stats, along the last axis
+
+    Percentage categories are ratios of their makes and attempts, or 0 with no attempts. Turnovers are inverted 
+    because for all other categories, higher numbers are better 
+    """
+    stat_positions = {stat : i for i, stat in enumerate(stats)}
+    category_values = []
+    for category in categories:
+        if category in PERCENTAGE_CATEGORIES:
+            makes, attempts = [team_totals[..., stat_positions[stat]] for stat in PERCENTAGE_CATEGORIES[category]]
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                category_values.append(np.where(attempts > 0, makes/attempts, 0))
+        elif category == 'tov':
+            category_values.append(- team_totals[..., stat_positions[category]])
         else:
-           
-            for j in reversed(range(len(agents))):
-                agent = agents[j]
-                chosen_player = agent.make_pick(player_assignments)
-                player_assignments[chosen_player] = j
+            category_values.append(team_totals[..., stat_positions[category]])
+    return np.stack(category_values, axis = -1)
+
+def simulate_season_chunk(season_array
+                          , counts
+                          , team_starts
+                          , schedule
+                          , first_season
+                          , n_seasons
+                          , n_weeks
+                          , stats
+                          , categories
+                          , winner_take_all
+                          , rng):
+    """Simulates a chunk of seasons from a dense season array
+
+    Args:
+        season_array: (player x week x stat) array from get_season_array(), with players sorted by team
+        counts: number of weeks available for each player
+        team_starts: position of each team's first player in season_array
+        schedule: (week x team) array of opponent team positions. Weeks are numbered continuously across seasons,
+                  and the schedule repeats once all of its weeks are used
+        first_season: number of the first season in the chunk 
+        n_seasons: number of seasons to simulate
+        n_weeks: number of weeks per season
+        stats: names of the stats in season_array
+        categories: list of categories
+        winner_take_all: If True, the winner of a majority of categories in a week gets a point.
+                         If false, each player gets a point for each category won 
+        rng: numpy random Generator
+
+    Returns:
+        Tuple of (season x team array of season winner points, season x team x category array of category wins 
+        summed over weeks, season x team x category array of category ties summed over weeks)
+    """
+    n_players = len(counts)
+
+    #each player's weekly performance is sampled independently from their real weeks
+    with stage('sampling', 'simulation'):
+        week_samples = rng.integers(0, counts, size = (n_seasons, n_weeks, n_players))
+        performances = season_array[np.arange(n_players), week_samples]
+
+    #total team performances are simply the sum of statistics for each player 
+    with stage('aggregation', 'simulation'):
+        team_totals = np.add.reduceat(performances, team_starts, axis = 2)
+        team_performances = get_category_values(team_totals, stats, categories)
+
+    #gather each team's opponent for every week
+    with stage('opponent_lookup', 'simulation'):
+        week_numbers = (first_season + np.arange(n_seasons))[:, None] * n_weeks + np.arange(n_weeks)
+        opponents = schedule[week_numbers % len(schedule)]
+        opposing_team_performances = np.take_along_axis(team_performances, opponents[..., None], axis = 2)
+
+    with stage('winner_resolution', 'simulation'):
+        cat_wins = team_performances > opposing_team_performances
+        cat_ties = team_performances == opposing_team_performances
 
-    return player_assignments
+        tot_cat_wins = cat_wins.sum(axis = 3)
+        tot_cat_ties = cat_ties.sum(axis = 3)
+
+        if winner_take_all:
+            ties = tot_cat_wins + tot_cat_ties/2 == len(categories)/2
+            wins = tot_cat_wins + tot_cat_ties/2 > len(categories)/2
+        else:
+            ties = tot_cat_ties
+            wins = tot_cat_wins
+
+        season_wins = wins.sum(axis = 1)
+        season_ties = ties.sum(axis = 1)
+
+        #a team cannot win the season if it has fewer wins than any other team 
+        #among the teams with the most wins, ties are a tiebreaker 
+        winners = season_wins == season_wins.max(axis = 1, keepdims = True)
+        winner_ties = np.where(winners, season_ties, -1)
+        winners = winners & (winner_ties == winner_ties.max(axis = 1, keepdims = True))
+
+        #assuming that payouts are divided when multiple teams are exactly tied, we give fractional points 
+        winner_points = winners/winners.sum(axis = 1, keepdims = True)
+
+    return winner_points, cat_wins.sum(axis = 1), cat_ties.sum(axis = 1)
+
+def prepare_season_simulation(teams
+                              , season_df
+                              , categories
+                              , n_weeks
+                              , schedule = None):
+    """Sets up the arrays needed to simulate seasons for a set of teams
+
+    Args:
+        teams: player assignment dict, as produced by the run_draft() function
+        season_df: dataframe of weekly numbers per players
+        categories: list of categories
+        n_weeks: number of weeks per season
+        schedule: (week x team) array of opponent team numbers, e.g. from the schedule module. 
+                  Defaults to a round robin schedule between the teams in order of team number, in which case
+                  team numbers can be any labels
+
+    Returns:
+        Dictionary of arguments for simulate_season_chunk(), plus the team numbers in order
+    """
+    stats = [c for c in categories if c not in PERCENTAGE_CATEGORIES] + \
+                [stat for c in categories if c in PERCENTAGE_CATEGORIES for stat in PERCENTAGE_CATEGORIES[c]]
+
+    #players are sorted by team so that team totals are sums over contiguous blocks
+    team_players = pd.Series(teams)
+    team_players = team_players[team_players.index.isin(season_df.index.get_level_values('player'))]
+    team_players = team_players.sort_values(kind = 'stable')
+    team_numbers, team_starts = np.unique(team_players.values, return_index = True)
+
+    season_array, counts = get_season_array(season_df, team_players.index, stats)
+
+    if schedule is None:
+        #the default schedule pairs up positions in the team arrays directly, so team numbers can be any labels
+        if len(team_numbers) % 2 != 0:
+            raise ValueError('The default round robin schedule needs an even number of teams with players, not ' \
+                                + str(len(team_numbers)) + '. Pass a schedule to simulate other leagues')
+        schedule = get_round_robin_schedule(len(team_numbers))
+    else:
+        #a given schedule is in terms of team numbers. We translate it to positions in the team arrays
+        schedule = np.asarray(schedule)
+        if np.any(team_numbers < 0) or np.any(team_numbers >= schedule.shape[1]):
+            raise ValueError('A schedule with ' + str(schedule.shape[1]) + ' teams needs team numbers from 0 to ' \
+                                + str(schedule.shape[1] - 1))
+        team_positions = np.full(schedule.shape[1], -1)
+        team_positions[team_numbers] = np.arange(len(team_numbers))
+        schedule = team_positions[schedule[:, team_numbers]]
+        if np.any(schedule < 0):
+            raise ValueError('The schedule includes opponents which do not have any players')
+
+    return {'season_array' : season_array
+            ,'counts' : counts
+            ,'team_starts' : team_starts
+            ,'schedule' : schedule
+            ,'n_weeks' : n_weeks
+            ,'stats' : stats
+            ,'categories' : categories
+            ,'team_numbers' : team_numbers}
+
+def get_default_chunk_size(simulation):
+    """Picks a number of seasons per chunk so that sampled performances hold about five million values"""
+    season_array = simulation['season_array']
+    return max(1, int(5e6 // (simulation['n_weeks'] * season_array.shape[0] * season_array.shape[2])))
+
+def simulate_chunks(simulation
+                    , n_seasons
+                    , chunk_size
+                    , winner_take_all
+                    , rng):
+    """Yields the results of simulate_season_chunk() for consecutive chunks adding up to n_seasons seasons"""
+    team_numbers = simulation['team_numbers']
+    chunk_args = {k : v for k, v in simulation.items() if k != 'team_numbers'}
+    for chunk_start in range(0, n_seasons, chunk_size):
+        yield simulate_season_chunk(first_season = chunk_start
+                                    , n_seasons = min(chunk_size, n_seasons - chunk_start)
+                                    , winner_take_all = winner_take_all
+                                    , rng = rng
+                                    , **chunk_args)
 
 def run_multiple_seasons(teams
                          , season_df
@@ -43,12 +412,20 @@ def run_multiple_seasons(teams
                          , n_seasons = 100 
                          , n_weeks = 25
                          , winner_take_all = True
-                         , return_detailed_results = False ):
+                         , return_detailed_results = False
+                         , seed = None
+                         , chunk_size = None
+                         , schedule = None
+                         , analytic = False):
     """Simulate multiple seasons with the same drafters 
     
     Weekly performances are sampled from a dataframe of real season performance
     Teams win weeks by winning more categories than their opponents. They win seasons by winning the
     most weeks of all players 
+
+    Each team's weekly data is held in a dense (player x week x stat) array. Seasons are simulated in chunks by 
+    drawing sample indices, gathering them, and summing players into teams, so memory use is bounded by the chunk 
+    size rather than the number of seasons
     
     Args:
         teams: player assignment dict, as produced by the run_draft() functoin
@@ -58,82 +435,212 @@ def run_multiple_seasons(teams
         winner_take_all: If True, the winner of a majority of categories in a week gets a point.
                          If false, each player gets a point for each category won 
         return_cat_results: If True, return detailed results on category wins 
+        seed: seed or numpy random Generator for sampling
+        chunk_size: number of seasons to simulate at a time. By default, chunks hold about five million values
+        schedule: (week x team) array of opponent team numbers. Defaults to a round robin schedule
+        analytic: If True, estimate the results with normal approximations instead of simulating, which takes
+                  milliseconds. See season_estimates.estimate_multiple_seasons(). n_seasons, seed and chunk_size 
+                  are then ignored
         
     Returns:
         Series of winning percentages with the structure
          team_number : winning_fraction  
     """
-    #create a version of the essential info dataframe which incorporate team information for this season
-    season_df = season_df.reset_index().drop(columns = 'week')
-    season_df.loc[:,'team'] = season_df['player'].map(teams) 
-    season_df = season_df.dropna(subset = ['team'])
-
-    #use sampling to simulate many seasons at the same time
-    #assuming each season has 11 weeks, we need 11 * n total rows of data per player
-    #ZR: Note that for now a "week" of data is just one game per player
-    #in real basketball multiple games are played per week, so we need to adjust for that 
-    performances = season_df.groupby('player').sample(n_weeks*n_seasons, replace = True)
-    performances.loc[:,'week'] = performances.groupby('player').cumcount()
-    performances.loc[:,'season'] = performances['week'] // n_weeks #integer division seperates weeks in groups 
+    if analytic:
+        from src.season_estimates import estimate_multiple_seasons
+        return estimate_multiple_seasons(teams
+                                         , season_df
+                                         , categories
+                                         , n_weeks = n_weeks
+                                         , winner_take_all = winner_take_all
+                                         , return_detailed_results = return_detailed_results
+                                         , schedule = schedule)
 
-    #total team performances are simply the sum of statistics for each player 
-    team_performances = performances.groupby(['season','team','week']).sum()
-    team_performances['fg_pct'] = (team_performances['fg']/team_performances['fga']).fillna(0)
-    team_performances['ft_pct'] = (team_performances['ft']/team_performances['fta']).fillna(0)
-    
-    #for all categories except turnovers, higher numbers are better. So we invert turnovers 
-    team_performances['tov'] = - team_performances['tov'] 
-    
-    team_performances = team_performances[categories] #only want category columns
-    
-    #we need to map each team to its opponent for the week. We do that with a formula for round robin pairing
-    opposing_team_schedule = [(s,round_robin_opponent(t,w),w) for s, t, w in team_performances.index]
-    opposing_team_performances = team_performances.loc[opposing_team_schedule]
+    rng = np.random.default_rng(seed)
+    simulation = prepare_season_simulation(teams, season_df, categories, n_weeks, schedule)
+    team_numbers = simulation['team_numbers']
 
-    cat_wins = np.greater(team_performances.values,opposing_team_performances.values)
-    cat_ties = np.equal(team_performances.values,opposing_team_performances.values)
-    
-    tot_cat_wins = cat_wins.sum(axis = 1)
-    tot_cat_ties = cat_ties.sum(axis = 1)
-    
-    if winner_take_all:
-        team_performances.loc[:,'tie'] = tot_cat_wins + tot_cat_ties/2 == len(categories)/2
-        team_performances.loc[:,'win'] = tot_cat_wins + tot_cat_ties/2 > len(categories)/2
-    else:
-        team_performances.loc[:,'tie'] = tot_cat_ties
-        team_performances.loc[:,'win'] = tot_cat_wins
-        
-    team_results = team_performances.groupby(['team','season']).agg({'win' : sum, 'tie' : sum})
+    if chunk_size is None:
+        chunk_size = get_default_chunk_size(simulation)
 
-    #a team cannot win the season if it has fewer wins than any other team 
-    most_wins = team_results.groupby('season')['win'].transform('max')
-    winners = team_results[team_results['win'] == most_wins]
+    winner_points = np.zeros(len(team_numbers))
+    cat_wins = np.zeros((len(team_numbers), len(categories)))
+    cat_ties = np.zeros((len(team_numbers), len(categories)))
 
-    #among the teams with the most wins, ties are a tiebreaker 
-    most_ties = winners.groupby('season')['tie'].transform('max')
-    winners_after_ties = winners[winners['tie'] == most_ties]
-    
-    #assuming that payouts are divided when multiple teams are exactly tied, we give fractional points 
-    winners_after_ties.loc[:,'winner_points'] = 1
-    season_counts = winners_after_ties.groupby('season')['winner_points'].transform('count')
-    winners_after_ties.loc[:,'winner_points_adjusted'] = 1/season_counts
-    
-    wins_by_teams = winners_after_ties.groupby('team')['winner_points_adjusted'].sum()/winners_after_ties['winner_points_adjusted'].sum()
+    for chunk_winner_points, chunk_cat_wins, chunk_cat_ties in simulate_chunks(simulation
+                                                                               , n_seasons
+                                                                               , chunk_size
+                                                                               , winner_take_all
+                                                                               , rng):
+        winner_points += chunk_winner_points.sum(axis = 0)
+        cat_wins += chunk_cat_wins.sum(axis = 0)
+        cat_ties += chunk_cat_ties.sum(axis = 0)
+
+    wins_by_teams = pd.Series(winner_points/winner_points.sum()
+                              , index = pd.Index(team_numbers, name = 'team')
+                              , name = 'winner_points_adjusted')
+    wins_by_teams = wins_by_teams[winner_points > 0]
     
     if not return_detailed_results:
         return wins_by_teams
     else:
-        cat_win_df = pd.DataFrame(cat_wins, columns = categories, index = team_performances.index)
-        cat_tie_df = pd.DataFrame(cat_ties, columns = categories, index = team_performances.index)
-        
-        cat_wins_agg = cat_win_df.groupby('team').mean()
-        cat_wins_agg = pd.concat({'win' : cat_wins_agg}, names = ['result'])
+        return wins_by_teams, get_detailed_results(cat_wins, cat_ties, n_seasons * n_weeks, team_numbers, categories)
+
+def get_standard_errors(sums
+                        , sums_of_squares
+                        , n):
+    """Calculates standard errors of means from running sums and sums of squares over n observations"""
+    variances = np.maximum(sums_of_squares - sums**2/n, 0)/max(n - 1, 1)
+    return np.sqrt(variances/n)
+
+def get_bounded_standard_errors(sums
+                                , n
+                                , z):
+    """Bounds the standard errors of means of values between 0 and 1, with the Agresti-Coull interval
+
+    A value between 0 and 1 with mean p has a variance of at most p(1-p). Adding z^2/2 successes and failures keeps
+    the bound away from 0 when every observation so far is the same, e.g. when one team has won every season
+    """
+    n_adjusted = n + z**2
+    p_adjusted = (sums + z**2/2)/n_adjusted
+    return np.sqrt(p_adjusted * (1 - p_adjusted)/n_adjusted)
+
+def run_seasons_streaming(teams
+                          , season_df
+                          , categories
+                          , tolerance = 0.01
+                          , min_seasons = 300
+                          , max_seasons = 100000
+                          , chunk_size = 100
+                          , n_weeks = 25
+                          , winner_take_all = True
+                          , z = 1.96
+                          , seed = None
+                          , schedule = None):
+    """Simulates seasons in fixed-size chunks, reporting running estimates and standard errors after each chunk
+
+    Only running sums are kept between chunks, so peak memory does not depend on the number of seasons. 
+    Simulation stops once at least min_seasons seasons have been simulated and the confidence interval of every 
+    team's winning fraction is within the tolerance, or when max_seasons seasons have been simulated. The intervals 
+    checked use the Agresti-Coull bound of the standard errors, so that early chunks where the same team wins every
+    season do not look converged
+
+    Args:
+        teams: player assignment dict, as produced by the run_draft() function
+        season_df: dataframe of weekly numbers per players. These will be sampled to simulate seasons
+        categories: list of categories
+        tolerance: maximum half-width of the confidence interval for each team's winning fraction
+        min_seasons: minimum number of seasons to simulate before checking convergence
+        max_seasons: maximum number of seasons to simulate
+        chunk_size: number of seasons to simulate per chunk
+        n_weeks: number of weeks per season
+        winner_take_all: If True, the winner of a majority of categories in a week gets a point.
+                         If false, each player gets a point for each category won 
+        z: number of standard errors in the half-width of the confidence interval. 1.96 is for 95% confidence
+        seed: seed or numpy random Generator for sampling
+        schedule: (week x team) array of opponent team numbers. Defaults to a round robin schedule
+
+    Yields:
+        Dictionary with the state after each chunk:
+            'n_seasons' : number of seasons simulated so far
+            'wins_by_teams' : Series of winning fractions by team
+            'wins_by_teams_se' : Series of standard errors of the winning fractions
+            'detailed_results' : dataframe of category win and tie rates, indexed by team and result
+            'detailed_results_se' : dataframe of standard errors of the category rates, based on season-level rates
+            'converged' : True if every team's winning fraction is within the tolerance
+    """
+    rng = np.random.default_rng(seed)
+    simulation = prepare_season_simulation(teams, season_df, categories, n_weeks, schedule)
+    team_numbers = simulation['team_numbers']
+    team_index = pd.Index(team_numbers, name = 'team')
+
+    winner_points = np.zeros(len(team_numbers))
+    winner_points_sq = np.zeros(len(team_numbers))
+    cat_wins = np.zeros((len(team_numbers), len(categories)))
+    cat_wins_sq = np.zeros((len(team_numbers), len(categories)))
+    cat_ties = np.zeros((len(team_numbers), len(categories)))
+    cat_ties_sq = np.zeros((len(team_numbers), len(categories)))
+    n = 0
+
+    for chunk_winner_points, chunk_cat_wins, chunk_cat_ties in simulate_chunks(simulation
+                                                                               , max_seasons
+                                                                               , chunk_size
+                                                                               , winner_take_all
+                                                                               , rng):
+        n += len(chunk_winner_points)
+        winner_points += chunk_winner_points.sum(axis = 0)
+        winner_points_sq += (chunk_winner_points**2).sum(axis = 0)
+
+        #category rates are tracked per season, so that their standard errors account for correlation within seasons
+        cat_wins += chunk_cat_wins.sum(axis = 0)
+        cat_wins_sq += ((chunk_cat_wins/n_weeks)**2).sum(axis = 0)
+        cat_ties += chunk_cat_ties.sum(axis = 0)
+        cat_ties_sq += ((chunk_cat_ties/n_weeks)**2).sum(axis = 0)
+
+        wins_se = get_standard_errors(winner_points, winner_points_sq, n)
+        converged = n >= min_seasons and bool(np.all(z * get_bounded_standard_errors(winner_points, n, z) <= tolerance))
+
+        yield {'n_seasons' : n
+               ,'wins_by_teams' : pd.Series(winner_points/n, index = team_index, name = 'winner_points_adjusted')
+               ,'wins_by_teams_se' : pd.Series(wins_se, index = team_index, name = 'winner_points_adjusted_se')
+               ,'detailed_results' : get_detailed_results(cat_wins, cat_ties, n * n_weeks, team_numbers, categories)
+               ,'detailed_results_se' : get_detailed_results(get_standard_errors(cat_wins/n_weeks, cat_wins_sq, n)
+                                                             , get_standard_errors(cat_ties/n_weeks, cat_ties_sq, n)
+                                                             , 1
+                                                             , team_numbers
+                                                             , categories)
+               ,'converged' : converged}
+
+        if converged:
+            break
+
+def run_seasons_until_converged(teams
+                                , season_df
+                                , categories
+                                , tolerance = 0.01
+                                , min_seasons = 300
+                                , max_seasons = 100000
+                                , chunk_size = 100
+                                , n_weeks = 25
+                                , winner_take_all = True
+                                , z = 1.96
+                                , seed = None
+                                , schedule = None):
+    """Runs run_seasons_streaming() to completion and returns its final state. Iterate over run_seasons_streaming()
+    directly to follow progress chunk by chunk
+
+    Args:
+        Arguments are passed to run_seasons_streaming()
+
+    Returns:
+        Dictionary with the final state, as yielded by run_seasons_streaming()
+    """
+    for state in run_seasons_streaming(teams
+                                       , season_df
+                                       , categories
+                                       , tolerance = tolerance
+                                       , min_seasons = min_seasons
+                                       , max_seasons = max_seasons
+                                       , chunk_size = chunk_size
+                                       , n_weeks = n_weeks
+                                       , winner_take_all = winner_take_all
+                                       , z = z
+                                       , seed = seed
+                                       , schedule = schedule):
+        pass
+    return state
+
+def get_detailed_results(cat_wins
+                         , cat_ties
+                         , n_matchups
+                         , team_numbers
+                         , categories):
+    """Formats category win and tie counts as rates, in a dataframe indexed by team and result"""
+    cat_wins_agg = pd.DataFrame(cat_wins/n_matchups, columns = categories, index = pd.Index(team_numbers, name = 'team'))
+    cat_wins_agg = pd.concat({'win' : cat_wins_agg}, names = ['result'])
         
-        cat_ties_agg = cat_tie_df.groupby('team').mean()
-        cat_ties_agg = pd.concat({'tie' : cat_ties_agg}, names = ['result'])
+    cat_ties_agg = pd.DataFrame(cat_ties/n_matchups, columns = categories, index = pd.Index(team_numbers, name = 'team'))
+    cat_ties_agg = pd.concat({'tie' : cat_ties_agg}, names = ['result'])
 
-        results_agg = pd.concat([cat_wins_agg, cat_ties_agg])
-        return wins_by_teams, results_agg.reorder_levels(['team','result'])
-                              
-    
-   
\ No newline at end of file
+    results_agg = pd.concat([cat_wins_agg, cat_ties_agg])
+    return results_agg.reorder_levels(['team','result'])
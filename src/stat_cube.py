@@ -0,0 +1,218 @@
+"""Memory-mapped multi-season stat cube
+
+All seasons' weekly numbers are saved to one directory, as a single flat array with compact dtypes which is opened
+as a read-only memory map. Each season is a contiguous (player x week x stat) block of the flat array, so a season
+can be viewed without copying anything, and worker processes which open the same cube share its pages through the
+operating system rather than each holding their own copy
+
+    values.npy: flat array of every season's (player x week x stat) block, in int16 if all numbers fit, else float32
+    player_names.npy: dictionary of every player across seasons. Players are referred to by their position in it
+    player_ids.npy: ids of each season's players, concatenated over seasons
+    position_masks.npy: eligibility signature of each season's players, aligned with player_ids.npy
+    weeks.npy: week numbers of each season, concatenated over seasons
+    meta.json: stat names, the dtype of values.npy, and the offsets and sizes of each season's block
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from src.normalization import UTILITY_MASK, encode_positions
+
+def save_stat_cube(cube_path
+                   , season_data):
+    """Saves prepared season data to a stat cube directory
+
+    The cube is written to a uniquely named temporary directory first and then moved into place, so a partially
+    written cube is never opened. Several processes can build the same cube at once; if another process moves its
+    cube into place first, that cube is kept
+
+    Args:
+        cube_path: directory to save the cube to
+        season_data: dictionary of season -> (season_df, positions), as produced by setup()
+    """
+    stats = None
+    player_names = pd.Index([])
+    blocks, player_ids, position_masks, weeks, seasons = [], [], [], [], []
+    value_offset, player_offset, week_offset = 0, 0, 0
+
+    for season, (season_df, positions) in season_data.items():
+        season_stats = list(season_df.columns)
+        if stats is not None and season_stats != stats:
+            raise ValueError('Every season needs the same stat columns')
+        stats = season_stats
+
+        season_players = season_df.index.levels[0][season_df.index.codes[0]].unique()
+        season_weeks = season_df.index.levels[1][season_df.index.codes[1]].unique()
+        if len(season_df) != len(season_players) * len(season_weeks):
+            raise ValueError('season_df needs to be indexed by the full product of players and weeks')
+
+        #the full product index is in player-major order, so the values reshape directly into a season block
+        block = season_df.values.reshape(len(season_players), len(season_weeks), len(stats))
+        blocks.append(block.ravel())
+
+        player_names = player_names.append(pd.Index(season_players).difference(player_names))
+        player_ids.append(player_names.get_indexer(season_players).astype(np.int32))
+        unique_positions = encode_positions(positions[~positions.index.duplicated()])
+        position_masks.append(unique_positions.reindex(season_players).fillna(UTILITY_MASK).values.astype(np.uint8))
+        weeks.append(np.array(season_weeks, dtype = np.int64))
+
+        seasons.append({'season' : season
+                        ,'value_offset' : value_offset
+                        ,'player_offset' : player_offset
+                        ,'week_offset' : week_offset
+                        ,'n_players' : len(season_players)
+                        ,'n_weeks' : len(season_weeks)})
+        value_offset += block.size
+        player_offset += len(season_players)
+        week_offset += len(season_weeks)
+
+    values = np.concatenate(blocks)
+    fits_int16 = np.all(values == np.round(values)) and np.all(np.abs(values) <= np.iinfo(np.int16).max)
+    values = values.astype(np.int16 if fits_int16 else np.float32)
+
+    parent_path = os.path.dirname(os.path.abspath(cube_path))
+    os.makedirs(parent_path, exist_ok = True)
+    tmp_path = tempfile.mkdtemp(prefix = os.path.basename(cube_path) + '.', suffix = '.tmp', dir = parent_path)
+
+    try:
+        np.save(os.path.join(tmp_path, 'values.npy'), values)
+        np.save(os.path.join(tmp_path, 'player_names.npy'), np.array(player_names, dtype = str))
+        np.save(os.path.join(tmp_path, 'player_ids.npy'), np.concatenate(player_ids))
+        np.save(os.path.join(tmp_path, 'position_masks.npy'), np.concatenate(position_masks))
+        np.save(os.path.join(tmp_path, 'weeks.npy'), np.concatenate(weeks))
+
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'stats' : stats, 'dtype' : values.dtype.str, 'seasons' : seasons}, f)
+
+        shutil.rmtree(cube_path, ignore_errors = True)
+        try:
+            os.replace(tmp_path, cube_path)
+        except OSError:
+            #another process moved the same cube into place between the rmtree and the replace
+            if not os.path.isfile(os.path.join(cube_path, 'meta.json')):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors = True)
+
+def build_stat_cube(cube_path
+                    , seasons
+                    , data_path = '../data/'):
+    """Prepares each season with setup() and saves them all to a stat cube directory
+
+    Args:
+        cube_path: directory to save the cube to
+        seasons: list of seasons, e.g. range(2001, 2024)
+        data_path: directory of the source data
+
+    Returns:
+        StatCube opened from the new directory
+    """
+    from src.helper_functions import setup
+    save_stat_cube(cube_path, {season : setup(season, data_path) for season in seasons})
+    return StatCube(cube_path)
+
+class StatCube():
+    """Read-only view of a stat cube directory
+
+    A StatCube can be used in place of a dictionary of season -> (season_df, positions), as produced by setup().
+    When pickled, for example to send to a worker process, only its path is saved, and the unpickled cube opens
+    its own memory map of the same files
+    """
+
+    def __init__(self
+                 , cube_path):
+        """Opens a stat cube
+
+        Args:
+            cube_path: directory the cube was saved to
+        """
+        self.cube_path = cube_path
+        with open(os.path.join(cube_path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.stats = meta['stats']
+        self.season_meta = {s['season'] : s for s in meta['seasons']}
+
+        self.values = np.load(os.path.join(cube_path, 'values.npy'), mmap_mode = 'r')
+        #cubes saved before dtypes were recorded take theirs from values.npy
+        self.dtype = np.dtype(meta.get('dtype', self.values.dtype))
+        if self.values.dtype != self.dtype:
+            raise ValueError('values.npy of ' + cube_path + ' is ' + str(self.values.dtype) + ', but meta.json says '
+                             + str(self.dtype))
+        self.player_names = pd.Index(np.load(os.path.join(cube_path, 'player_names.npy')).astype(object)
+                                     , name = 'player')
+        self.player_ids = np.load(os.path.join(cube_path, 'player_ids.npy'), mmap_mode = 'r')
+        self.position_masks = np.load(os.path.join(cube_path, 'position_masks.npy'), mmap_mode = 'r')
+        self.weeks = np.load(os.path.join(cube_path, 'weeks.npy'), mmap_mode = 'r')
+
+    def __reduce__(self):
+        return (StatCube, (self.cube_path,))
+
+    @property
+    def seasons(self):
+        return list(self.season_meta.keys())
+
+    def __contains__(self
+                     , season):
+        return season in self.season_meta
+
+    def __getitem__(self
+                    , season):
+        return self.get_season_df(season), self.get_positions(season)
+
+    def get_player_ids(self
+                       , players):
+        """Looks up players in the player dictionary. Players which are not in it get an id of -1"""
+        return self.player_names.get_indexer(players)
+
+    def get_season_array(self
+                         , season):
+        """Gets a zero-copy, read-only (player x week x stat) view of a season"""
+        s = self.season_meta[season]
+        size = s['n_players'] * s['n_weeks'] * len(self.stats)
+        return self.values[s['value_offset']:s['value_offset'] + size].reshape(s['n_players']
+                                                                               , s['n_weeks']
+                                                                               , len(self.stats))
+
+    def get_season_player_ids(self
+                              , season):
+        """Gets the player dictionary ids of a season's players, in the order of get_season_array()"""
+        s = self.season_meta[season]
+        return self.player_ids[s['player_offset']:s['player_offset'] + s['n_players']]
+
+    def get_season_players(self
+                           , season):
+        """Gets the names of a season's players, in the order of get_season_array()"""
+        return self.player_names[self.get_season_player_ids(season)]
+
+    def get_season_weeks(self
+                         , season):
+        """Gets the week numbers of a season, in the order of get_season_array()"""
+        s = self.season_meta[season]
+        return self.weeks[s['week_offset']:s['week_offset'] + s['n_weeks']]
+
+    def get_season_df(self
+                      , season):
+        """Gets a season as a dataframe in the format of setup(), backed by the memory map without copying
+
+        Every column has the cube's dtype, so the dataframe is a single block over the memory map, and its values
+        are read-only, which is fine for every function that takes a season_df
+        """
+        season_array = self.get_season_array(season)
+        index = pd.MultiIndex.from_product([self.get_season_players(season)
+                                            , pd.array(self.get_season_weeks(season), dtype = 'UInt32')]
+                                           , names = ['player','week'])
+        return pd.DataFrame(season_array.reshape(-1, len(self.stats))
+                            , index = index
+                            , columns = self.stats
+                            , copy = False)
+
+    def get_positions(self
+                      , season):
+        """Gets the eligibility signatures of a season's players, as a series indexed by player"""
+        s = self.season_meta[season]
+        position_masks = self.position_masks[s['player_offset']:s['player_offset'] + s['n_players']].astype(int)
+        return pd.Series(position_masks, index = self.get_season_players(season), name = 'pos')
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src.feature_store import FeatureStore
+
+SEASONS = range(2001, 2008)
+
+def make_metadata(players
+                  , positions
+                  , seed = 0):
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product([players, SEASONS], names = ['player','season'])
+    return pd.DataFrame({'age' : rng.integers(20, 35, len(index)).astype(float)
+                         ,'experience' : 1.0
+                         ,'pos' : rng.choice(positions, len(index))
+                         ,'lg' : 'NBA'}
+                        , index = index)
+
+@pytest.fixture
+def feature_store(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / 'features'))
+    for season in SEASONS:
+        season_df, positions = make_synthetic_league(n_players = 60, n_weeks = 6, seed = season)
+        feature_store.add_season(season, season_df)
+    players = pd.unique(season_df.index.get_level_values('player'))
+    feature_store.set_metadata(make_metadata(players, ['PG','SF','C']))
+    return feature_store
+
@@ -0,0 +1,185 @@
+import os
+import pandas as pd
+import pytest
+
+from src import data_acquisition
+from src.data_acquisition import BOX_SCORE_PARAMETERS, GAME_LIST_MAX_AGE, FetchError, ResponseCache, StatsClient, \
+            StubStatsServer, fetch_season, get_request_key
+
+SEASON = '2022-23'
+GAME_IDS = ['0022200001', '0022200002', '0022200003', '0022200004']
+
+def get_game_finder_request(game_ids):
+    params = {'LeagueID' : '00', 'PlayerOrTeam' : 'T', 'Season' : SEASON, 'SeasonType' : 'Regular Season'}
+    #one row per team, so two per game
+    rows = [[g, '2022-10-' + str(18 + i), team] for i, g in enumerate(game_ids) for team in (0, 1)]
+    return 'leaguegamefinder', params, {'resultSets' : [{'headers' : ['GAME_ID','GAME_DATE','TEAM_ID']
+                                                         ,'rowSet' : rows}]}
+
+def get_box_score_request(game_id):
+    rows = [[game_id, int(game_id[-1]) * 100 + player, 'Player ' + str(player), player * 3] for player in range(6)]
+    return 'boxscoretraditionalv2', dict(GameID = game_id, **BOX_SCORE_PARAMETERS) \
+                , {'resultSets' : [{'headers' : ['GAME_ID','PLAYER_ID','PLAYER_NAME','PTS'], 'rowSet' : rows}]}
+
+def get_responses(box_score_game_ids = GAME_IDS):
+    return [get_game_finder_request(GAME_IDS)] + [get_box_score_request(g) for g in box_score_game_ids]
+
+def make_client(tmp_path
+                , server):
+    return StatsClient(str(tmp_path / 'cache')
+                       , base_url = server.url
+                       , requests_per_second = None
+                       , max_retries = 3
+                       , backoff_base = 0.01)
+
+def read_season_file(path):
+    return pd.read_csv(path).sort_values(['GAME_ID','PLAYER_ID']).reset_index(drop = True)
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records backoff waits instead of sleeping"""
+    sleeps = []
+    monkeypatch.setattr(data_acquisition.time, 'sleep', sleeps.append)
+    return sleeps
+
+def test_unavailable_responses_are_retried_with_backoff(tmp_path
+                                                        , sleeps):
+    with StubStatsServer(get_responses(), fail_first = 2, fail_status = 503) as server:
+        client = make_client(tmp_path, server)
+        response, cached = client.get(*get_box_score_request(GAME_IDS[0])[0:2])
+        assert server.request_count == 3
+
+    assert response == get_box_score_request(GAME_IDS[0])[2]
+    assert not cached
+    #waits double with each retry, and jitter adds at most half
+    assert len(sleeps) == 2
+    assert 0.01 <= sleeps[0] <= 0.015
+    assert 0.02 <= sleeps[1] <= 0.03
+
+def test_retries_run_out(tmp_path
+                         , sleeps):
+    with StubStatsServer(get_responses(), fail_first = 10, fail_status = 503) as server:
+        client = make_client(tmp_path, server)
+        with pytest.raises(FetchError):
+            client.get(*get_box_score_request(GAME_IDS[0])[0:2])
+        assert server.request_count == 4
+
+def test_missing_game_is_reported_as_failed(tmp_path
+                                            , sleeps):
+    output_path = str(tmp_path / 'season.csv')
+    with StubStatsServer(get_responses(GAME_IDS[0:3])) as server:
+        client = make_client(tmp_path, server)
+        with pytest.raises(FetchError):
+            client.get(*get_box_score_request(GAME_IDS[3])[0:2])
+
+        summary = fetch_season(client, SEASON, output_path)
+
+    #a 404 is not retried
+    assert sleeps == []
+    assert summary['fetched'] == 3
+    assert [g for g, error in summary['failed']] == [GAME_IDS[3]]
+    assert '404' in summary['failed'][0][1]
+    assert set(read_season_file(output_path)['GAME_ID']) == set(int(g) for g in GAME_IDS[0:3])
+
+def test_interrupted_run_resumes_from_cache(tmp_path
+                                            , sleeps
+                                            , monkeypatch):
+    output_path = str(tmp_path / 'season.csv')
+    append_rows = data_acquisition.append_rows
+    n_appends = []
+
+    def crash_on_second_game(path, rows):
+        """Writes half of the second game's rows, then fails as if the process died mid-write"""
+        n_appends.append(1)
+        if len(n_appends) == 2:
+            append_rows(path, rows.iloc[0:(len(rows) // 2)])
+            raise KeyboardInterrupt
+        return append_rows(path, rows)
+
+    with StubStatsServer(get_responses()) as server:
+        client = make_client(tmp_path, server)
+        monkeypatch.setattr(data_acquisition, 'append_rows', crash_on_second_game)
+        with pytest.raises(KeyboardInterrupt):
+            fetch_season(client, SEASON, output_path, max_workers = 1)
+        monkeypatch.setattr(data_acquisition, 'append_rows', append_rows)
+
+        partial = pd.read_csv(output_path)
+        assert len(partial) == 6 + 3
+        requests_before_resume = server.request_count
+
+        summary = fetch_season(client, SEASON, output_path)
+
+        #every game reached the cache before the crash, so nothing is requested again
+        assert server.request_count == requests_before_resume
+
+    assert summary['fetched'] == 0
+    assert summary['cached'] == len(GAME_IDS) - 1
+    assert summary['failed'] == []
+
+    season = read_season_file(output_path)
+    expected = pd.concat([pd.DataFrame(r['resultSets'][0]['rowSet'], columns = r['resultSets'][0]['headers'])
+                          for e, p, r in get_responses()[1:]])
+    assert len(season) == len(expected)
+    assert not season.duplicated(['GAME_ID','PLAYER_ID']).any()
+    assert season.groupby('GAME_ID').size().tolist() == [6] * len(GAME_IDS)
+
+    #a complete run leaves nothing to do
+    assert fetch_season(client, SEASON, output_path) == {'fetched' : 0, 'cached' : 0, 'failed' : []}
+
+def test_season_file_is_rebuilt_from_cache(tmp_path
+                                           , sleeps):
+    output_path = str(tmp_path / 'season.csv')
+    with StubStatsServer(get_responses()) as server:
+        client = make_client(tmp_path, server)
+        fetch_season(client, SEASON, output_path)
+    original = read_season_file(output_path)
+
+    os.remove(output_path)
+    os.remove(data_acquisition.get_journal_path(output_path))
+
+    #the server now has nothing, so the file can only come from the cache
+    with StubStatsServer([]) as server:
+        client = make_client(tmp_path, server)
+        summary = fetch_season(client, SEASON, output_path)
+        assert server.request_count == 0
+
+    assert summary == {'fetched' : 0, 'cached' : len(GAME_IDS), 'failed' : []}
+    pd.testing.assert_frame_equal(read_season_file(output_path), original)
+
+def expire_game_list(tmp_path):
+    """Backdates the cached game list past its maximum age"""
+    endpoint, params, response = get_game_finder_request(GAME_IDS)
+    path = ResponseCache(str(tmp_path / 'cache')).get_path(get_request_key(endpoint, params))
+    expired = os.path.getmtime(path) - GAME_LIST_MAX_AGE - 60
+    os.utime(path, (expired, expired))
+
+def test_expired_game_list_picks_up_new_games(tmp_path
+                                              , sleeps):
+    output_path = str(tmp_path / 'season.csv')
+    early_responses = [get_game_finder_request(GAME_IDS[0:2])] + [get_box_score_request(g) for g in GAME_IDS[0:2]]
+    with StubStatsServer(early_responses) as server:
+        assert fetch_season(make_client(tmp_path, server), SEASON, output_path)['fetched'] == 2
+
+    #while the game list is fresh, it is not requested again
+    with StubStatsServer(get_responses()) as server:
+        assert fetch_season(make_client(tmp_path, server), SEASON, output_path)['fetched'] == 0
+        assert server.request_count == 0
+
+        expire_game_list(tmp_path)
+        summary = fetch_season(make_client(tmp_path, server), SEASON, output_path)
+    assert summary == {'fetched' : 2, 'cached' : 0, 'failed' : []}
+    assert set(read_season_file(output_path)['GAME_ID']) == set(int(g) for g in GAME_IDS)
+
+def test_expired_game_list_is_used_when_it_cannot_be_fetched(tmp_path
+                                                            , sleeps):
+    output_path = str(tmp_path / 'season.csv')
+    with StubStatsServer(get_responses()) as server:
+        fetch_season(make_client(tmp_path, server), SEASON, output_path)
+    os.remove(output_path)
+    os.remove(data_acquisition.get_journal_path(output_path))
+    expire_game_list(tmp_path)
+
+    with StubStatsServer([]) as server:
+        summary = fetch_season(make_client(tmp_path, server), SEASON, output_path)
+        assert server.request_count == 1
+    assert summary == {'fetched' : 0, 'cached' : len(GAME_IDS), 'failed' : []}
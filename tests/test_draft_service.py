@@ -0,0 +1,101 @@
+import json
+import urllib.error
+import urllib.request
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src.draft_service import DraftServer, DraftService, DraftSession
+from src.drafting_agents import HAgent, SimpleAgent
+from src.score_cache import get_score_matrix
+
+@pytest.fixture(scope = 'module')
+def league():
+    return make_synthetic_league(n_players = 200, n_weeks = 10, seed = 6)
+
+@pytest.fixture(scope = 'module')
+def server(league):
+    season_df, positions = league
+    service = DraftService({'h' : HAgent(season_df, positions)
+                            ,'simple' : SimpleAgent(positions, get_score_matrix(season_df, alpha_weight = 1
+                                                                                , beta_weight = 0))})
+    with DraftServer(service) as server:
+        yield server
+
+def request(server
+            , method
+            , path
+            , body = None):
+    """Sends a request to the server, returning (http status, response dictionary)"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    http_request = urllib.request.Request(server.url + path, data = data, method = method)
+    try:
+        with urllib.request.urlopen(http_request, timeout = 10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.mark.parametrize('agent', ['h', 'simple'])
+def test_session_lifecycle(server
+                           , agent):
+    status, response = request(server, 'POST', 'sessions', {'seat' : 1, 'n_teams' : 4, 'agent' : agent})
+    assert status == 201
+    session = 'sessions/' + response['session']
+
+    status, response = request(server, 'GET', session + '/recommendations?n=5')
+    assert status == 200
+    first_choices = [recommendation['player'] for recommendation in response['recommendations']]
+    assert len(first_choices) == 5
+
+    status, response = request(server, 'POST', session + '/picks', {'player' : first_choices[0], 'team' : 0})
+    assert status == 200 and response['pick'] == 0
+    status, response = request(server, 'POST', session + '/picks', {'player' : first_choices[1], 'team' : 1
+                                                                    , 'recommend' : 5})
+    assert status == 200 and response['pick'] == 1
+    assert first_choices[0] not in [recommendation['player'] for recommendation in response['recommendations']]
+
+    status, response = request(server, 'GET', session)
+    assert response['picks'] == [{'player' : first_choices[0], 'team' : 0}, {'player' : first_choices[1], 'team' : 1}]
+    assert response['roster'] == [first_choices[1]]
+
+    status, response = request(server, 'POST', session + '/undo')
+    assert status == 200 and response['player'] == first_choices[1] and response['team'] == 1
+    status, response = request(server, 'GET', session)
+    assert response['roster'] == []
+
+    status, response = request(server, 'GET', session + '/recommendations?n=5')
+    assert status == 200
+    #only the first choice is gone, so the rest move up
+    assert [recommendation['player'] for recommendation in response['recommendations']][0:4] == first_choices[1:]
+    if agent == 'h':
+        assert all(0 <= p <= 1 for p in response['recommendations'][0]['win_probabilities'].values())
+
+    assert request(server, 'DELETE', session) == (200, {})
+    assert request(server, 'GET', session)[0] == 404
+
+def test_errors_get_json_responses(server
+                                   , monkeypatch):
+    assert request(server, 'GET', 'sessions/nonexistent')[0] == 404
+    assert request(server, 'DELETE', 'sessions/nonexistent')[0] == 404
+    assert request(server, 'GET', 'players')[0] == 404
+
+    assert request(server, 'POST', 'sessions', {'seat' : 12, 'n_teams' : 12})[0] == 400
+    assert request(server, 'POST', 'sessions', {'agent' : 'unknown'})[0] == 400
+    status, response = request(server, 'POST', 'sessions', {'seat' : 0})
+    session = 'sessions/' + response['session']
+    assert request(server, 'POST', session + '/picks', {'player' : 'Nobody', 'team' : 0})[0] == 400
+    assert request(server, 'POST', session + '/picks', {'team' : 0})[0] == 400
+    assert request(server, 'POST', session + '/undo')[0] == 400
+
+    def fail(self, n = 10):
+        raise RuntimeError('failed')
+    monkeypatch.setattr(DraftSession, 'recommend', fail)
+    status, response = request(server, 'GET', session + '/recommendations')
+    assert status == 500 and 'failed' in response['error']
+
+    #the server keeps serving after an internal error
+    assert request(server, 'GET', session)[0] == 200
+
+def test_agents_without_players_are_rejected(league):
+    season_df, positions = league
+    with pytest.raises(ValueError, match = 'no players'):
+        DraftService({'empty' : SimpleAgent(positions)})
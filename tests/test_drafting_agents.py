@@ -0,0 +1,102 @@
+import copy
+import time
+import numpy as np
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src.drafting_agents import PAgent, SearchAgent, SimpleAgent, get_best_eligible
+from src.score_cache import get_score_matrix
+from src.simulation import DraftBoard, run_draft, run_drafts
+
+@pytest.fixture(scope = 'module')
+def league():
+    return make_synthetic_league(n_players = 200, n_weeks = 10, seed = 3)
+
+def test_best_eligible_prefers_the_first_of_tied_candidates():
+    scores = np.array([[1., 3., 2., 3., 3.], [5., 5., 5., 1., 0.]])
+    eligible = np.array([[True, False, True, True, True], [False, True, True, True, True]])
+    assert list(get_best_eligible(scores, eligible)) == [3, 1]
+    assert get_best_eligible(scores[0], eligible[0]) == 3
+
+def test_batched_drafts_match_sequential_drafts_with_tied_scores(league):
+    season_df, positions = league
+    #rounded scores leave many players tied with each other
+    scores = get_score_matrix(season_df, alpha_weight = 1, beta_weight = 0).to_frame().round(0)
+    assert scores.sum(axis = 1).duplicated().sum() > 50
+
+    templates = [PAgent(positions, scores, n_punts = n_punts) for n_punts in (0, 1)]
+    rng = np.random.default_rng(0)
+    seatings = [rng.integers(0, len(templates), size = 12) for draft in range(6)]
+
+    batched = run_drafts([[templates[i].fresh() for i in seating] for seating in seatings], 13)
+    sequential = [run_draft([templates[i].fresh() for i in seating], 13) for seating in seatings]
+    assert batched == sequential
+
+def test_deep_copies_keep_references_to_the_agent(league):
+    season_df, positions = league
+    agent = SimpleAgent(order = get_score_matrix(season_df, alpha_weight = 1, beta_weight = 0), positions = positions)
+    agent.players.append(agent)
+
+    copied = copy.deepcopy({'agents' : [agent, agent]})
+    agent_copy = copied['agents'][0]
+    assert agent_copy is not agent and copied['agents'][1] is agent_copy
+    assert agent_copy.players[0] is agent_copy
+    assert agent_copy.order is agent.order
+
+@pytest.fixture(scope = 'module')
+def search_agent(league):
+    season_df, positions = league
+    return SearchAgent(season_df, positions, n_players = 96, n_teams = 8, n_rounds = 12, time_budget = 0.03, seed = 0)
+
+def test_search_agents_are_seeded_from_the_start(search_agent):
+    assert search_agent.rng is not None
+    fresh_draws = [agent.rng.random() for agent in (search_agent.fresh(), search_agent.fresh())]
+    assert fresh_draws[0] == fresh_draws[1]
+
+def start_draft(agent
+                , n_picks):
+    """Makes a board with the first n_picks of a draft taken by other teams, and seats the agent at the next pick"""
+    agent = agent.fresh()
+    draft_board = DraftBoard(agent.candidates)
+    for pick_number in range(n_picks):
+        draft_board.take(pick_number, int(agent.snake_order[pick_number]))
+    agent.seat = int(agent.snake_order[n_picks])
+    return agent, draft_board
+
+def test_failed_rollout_leaves_the_board_unchanged(search_agent
+                                                   , monkeypatch):
+    agent, draft_board = start_draft(search_agent, 3)
+    pick_log = list(draft_board.pick_log)
+    available = draft_board.available.copy()
+
+    def fail(*args):
+        raise RuntimeError('failed mid-rollout')
+    monkeypatch.setattr(agent, 'pick_greedily', fail)
+    with pytest.raises(RuntimeError):
+        agent.run_rollout(draft_board, 10, 3)
+
+    assert draft_board.pick_log == pick_log
+    np.testing.assert_array_equal(draft_board.available, available)
+
+def test_picks_keep_to_the_time_budget_when_rollouts_are_slow(search_agent
+                                                              , monkeypatch):
+    agent, draft_board = start_draft(search_agent, 3)
+    agent.depth = 12
+    agent.time_budget = 0.01
+    pick_greedily = agent.pick_greedily
+
+    #each of the agent's simulated picks takes 2 ms, so a single rollout takes more than twice the budget. Rollouts
+    #are abandoned before a simulated pick which would not finish in time
+    def slow_pick_greedily(*args):
+        time.sleep(0.002)
+        return pick_greedily(*args)
+    monkeypatch.setattr(agent, 'pick_greedily', slow_pick_greedily)
+
+    start = time.perf_counter()
+    player = agent.make_pick(draft_board)
+    elapsed = time.perf_counter() - start
+
+    #allowing for sleeps which overrun
+    assert elapsed < agent.time_budget + 0.01
+    assert player in agent.candidates
+    assert draft_board.pick_log == [(i, int(agent.snake_order[i])) for i in range(3)]
@@ -0,0 +1,76 @@
+import pickle
+import pandas as pd
+import pytest
+
+from src import experiments
+from src.benchmarks import make_synthetic_league
+from src.experiments import add_to_res_dict, build_experiment_grid, load_checkpoint, make_g_agent, \
+            make_z_plus_agent, run_experiments
+
+AGENT_FACTORIES = {'g' : make_g_agent, 'z' : make_z_plus_agent}
+
+@pytest.fixture(scope = 'module')
+def season_data():
+    return {2023 : make_synthetic_league(n_players = 200, n_weeks = 8, seed = 4)}
+
+def get_detail(task):
+    return pd.Series({'task' : str(task)})
+
+def test_res_dict_only_summarizes_complete_groups():
+    tasks = build_experiment_grid([2022, 2023], [('g','z')], seats = range(3), formats = ('wta',))
+    results = {task : (task[3] / 10, get_detail(task)) for task in tasks if task[0] == 2022 or task[3] != 1}
+
+    res_dict = add_to_res_dict({}, results, tasks)
+    assert list(res_dict) == [2022]
+    assert res_dict[2022]['g vs z']['wta']['res'] == pytest.approx(0.1)
+    assert len(res_dict[2022]['g vs z']['wta']['detail']) == 3
+
+def test_checkpoint_is_only_reused_for_the_same_number_of_seasons(season_data
+                                                                   , tmp_path
+                                                                   , monkeypatch):
+    tasks = build_experiment_grid([2023], [('g','z')], seats = [0, 5], formats = ('tot',))
+    checkpoint_path = str(tmp_path / 'checkpoint.pkl')
+    run_experiments(tasks, season_data, AGENT_FACTORIES, n_seasons = 5, n_workers = 1
+                    , checkpoint_path = checkpoint_path)
+    assert set(load_checkpoint(checkpoint_path, 5)) == set(tasks)
+    assert load_checkpoint(checkpoint_path, 10) == {}
+
+    #a rerun with the same number of seasons submits nothing
+    class NoPool:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError('tasks were rerun')
+    with monkeypatch.context() as m:
+        m.setattr(experiments, 'ProcessPoolExecutor', NoPool)
+        res_dict = run_experiments(tasks, season_data, AGENT_FACTORIES, n_seasons = 5
+                                   , checkpoint_path = checkpoint_path)
+    results = load_checkpoint(checkpoint_path, 5)
+    assert res_dict[2023]['g vs z']['tot']['res'] == pytest.approx((results[tasks[0]][0] + results[tasks[1]][0]) / 2)
+
+    res_dict = run_experiments(tasks, season_data, AGENT_FACTORIES, n_seasons = 10, n_workers = 1
+                               , checkpoint_path = checkpoint_path)
+    results = load_checkpoint(checkpoint_path, 10)
+    assert set(results) == set(tasks)
+    assert res_dict[2023]['g vs z']['tot']['res'] == pytest.approx((results[tasks[0]][0] + results[tasks[1]][0]) / 2)
+
+@pytest.mark.parametrize('damage', [lambda data: data[:-7], lambda data: data + b'\x80\x04garbage'])
+def test_damaged_checkpoint_keeps_complete_records(tmp_path
+                                                   , damage):
+    tasks = build_experiment_grid([2023], [('g','z')], seats = range(3), formats = ('tot',))
+    checkpoint_path = str(tmp_path / 'checkpoint.pkl')
+    with open(checkpoint_path, 'wb') as f:
+        for task in tasks:
+            pickle.dump(((task, 5), 0.5, get_detail(task)), f)
+    with open(checkpoint_path, 'rb') as f:
+        data = f.read()
+    with open(checkpoint_path, 'wb') as f:
+        f.write(damage(data))
+
+    results = load_checkpoint(checkpoint_path, 5)
+    assert set(results) <= set(tasks) and len(results) >= 2
+
+    #records appended after the damage can be read back
+    with open(checkpoint_path, 'ab') as f:
+        pickle.dump(((tasks[-1], 5), 0.25, get_detail(tasks[-1])), f)
+    results = load_checkpoint(checkpoint_path, 5)
+    assert set(results) == set(tasks)
+    assert results[tasks[-1]][0] == 0.25
@@ -0,0 +1,24 @@
+import pandas as pd
+
+def test_model_matrices_record_position_labels(feature_store):
+    matrices = feature_store.get_model_matrices([2007], first_season = 2003)
+    assert matrices['pos_categories'] == ['C','PG','SF']
+    x = matrices['train']['x']
+    assert set(x['pos_n']) <= {0, 1, 2}
+
+def test_position_codes_follow_given_labels(feature_store):
+    features = feature_store.get_projection_features(2007)
+    pos_categories = feature_store.get_pos_categories()
+    before = feature_store.get_model_inputs(features, pos_categories)['pos_n']
+
+    #a new label sorts first, which would shift every code encoded with the store's current labels
+    metadata = feature_store.get_metadata().copy()
+    metadata.loc[metadata.index[0], 'pos'] = 'AA'
+    feature_store.set_metadata(metadata)
+    assert feature_store.get_pos_categories() == ['AA','C','PG','SF']
+
+    features = feature_store.get_projection_features(2007)
+    after = feature_store.get_model_inputs(features, pos_categories)['pos_n']
+    shifted = feature_store.get_model_inputs(features)['pos_n']
+    pd.testing.assert_series_equal(after, before.reindex(after.index))
+    assert (shifted != after).all()
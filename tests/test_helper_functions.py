@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src.helper_functions import RosterState, calculate_coefficients, check_team_eligibility, \
+            check_team_eligibility_lp, clear_player_statistics_cache, get_eligibility_row, get_eligibility_signature, \
+            get_player_statistics
+
+#listings in every format players come in, weighted towards centers so that some rosters are ineligible
+LISTINGS = [['C'], ['C'], ['C'], ['PG'], ['SG'], ['SF'], ['PF'], ['PG','SG'], ['SF','PF'], ['PF','C'], ['G'], ['F']
+            , 'C', 'SG-SF', 'PG,SG', "{'SF', 'PF'}", 'G', 'F', 'F-C', None, 0b00000001, 0b01100000, 0b10000000]
+
+def test_eligibility_rows_match_signatures():
+    for listing in LISTINGS:
+        row = get_eligibility_row(listing)[0]
+        assert sum(1 << i for i in range(8) if row[i]) == get_eligibility_signature(listing)
+
+@pytest.mark.parametrize('seed', range(4))
+def test_eligibility_matches_linear_program(seed):
+    rng = np.random.default_rng(seed)
+    results = []
+    for i in range(60):
+        players = [LISTINGS[j] for j in rng.integers(0, len(LISTINGS), size = rng.integers(1, 14))]
+        eligible = check_team_eligibility(players)
+        assert eligible == check_team_eligibility_lp(players), players
+        results.append(eligible)
+
+    #both answers need to come up for the comparison to mean anything
+    assert 0 < sum(results) < len(results)
+
+def test_roster_state_matches_full_check():
+    rng = np.random.default_rng(0)
+    for i in range(200):
+        roster = RosterState()
+        players = []
+        for listing in [LISTINGS[j] for j in rng.integers(0, len(LISTINGS), size = 13)]:
+            assert roster.can_add(get_eligibility_signature(listing)) == check_team_eligibility(players + [listing])
+            if roster.can_add(get_eligibility_signature(listing)):
+                roster.add(get_eligibility_signature(listing))
+                players.append(listing)
+
+def test_player_statistics_follow_in_place_changes():
+    season_df, positions = make_synthetic_league(n_players = 50, n_weeks = 6, seed = 5)
+    season_df = season_df.astype(float)
+    players = pd.unique(season_df.index.get_level_values('player'))
+    statistics = get_player_statistics(season_df)
+    assert get_player_statistics(season_df) is statistics
+
+    #as the notebooks do, e.g. season_df.loc[:, 'no_play'] = ...
+    season_df.loc[:, 'pts'] = season_df['pts'] * 2
+    season_df.iloc[0, 1] += 5
+    for changed, fresh in zip(calculate_coefficients(season_df, players)
+                              , calculate_coefficients(season_df.copy(), players)):
+        pd.testing.assert_series_equal(changed, fresh)
+    assert get_player_statistics(season_df) is not statistics
+
+def test_cleared_player_statistics_are_recalculated():
+    season_df, positions = make_synthetic_league(n_players = 50, n_weeks = 6, seed = 5)
+    other_df = season_df.copy()
+    statistics = get_player_statistics(season_df)
+    other_statistics = get_player_statistics(other_df)
+
+    clear_player_statistics_cache(season_df)
+    assert get_player_statistics(other_df) is other_statistics
+    recalculated = get_player_statistics(season_df)
+    assert recalculated is not statistics
+    pd.testing.assert_frame_equal(recalculated, statistics)
+
+    clear_player_statistics_cache()
+    assert get_player_statistics(other_df) is not other_statistics
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src.helper_functions import calculate_coefficients, calculate_scores_from_coefficients
+from src.incremental_scoring import IncrementalScorer
+
+N_PLAYERS = 60
+
+def get_full_recompute(season_df
+                       , n_players = N_PLAYERS):
+    """Calculates coefficients and X-scores from a full season, as HAgent does"""
+    all_players = pd.unique(season_df.index.get_level_values('player'))
+    first_order_scores = calculate_scores_from_coefficients(season_df
+                                                            ,*calculate_coefficients(season_df, all_players)
+                                                            ,alpha_weight = 1
+                                                            ,beta_weight = 0)
+    first_order_score_totals = first_order_scores.sum(axis = 1).sort_values(ascending = False)
+    coefficients = calculate_coefficients(season_df, first_order_score_totals.index[0:n_players])
+    x_scores = calculate_scores_from_coefficients(season_df, *coefficients, alpha_weight = 0, beta_weight = 1)
+    return coefficients, x_scores
+
+def get_reference_df(folded
+                     , players
+                     , weeks):
+    """Sums every folded row into weekly totals, with zeros for weeks players did not play"""
+    index = pd.MultiIndex.from_product([players, weeks], names = ['player','week'])
+    return pd.concat(folded).groupby(level = ['player','week']).sum().reindex(index, fill_value = 0)
+
+def assert_matches_full_recompute(scorer
+                                  , season_df):
+    coefficients, x_scores = get_full_recompute(season_df)
+    for full, incremental in zip(coefficients, scorer.coefficients):
+        pd.testing.assert_series_equal(incremental.sort_index(), full.sort_index()
+                                       , check_names = False, rtol = 1e-9, atol = 1e-9)
+    assert set(scorer.x_scores.index) == set(x_scores.index)
+    np.testing.assert_allclose(scorer.x_scores.loc[x_scores.index].values, x_scores.values
+                               , rtol = 1e-9, atol = 1e-9)
+
+def split_into_days(week_rows
+                    , n_days
+                    , rng):
+    """Splits a week of integer totals into daily rows that sum back to it, leaving out players without games"""
+    days = []
+    remaining = week_rows
+    for day in range(n_days - 1):
+        day_rows = np.floor(remaining * rng.random((len(remaining), 1)))
+        days.append(day_rows)
+        remaining = remaining - day_rows
+    days.append(remaining)
+    return [day_rows[(day_rows != 0).any(axis = 1)] for day_rows in days]
+
+@pytest.fixture(scope = 'module')
+def season_df():
+    season_df, _ = make_synthetic_league(n_players = 120, n_weeks = 8, seed = 1)
+    return season_df.astype(float)
+
+def test_initial_scores_match_full_recompute(season_df):
+    scorer = IncrementalScorer(season_df, n_players = N_PLAYERS)
+    assert_matches_full_recompute(scorer, season_df)
+
+@pytest.mark.parametrize('n_days', [1, 3])
+def test_folding_matches_full_recompute(season_df
+                                        , n_days):
+    rng = np.random.default_rng(n_days)
+    weeks = pd.unique(season_df.index.get_level_values('week'))
+    week_level = season_df.index.get_level_values('week')
+    players = pd.unique(season_df.index.get_level_values('player'))
+
+    initial = season_df[week_level.isin(weeks[0:3])]
+    scorer = IncrementalScorer(initial, n_players = N_PLAYERS)
+    folded = [initial]
+
+    for i, week in enumerate(weeks[3:]):
+        for day, day_rows in enumerate(split_into_days(season_df[week_level == week], n_days, rng)):
+            changed = scorer.fold_rows(day_rows)
+            folded.append(day_rows)
+
+            if day == 0:
+                #the first rows of a week add a zero week for every player
+                touched = set(players)
+            else:
+                touched = set(day_rows.index.get_level_values('player'))
+            assert set(changed) == touched
+
+            assert_matches_full_recompute(scorer, get_reference_df(folded, players, weeks[0:(i + 4)]))
+
+def test_new_player_matches_full_recompute(season_df):
+    weeks = pd.unique(season_df.index.get_level_values('week'))
+    players = pd.unique(season_df.index.get_level_values('player'))
+    scorer = IncrementalScorer(season_df, n_players = N_PLAYERS)
+
+    #a player who starts playing in the last week, on top of a day of games for two existing players
+    new_rows = season_df.loc[[players[0], players[1]]].xs(weeks[-1], level = 'week', drop_level = False) \
+                    .rename(index = {players[1] : 'New Player'})
+    changed = scorer.fold_rows(new_rows)
+    assert set(changed) == {players[0], 'New Player'}
+
+    reference_df = get_reference_df([season_df, new_rows], list(players) + ['New Player'], weeks)
+    assert_matches_full_recompute(scorer, reference_df)
@@ -0,0 +1,116 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import CATEGORIES, make_synthetic_league
+from src.drafting_agents import HAgent, PAgent
+from src.helper_functions import check_team_eligibility
+from src.instrumentation import get_profiler, profiling, stage
+from src.score_cache import get_score_matrix
+from src.simulation import run_draft, run_multiple_seasons
+
+SIMULATION_STAGES = ['sampling', 'aggregation', 'opponent_lookup', 'winner_resolution']
+
+@pytest.fixture(scope = 'module')
+def league():
+    return make_synthetic_league(n_players = 200, n_weeks = 10, seed = 7)
+
+def make_agents(league):
+    season_df, positions = league
+    h_agent = HAgent(season_df, positions)
+    p_agent = PAgent(positions, get_score_matrix(season_df, alpha_weight = 1, beta_weight = 1).get_filled_matrix()
+                     , n_punts = 1)
+    return [h_agent.fresh() if i % 2 == 0 else p_agent.fresh() for i in range(8)]
+
+def test_draft_records_every_pick(league):
+    with profiling() as profiler:
+        teams = run_draft(make_agents(league), 13)
+    assert get_profiler() is None
+
+    picks = profiler.get_events()
+    assert (picks['category'] == 'pick').all()
+    assert list(picks['pick']) == list(range(8 * 13))
+    assert picks.groupby('name').size().to_dict() == {'HAgent' : 4 * 13, 'PAgent' : 4 * 13}
+    assert (picks['duration'] > 0).all()
+
+    #every pick checks the eligibility of its candidates
+    assert (picks['eligibility_checks'] > 0).all()
+    assert picks['eligibility_checks'].sum() == profiler.counters['eligibility_checks']
+
+    summary = profiler.get_pick_summary()
+    assert list(summary.index) == ['HAgent', 'PAgent']
+    assert list(summary['picks']) == [4 * 13, 4 * 13]
+
+def test_season_run_records_its_stages(league):
+    season_df, positions = league
+    teams = run_draft(make_agents(league), 13)
+    with profiling() as profiler:
+        run_multiple_seasons(teams, season_df, CATEGORIES, n_seasons = 30, chunk_size = 10, seed = 0)
+
+    summary = profiler.get_summary()
+    assert list(summary.index) == [('simulation', name) for name in sorted(SIMULATION_STAGES)]
+    assert (summary['count'] == 3).all()
+
+    #stages of each chunk are recorded in the order they run
+    assert list(profiler.get_events()['name']) == SIMULATION_STAGES * 3
+
+def test_eligibility_checks_are_counted():
+    with profiling() as profiler:
+        for i in range(5):
+            check_team_eligibility([['C'], ['PG','SG'], ['SF']])
+    assert profiler.counters['eligibility_checks'] == 5
+
+    #nothing is counted once instrumentation is off
+    check_team_eligibility([['C']])
+    assert profiler.counters['eligibility_checks'] == 5
+
+def test_results_do_not_depend_on_profiling(league):
+    season_df, positions = league
+    teams = run_draft(make_agents(league), 13)
+    results = run_multiple_seasons(teams, season_df, CATEGORIES, n_seasons = 30, seed = 0
+                                   , return_detailed_results = True)
+
+    with profiling():
+        profiled_teams = run_draft(make_agents(league), 13)
+        profiled_results = run_multiple_seasons(profiled_teams, season_df, CATEGORIES, n_seasons = 30, seed = 0
+                                                , return_detailed_results = True)
+
+    assert profiled_teams == teams
+    pd.testing.assert_series_equal(profiled_results[0], results[0])
+    pd.testing.assert_frame_equal(profiled_results[1], results[1])
+
+def test_profilers_nest_and_collect_into_earlier_results():
+    with profiling() as outer:
+        with stage('outer'):
+            with profiling() as inner:
+                with stage('inner'):
+                    pass
+            assert get_profiler() is outer
+        with profiling(outer):
+            with stage('added'):
+                pass
+
+    assert [event['name'] for event in inner.events] == ['inner']
+    assert [event['name'] for event in outer.events] == ['outer', 'added']
+
+    #without a profiler, stages do nothing
+    with stage('ignored'):
+        pass
+    assert len(outer.events) == 2
+
+def test_chrome_trace(league
+                      , tmp_path):
+    with profiling() as profiler:
+        run_draft(make_agents(league), 2)
+    trace_path = str(tmp_path / 'trace.json')
+    profiler.write_chrome_trace(trace_path)
+    with open(trace_path) as f:
+        trace = json.load(f)
+
+    events = trace['traceEvents']
+    assert len(events) == 8 * 2
+    assert all(event['ph'] == 'X' and event['cat'] == 'pick' for event in events)
+    np.testing.assert_allclose([event['dur'] for event in events]
+                               , [event['duration'] * 1e6 for event in profiler.events])
+    assert trace['otherData'] == {'eligibility_checks' : profiler.counters['eligibility_checks']}
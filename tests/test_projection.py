@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('lightgbm')
+
+from src.projection import ProjectionEngine
+
+def test_saved_engine_keeps_training_position_labels(feature_store
+                                                     , tmp_path):
+    matrices = feature_store.get_model_matrices([2007], first_season = 2003)
+    engine = ProjectionEngine.train(matrices, categories = ['pts','no_play'], n_cores = 1
+                                    , feature_store = feature_store)
+    engine.save(str(tmp_path / 'models.json.gz'))
+    players = list(engine.get_projection_inputs(2008).index)
+    projections = engine.project(players, 2008)
+
+    metadata = feature_store.get_metadata().copy()
+    metadata.loc[metadata.index[0], 'pos'] = 'AA'
+    feature_store.set_metadata(metadata)
+
+    loaded = ProjectionEngine.load(str(tmp_path / 'models.json.gz'), feature_store = feature_store)
+    assert loaded.pos_categories == ['C','PG','SF']
+    pd.testing.assert_series_equal(loaded.get_projection_inputs(2008)['pos_n']
+                                   , engine.get_projection_inputs(2008)['pos_n'])
+    pd.testing.assert_frame_equal(loaded.project(players, 2008), projections)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src.score_cache import ScoreCache
+
+@pytest.fixture
+def season_df():
+    season_df, positions = make_synthetic_league(n_players = 80, n_weeks = 6, seed = 4)
+    return season_df.astype(float)
+
+def test_season_label_shares_matrices_between_equal_frames(season_df):
+    cache = ScoreCache()
+    score_matrix = cache.get(season_df, 1, 0, n_players = 40, season = 2023)
+    assert cache.get(season_df.copy(), 1, 0, n_players = 40, season = 2023) is score_matrix
+    assert len(cache) == 1
+
+def test_season_label_does_not_share_between_different_frames(season_df):
+    cache = ScoreCache()
+    score_matrix = cache.get(season_df, 1, 0, n_players = 40, season = 2023)
+
+    other_df, positions = make_synthetic_league(n_players = 80, n_weeks = 6, seed = 5)
+    other_matrix = cache.get(other_df.astype(float), 1, 0, n_players = 40, season = 2023)
+    assert other_matrix is not score_matrix
+    assert not np.allclose(other_matrix.values, score_matrix.values, equal_nan = True)
+
+def test_frame_changed_in_place_gets_a_new_matrix(season_df):
+    cache = ScoreCache()
+    for season in (None, 2023):
+        score_matrix = cache.get(season_df, 1, 0, n_players = 40, season = season)
+        season_df.iloc[0:6, 0] += 10
+        updated_matrix = cache.get(season_df, 1, 0, n_players = 40, season = season)
+        assert updated_matrix is not score_matrix
+        np.testing.assert_array_equal(updated_matrix.values, cache.get(season_df.copy(), 1, 0, n_players = 40).values)
@@ -0,0 +1,40 @@
+import os
+import pandas as pd
+
+from src import season_store
+from src.benchmarks import make_synthetic_league
+from src.season_store import load_season_store, save_season_store
+
+def assert_store_matches(store_path
+                         , season_df
+                         , positions):
+    stored_df, stored_positions = load_season_store(store_path)
+    pd.testing.assert_frame_equal(stored_df, season_df, check_index_type = False)
+    pd.testing.assert_series_equal(stored_positions, positions, check_index_type = False)
+
+def test_store_can_be_rebuilt_in_place(tmp_path):
+    season_df, positions = make_synthetic_league(n_players = 30, n_weeks = 5, seed = 1)
+    store_path = str(tmp_path / 'store' / '2023')
+    save_season_store(store_path, season_df * 2, positions, [])
+    save_season_store(store_path, season_df, positions, [])
+
+    assert_store_matches(store_path, season_df, positions)
+    assert os.listdir(tmp_path / 'store') == ['2023']
+
+def test_losing_the_race_to_another_process_keeps_its_store(tmp_path
+                                                            , monkeypatch):
+    season_df, positions = make_synthetic_league(n_players = 30, n_weeks = 5, seed = 1)
+    store_path = str(tmp_path / '2023')
+    replace = os.replace
+
+    #another process moves its own store into place just before this one does
+    def replace_after_other_process(source
+                                    , destination):
+        monkeypatch.setattr(season_store.os, 'replace', replace)
+        save_season_store(store_path, season_df, positions, [])
+        replace(source, destination)
+    monkeypatch.setattr(season_store.os, 'replace', replace_after_other_process)
+
+    save_season_store(store_path, season_df, positions, [])
+    assert_store_matches(store_path, season_df, positions)
+    assert os.listdir(tmp_path) == ['2023']
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import CATEGORIES, make_synthetic_league
+from src.simulation import run_multiple_seasons, run_seasons_streaming, run_seasons_until_converged
+from src.season_estimates import estimate_multiple_seasons
+
+@pytest.fixture(scope = 'module')
+def league():
+    season_df, positions = make_synthetic_league(n_players = 200, n_weeks = 10, seed = 2)
+    players = pd.unique(season_df.index.get_level_values('player'))
+    teams = {player : i % 12 for i, player in enumerate(players[0:(12 * 13)])}
+    return season_df, teams
+
+@pytest.mark.parametrize('run', [lambda teams, season_df, **kwargs: run_multiple_seasons(teams, season_df, CATEGORIES
+                                                                                         , n_seasons = 50, seed = 0
+                                                                                         , **kwargs)
+                                 , lambda teams, season_df, **kwargs: estimate_multiple_seasons(teams, season_df
+                                                                                                , CATEGORIES
+                                                                                                , **kwargs)])
+def test_team_numbers_can_be_any_labels(league
+                                        , run):
+    season_df, teams = league
+
+    #labels in the same order give the same schedule, so the same results
+    spaced = {player : 10 * team + 5 for player, team in teams.items()}
+    results = run(teams, season_df)
+    spaced_results = run(spaced, season_df)
+    assert list(spaced_results.index) == [10 * team + 5 for team in results.index]
+    np.testing.assert_allclose(spaced_results.values, results.values)
+
+    relabeled = run({player : 20 if team == 3 else team for player, team in teams.items()}, season_df)
+    #simulations only list teams which won at least once
+    assert set(relabeled.index) <= {0, 1, 2, 4, 5, 6, 7, 8, 9, 10, 11, 20}
+    assert relabeled.sum() == pytest.approx(1)
+
+def test_default_schedule_needs_an_even_number_of_teams(league):
+    season_df, teams = league
+    odd_teams = {player : team for player, team in teams.items() if team != 11}
+    with pytest.raises(ValueError, match = 'even number of teams'):
+        run_multiple_seasons(odd_teams, season_df, CATEGORIES, n_seasons = 10)
+
+def test_schedule_needs_team_numbers_in_range(league):
+    season_df, teams = league
+    relabeled = {player : 20 if team == 3 else team for player, team in teams.items()}
+    schedule = np.array([[1, 0, 3, 2, 5, 4, 7, 6, 9, 8, 11, 10]])
+    with pytest.raises(ValueError, match = 'team numbers from 0 to 11'):
+        run_multiple_seasons(relabeled, season_df, CATEGORIES, n_seasons = 10, schedule = schedule)
+
+@pytest.fixture(scope = 'module')
+def lopsided_league(league):
+    """A league where one team has all of the best scorers, and wins nearly every season"""
+    season_df, teams = league
+    players = list(season_df.groupby(level = 'player')['pts'].mean().sort_values(ascending = False).index)
+    lopsided = {player : 0 for player in players[0:13]}
+    lopsided.update({player : 1 + i % 11 for i, player in enumerate(players[13:(12 * 13)])})
+    return season_df, lopsided
+
+@pytest.mark.parametrize('min_seasons', [0, 300])
+def test_streaming_does_not_stop_early_when_one_team_wins_every_season(lopsided_league
+                                                                       , min_seasons):
+    season_df, teams = lopsided_league
+    states = list(run_seasons_streaming(teams, season_df, CATEGORIES, tolerance = 0.01, min_seasons = min_seasons
+                                        , chunk_size = 1, seed = 0))
+    assert states[-1]['converged']
+    assert not any(state['converged'] for state in states[:-1])
+
+    #a team winning every season is only pinned down to within 0.01 after a few hundred seasons
+    assert states[-1]['n_seasons'] >= max(min_seasons, 250)
+
+def test_converged_estimate_matches_run_multiple_seasons(league):
+    season_df, teams = league
+    state = run_seasons_until_converged(teams, season_df, CATEGORIES, tolerance = 0.05, chunk_size = 100, seed = 0)
+    assert state['converged'] and state['n_seasons'] >= 300
+    assert (state['wins_by_teams_se'] * 1.96 <= 0.05).all()
+
+    results, details = run_multiple_seasons(teams, season_df, CATEGORIES, n_seasons = state['n_seasons']
+                                            , chunk_size = 100, seed = 0, return_detailed_results = True)
+    wins_by_teams = state['wins_by_teams']
+    pd.testing.assert_series_equal(wins_by_teams[wins_by_teams > 0], results)
+    pd.testing.assert_frame_equal(state['detailed_results'], details)
+
+def test_streaming_stops_at_max_seasons(league):
+    season_df, teams = league
+    states = list(run_seasons_streaming(teams, season_df, CATEGORIES, tolerance = 0.001, max_seasons = 250
+                                        , chunk_size = 100, seed = 0))
+    assert [state['n_seasons'] for state in states] == [100, 200, 250]
+    assert not states[-1]['converged']
@@ -0,0 +1,64 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.benchmarks import make_synthetic_league
+from src import stat_cube
+from src.simulation import get_season_array
+from src.stat_cube import StatCube, save_stat_cube
+
+@pytest.fixture(scope = 'module')
+def cube(tmp_path_factory):
+    season_data = {season : make_synthetic_league(n_players = 50 + season % 10, n_weeks = 8, seed = season)
+                   for season in (2022, 2023)}
+    cube_path = str(tmp_path_factory.mktemp('cube') / 'cube')
+    save_stat_cube(cube_path, season_data)
+    return StatCube(cube_path), season_data
+
+def test_meta_records_dtype(cube):
+    stat_cube, season_data = cube
+    with open(os.path.join(stat_cube.cube_path, 'meta.json')) as f:
+        assert np.dtype(json.load(f)['dtype']) == np.int16
+    assert stat_cube.dtype == stat_cube.values.dtype == np.int16
+
+def test_season_df_is_a_view_of_the_cube(cube):
+    stat_cube, season_data = cube
+    for season, (season_df, positions) in season_data.items():
+        cube_df = stat_cube.get_season_df(season)
+        assert np.shares_memory(cube_df.values, stat_cube.values)
+        np.testing.assert_array_equal(cube_df.values, season_df.values)
+        assert list(cube_df.index.get_level_values('player')) == list(season_df.index.get_level_values('player'))
+
+def test_season_array_matches_source_frame(cube):
+    stat_cube, season_data = cube
+    season_df, positions = season_data[2023]
+    players = list(pd.unique(season_df.index.get_level_values('player'))[::3]) + ['Nobody']
+    stats = ['fga','pts','tov']
+
+    expected, expected_counts = get_season_array(season_df, players, stats)
+    season_array, counts = get_season_array(stat_cube.get_season_df(2023), players, stats)
+    np.testing.assert_array_equal(season_array, expected)
+    np.testing.assert_array_equal(counts, expected_counts)
+    assert counts[-1] == 0 and not season_array[-1].any()
+    np.testing.assert_array_equal(season_array[0], season_df.loc[players[0], stats].values)
+
+def test_losing_the_race_to_another_process_keeps_its_cube(cube
+                                                           , tmp_path
+                                                           , monkeypatch):
+    source_cube, season_data = cube
+    cube_path = str(tmp_path / 'cube')
+    replace = os.replace
+
+    #another process moves its own cube into place just before this one does
+    def replace_after_other_process(source
+                                    , destination):
+        monkeypatch.setattr(stat_cube.os, 'replace', replace)
+        save_stat_cube(cube_path, season_data)
+        replace(source, destination)
+    monkeypatch.setattr(stat_cube.os, 'replace', replace_after_other_process)
+
+    save_stat_cube(cube_path, season_data)
+    assert os.listdir(tmp_path) == ['cube']
+    np.testing.assert_array_equal(StatCube(cube_path).values, source_cube.values)